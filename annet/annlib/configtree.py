@@ -0,0 +1,65 @@
+"""Compact read-only config trees.
+
+Config trees are built as nested OrderedDicts, which is convenient while the configs
+are generated and filtered, but costs a lot of memory once they are kept around:
+an OrderedDict is twice as large as a dict, every leaf row holds its own empty
+OrderedDict and equal rows of different blocks are separate strings.
+
+compact_tree() turns a tree into a ConfigTree: a read-only dict with interned rows
+in which all the leaves share the same empty node. ConfigTree is a dict, so it keeps
+the Mapping interface the tree consumers (formatters, patching, rulebook logics) use.
+"""
+
+from __future__ import annotations
+
+import sys
+from collections.abc import Iterable, Mapping
+from typing import Any, NoReturn
+
+
+class ConfigTree(dict[str, Any]):
+    __slots__ = ()
+
+    def _readonly(self, *args: Any, **kwargs: Any) -> NoReturn:
+        raise TypeError("%s is read-only" % type(self).__name__)
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    # rows are compared in order, as the OrderedDicts the trees are built from do
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return len(self) == len(other) and list(self.items()) == list(other.items())
+
+    def __ne__(self, other: object) -> bool:
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (_load_tree, (tuple(self.items()),))
+
+    def __repr__(self) -> str:
+        return "%s(%r)" % (type(self).__name__, list(self.items()))
+
+
+EMPTY_TREE = ConfigTree()
+
+
+def _load_tree(items: Iterable[tuple[str, Any]]) -> ConfigTree:
+    tree = ConfigTree(items)
+    return tree if tree else EMPTY_TREE
+
+
+def compact_tree(tree: Mapping[str, Any]) -> ConfigTree:
+    if isinstance(tree, ConfigTree):
+        return tree
+    if not tree:
+        return EMPTY_TREE
+    return ConfigTree(
+        (
+            sys.intern(row) if type(row) is str else row,
+            compact_tree(children) if isinstance(children, Mapping) else children,
+        )
+        for row, children in tree.items()
+    )
@@ -4,6 +4,7 @@ import abc
 import bisect
 import contextlib
 import functools
+import hashlib
 import ipaddress
 import itertools
 import math
@@ -12,6 +13,7 @@ import pathlib
 import re
 import socket
 import sys
+import tempfile
 import textwrap
 import types
 import typing
@@ -293,14 +295,36 @@ def percentile(list_numbers: Sequence[Any], percent: float, key: Callable[[Any],
     return d0 + d1
 
 
-def mako_render(template: str, dedent: bool = False, **kwargs: Any) -> str:
-    @lru_cache(None)
-    def _compile_mako(template: str, dedent: bool) -> mako.template.Template:
-        if dedent:
-            template = textwrap.dedent(template).strip()
+# the directory to keep the compiled templates in, so that they are compiled once per machine
+MAKO_MODULE_DIRECTORY_ENV = "ANN_MAKO_MODULE_DIRECTORY"
+
+
+@lru_cache(None)
+def _compile_mako(template: str, dedent: bool, module_directory: str | None) -> mako.template.Template:
+    if dedent:
+        template = textwrap.dedent(template).strip()
+    if not module_directory:
         return mako.template.Template(template)
+    # mako keeps the modules only for the file templates, so the text is stored in a file named by its hash
+    module_directory = os.path.abspath(os.path.expanduser(module_directory))
+    uri = hashlib.sha256(template.encode()).hexdigest()
+    path = os.path.join(module_directory, uri + ".mako")
+    if not os.path.exists(path):
+        os.makedirs(module_directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=module_directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(template.encode())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return mako.template.Template(filename=path, uri=uri, module_directory=module_directory, input_encoding="utf-8")
+
 
-    ret = _compile_mako(template, dedent).render(**kwargs)
+def mako_render(template: str, dedent: bool = False, **kwargs: Any) -> str:
+    module_directory = os.environ.get(MAKO_MODULE_DIRECTORY_ENV) or None
+    ret = _compile_mako(template, dedent, module_directory).render(**kwargs)
     if dedent:
         ret = ret.strip()
     return typing.cast(str, ret)
@@ -7,7 +7,7 @@ import os
 import sys
 import types
 from collections import OrderedDict as odict
-from collections.abc import Iterator
+from collections.abc import Iterator, Mapping
 from contextlib import contextmanager
 from typing import IO, Any, List, Pattern, cast
 
@@ -17,6 +17,8 @@ import pygments.formatters
 import pygments.lexers.data
 import yaml
 
+from annet.annlib.configtree import ConfigTree
+
 
 LABEL_NEW_PREFIX = "new: "
 
@@ -172,7 +174,7 @@ def print_as_json(data: Any, sort_keys: bool = True, fh: IO[str] = sys.stdout, h
         when sorted as strings (they carry an extra index)
         """
 
-        def __init__(self, orig: odict[str, Any]) -> None:
+        def __init__(self, orig: Mapping[str, Any]) -> None:
             super().__init__((ODictKey(key, index), value) for (index, (key, value)) in enumerate(orig.items()))
 
         @staticmethod
@@ -182,7 +184,7 @@ def print_as_json(data: Any, sort_keys: bool = True, fh: IO[str] = sys.stdout, h
                 data = type(data)((key, self(value)) for (key, value) in data.items())
             elif isinstance(data, (tuple, list)):
                 data = type(data)(self(value) for value in data)
-            if isinstance(data, odict):
+            if isinstance(data, (odict, ConfigTree)):
                 data = UnsortableOdict(data)
             return data
 
@@ -32,6 +32,7 @@ from ..types import Diff, Op, OpType
 from ..vendors import registry_connector
 from .lib import jun_activate, merge_dicts, strip_annotation, uniq
 from .rbparser.ordering import compile_ordering_text
+from .rbparser.syntax import first_literal_token
 from .rulebook.common import call_diff_logic
 from .rulebook.common import default as common_default
 
@@ -233,6 +234,67 @@ PatchRowSortKey: TypeAlias = tuple[
 ]
 
 
+class _OrderRule:
+    """A rule of an ordering rulebook with everything get_order() needs precomputed"""
+
+    __slots__ = (
+        "direct_match",
+        "reverse_match",
+        "direct_chars",
+        "reverse_chars",
+        "tokens",
+        "order_reverse",
+        "is_global",
+        "scope",
+        "split",
+        "children",
+    )
+
+    def __init__(self, attrs: Mapping[str, Any], children: list[_OrderRule]) -> None:
+        self.direct_match = attrs["direct_regexp"].match
+        self.reverse_match = attrs["reverse_regexp"].match
+        # string_similarity() only needs the set of the pattern chars
+        self.direct_chars = frozenset(attrs["direct_regexp"].pattern)
+        self.reverse_chars = frozenset(attrs["reverse_regexp"].pattern)
+        # the first words of the rows the rule can match, None if any row can be matched
+        tokens = (first_literal_token(attrs["direct_regexp"]), first_literal_token(attrs["reverse_regexp"]))
+        self.tokens: frozenset[str] | None = None if None in tokens else frozenset(cast(tuple[str, str], tokens))
+        self.order_reverse: bool = attrs["order_reverse"]
+        self.is_global: bool = attrs["global"]
+        self.scope: list[str] | None = attrs["scope"]
+        self.split: bool = attrs["split"]
+        self.children = children
+
+
+def _compile_order_rules(rb: OrderRulebook) -> list[_OrderRule]:
+    return [_OrderRule(rule["attrs"], _compile_order_rules(rule["children"])) for _, rule in rb]
+
+
+class _CompiledOrdering:
+    def __init__(self, rb: OrderRulebook, vendor: str) -> None:
+        self.rb = rb  # keeps the id of rb from being reused while the ordering is cached
+        self.rules = _compile_order_rules(rb)
+        self.block_exit: str | None = registry_connector.get()[vendor].exit
+        self.orders: dict[tuple[Any, ...], PatchRowSortKey] = {}
+
+
+# the rulebooks are loaded once, the ones extended by Orderer.insert() are not,
+# so the caches are just dropped once they grow too big
+_ORDERINGS_CACHE_SIZE = 256
+_ORDERS_CACHE_SIZE = 65536
+_compiled_orderings: dict[tuple[int, str], _CompiledOrdering] = {}
+
+
+def _compiled_ordering(rb: OrderRulebook, vendor: str) -> _CompiledOrdering:
+    key = (id(rb), vendor)
+    ordering = _compiled_orderings.get(key)
+    if ordering is None or ordering.rb is not rb:
+        if len(_compiled_orderings) >= _ORDERINGS_CACHE_SIZE:
+            _compiled_orderings.clear()
+        ordering = _compiled_orderings[key] = _CompiledOrdering(rb, vendor)
+    return ordering
+
+
 class Orderer:
     def __init__(self, rb: OrderRulebook, vendor: str) -> None:
         self.rb = rb
@@ -258,186 +320,210 @@ class Orderer:
         keys: tuple[tuple[str, ...], ...] = (),  # keys are not present when ordering config
         scope: str | None = None,
     ) -> PatchRowSortKey:
-        block_exit = registry_connector.get()[self.vendor].exit
+        ordering = _compiled_ordering(self.rb, self.vendor)
+        # the same rows are ordered for every device sharing the rulebook
+        cache_key = (row, cmd_direct, keys, scope)
+        order = ordering.orders.get(cache_key)
+        if order is None:
+            if len(ordering.orders) >= _ORDERS_CACHE_SIZE:
+                ordering.orders.clear()
+            order = ordering.orders[cache_key] = _get_order(ordering, row, cmd_direct, keys, scope)
+        return order
 
-        vectors: list[
-            tuple[
-                tuple[
-                    float, ...
-                ],  # weight(=priority) of a vector, shows how well the vector matches the row, best one wins
-                PatchRowSortKey,  # key that will be used to order patch rows
-            ]
-        ] = []
+    def order_config(self, config: dict[str, Any], _path: tuple[str, ...] = ()) -> dict[str, Any]:
+        if self.vendor not in registry_connector.get():
+            return config
+        if not config:
+            return odict()
 
-        # we might have to consider several paths through the rulebook,
-        # so we do it in BFS-style: start from the root and go deeper where possible
-        queue: list[
-            tuple[
-                # prefixes: gradually constructed from scratch
-                tuple[float, ...],  # weights prefix
-                tuple[_PatchRowSortItem, ...],  # vector prefix
-                # suffixes: gradually deconstructed until exhausted
-                tuple[str, ...],  # row suffix
-                tuple[tuple[str, ...], ...],  # keys suffix
-                #
-                OrderRulebook,  # children
-            ]
-        ] = [
-            (
-                (),
-                (),
-                row,
-                keys,
-                self.rb,
-            )
-        ]
+        ret: dict[str, Any] = {}
+        sort_keys: dict[str, PatchRowSortKey] = {}
+
+        reverse_prefix = registry_connector.get()[self.vendor].reverse
+        for row, children in config.items():
+            cmd_direct = not row.startswith(reverse_prefix)
 
-        while queue:
-            weights_prefix, vector_prefix, row_suffix, keys_suffix, children = queue.pop()
+            sort_key = self.get_order(_path + (row,), cmd_direct=cmd_direct)
+            children = self.order_config(children, _path=(*_path, row))
+            ret[row] = children
+            sort_keys[row] = sort_key
 
-            # shared instance that will be stored in the queue several times and mutated simultaneously,
-            # this is done this way to avoid walking over children twice: we do only one pass both collecting children
-            # and filling the queue
-            sub_children: OrderRulebook = []
+        return odict((row, children) for row, children in sorted(ret.items(), key=lambda kv: sort_keys[kv[0]]))
 
-            for rb_idx, (raw_rule, rule) in enumerate(children, start=0):
-                rb_attrs = rule["attrs"]
 
-                key: tuple[str, ...]
-                if not keys_suffix:  # we are either ordering a config or keys are somehow exhausted - not a problem
-                    key = ()
-                else:
-                    key = keys_suffix[0]
-
-                # we reached the end of our command,
-                # submit the results - they will be considered at the end
-                if not row_suffix:
-                    vectors.append(
-                        (
-                            weights_prefix,
-                            (vector_prefix, cmd_direct),
-                        )
-                    )
-                    continue
+def _get_order(
+    ordering: _CompiledOrdering,
+    row: tuple[str, ...],
+    cmd_direct: bool,
+    keys: tuple[tuple[str, ...], ...],
+    scope: str | None,
+) -> PatchRowSortKey:
+    block_exit = ordering.block_exit
 
-                if (rule_scope := rb_attrs["scope"]) is not None and scope not in rule_scope:
-                    continue
+    vectors: list[
+        tuple[
+            tuple[
+                float, ...
+            ],  # weight(=priority) of a vector, shows how well the vector matches the row, best one wins
+            PatchRowSortKey,  # key that will be used to order patch rows
+        ]
+    ] = []
+
+    # we might have to consider several paths through the rulebook,
+    # so we do it in BFS-style: start from the root and go deeper where possible
+    queue: list[
+        tuple[
+            # prefixes: gradually constructed from scratch
+            tuple[float, ...],  # weights prefix
+            tuple[_PatchRowSortItem, ...],  # vector prefix
+            # suffixes: gradually deconstructed until exhausted
+            tuple[str, ...],  # row suffix
+            tuple[tuple[str, ...], ...],  # keys suffix
+            #
+            list[_OrderRule],  # children
+        ]
+    ] = [
+        (
+            (),
+            (),
+            row,
+            keys,
+            ordering.rules,
+        )
+    ]
 
-                row_item = row_suffix[0]
-                direct_matched = bool(rb_attrs["direct_regexp"].match(row_item))
-                reverse_matched = bool(rb_attrs["reverse_regexp"].match(row_item))
-                order_reverse = rb_attrs["order_reverse"]
+    while queue:
+        weights_prefix, vector_prefix, row_suffix, keys_suffix, children = queue.pop()
 
-                # global rules
-                if rule["attrs"]["global"]:
-                    sub_children.append((raw_rule, rule))
+        # we reached the end of our command,
+        # submit the results - they will be considered at the end
+        if not row_suffix:
+            vectors.append(
+                (
+                    weights_prefix,
+                    (vector_prefix, cmd_direct),
+                )
+            )
+            continue
 
-                if not order_reverse and (direct_matched or reverse_matched):
-                    if direct_matched:
-                        weight = string_similarity(row_item, rb_attrs["direct_regexp"].pattern)
-                    else:
-                        # sometimes the same command matched one rule in "direct" direction,
-                        # and the other rule in "reverse" direction; for example 'remove add' on Routeros is both
-                        # a direct command for 'remove' and a reverse command for 'add'; in such case the "direct"
-                        # option should be choosed, so we deprioritize reverse matches by reducing their weight:
-                        weight = string_similarity(row_item, rb_attrs["reverse_regexp"].pattern) * 0.5
-
-                    if rule["attrs"]["split"]:
-                        # note: create new list so that later we do not mutate previous instances
-                        sub_children = rule["children"].copy()
-                    else:
-                        sub_children.extend(rule["children"])
-
-                    is_final_cmd_item = len(row_suffix) == 1
-                    queue.append(
-                        (
-                            weights_prefix + (weight,),
-                            vector_prefix + ((rb_idx * (-1 if is_final_cmd_item and not cmd_direct else +1), key),),
-                            row_suffix[1:],
-                            keys_suffix[1:],
-                            sub_children,  # note: mutable copy
-                        )
-                    )
+        key: tuple[str, ...]
+        if not keys_suffix:  # we are either ordering a config or keys are somehow exhausted - not a problem
+            key = ()
+        else:
+            key = keys_suffix[0]
+
+        row_item = row_suffix[0]
+        is_final_cmd_item = len(row_suffix) == 1
+        # the rules which can't match the row only matter for the block exit,
+        # so the others are skipped by the first word of the row
+        row_token = None
+        if row_item != block_exit and (row_tokens := row_item.split(maxsplit=1)):
+            row_token = row_tokens[0]
+
+        # shared instance that will be stored in the queue several times and mutated simultaneously,
+        # this is done this way to avoid walking over children twice: we do only one pass both collecting children
+        # and filling the queue
+        sub_children: list[_OrderRule] = []
+
+        for rb_idx, rule in enumerate(children, start=0):
+            if (rule_scope := rule.scope) is not None and scope not in rule_scope:
+                continue
 
-                elif order_reverse and not cmd_direct and direct_matched:
-                    weight = string_similarity(row_item, rb_attrs["direct_regexp"].pattern)
-                    sub_children[:] = []
-                    queue.append(
-                        (
-                            weights_prefix + (weight,),
-                            vector_prefix + ((+rb_idx, key),),
-                            row_suffix[1:],
-                            keys_suffix[1:],
-                            sub_children,  # note: mutable copy
-                        )
-                    )
+            # global rules
+            if rule.is_global:
+                sub_children.append(rule)
+            elif row_token is not None and rule.tokens is not None and row_token not in rule.tokens:
+                continue
 
-                elif block_exit and block_exit == row_item:
-                    sub_children[:] = []
-                    vectors.append(
-                        (
-                            weights_prefix + (float("inf"),),
-                            (vector_prefix + ((float("inf"), ()),), cmd_direct),
-                        )
-                    )
+            direct_matched = rule.direct_match(row_item) is not None
+            reverse_matched = rule.reverse_match(row_item) is not None
+            order_reverse = rule.order_reverse
 
+            if not order_reverse and (direct_matched or reverse_matched):
+                if direct_matched:
+                    weight = len(rule.direct_chars.intersection(row_item)) / len(row_item)
                 else:
-                    pass
+                    # sometimes the same command matched one rule in "direct" direction,
+                    # and the other rule in "reverse" direction; for example 'remove add' on Routeros is both
+                    # a direct command for 'remove' and a reverse command for 'add'; in such case the "direct"
+                    # option should be choosed, so we deprioritize reverse matches by reducing their weight:
+                    weight = len(rule.reverse_chars.intersection(row_item)) / len(row_item) * 0.5
+
+                if rule.split:
+                    # note: create new list so that later we do not mutate previous instances
+                    sub_children = rule.children.copy()
+                else:
+                    sub_children.extend(rule.children)
 
-            # we reached a leaf - submit results
-            if not sub_children:
-                vectors.append(
+                queue.append(
                     (
-                        weights_prefix,
-                        (vector_prefix, cmd_direct),
+                        weights_prefix + (weight,),
+                        vector_prefix + ((rb_idx * (-1 if is_final_cmd_item and not cmd_direct else +1), key),),
+                        row_suffix[1:],
+                        keys_suffix[1:],
+                        sub_children,  # note: mutable copy
                     )
                 )
 
-        if not vectors:
-            # no match -> zero index
-            return (
-                (
+            elif order_reverse and not cmd_direct and direct_matched:
+                weight = len(rule.direct_chars.intersection(row_item)) / len(row_item)
+                sub_children[:] = []
+                queue.append(
                     (
-                        0,  # position
-                        (),  # key
-                    ),
-                ),
-                cmd_direct,
-            )
+                        weights_prefix + (weight,),
+                        vector_prefix + ((+rb_idx, key),),
+                        row_suffix[1:],
+                        keys_suffix[1:],
+                        sub_children,  # note: mutable copy
+                    )
+                )
+
+            elif block_exit and block_exit == row_item:
+                sub_children[:] = []
+                vectors.append(
+                    (
+                        weights_prefix + (float("inf"),),
+                        (vector_prefix + ((float("inf"), ()),), cmd_direct),
+                    )
+                )
 
-        vectors.sort(
-            key=lambda x: (
-                -len(x[1][0]),  # pick vectors with most precise position
-                reversed_sort_by(x[0]),  # then amongst them ones with the biggest weight
-                x[1],  # if there are multiple options - pick the one with smallest index
+            else:
+                pass
+
+        # we reached a leaf - submit results
+        if not sub_children:
+            vectors.append(
+                (
+                    weights_prefix,
+                    (vector_prefix, cmd_direct),
+                )
             )
-        )
 
+    if not vectors:
+        # no match -> zero index
         return (
-            vectors[0][  # the coolest vector - the one we are looking for!
-                1
-            ]  # pass only sort key, weights are no longer important
+            (
+                (
+                    0,  # position
+                    (),  # key
+                ),
+            ),
+            cmd_direct,
         )
 
-    def order_config(self, config: dict[str, Any], _path: tuple[str, ...] = ()) -> dict[str, Any]:
-        if self.vendor not in registry_connector.get():
-            return config
-        if not config:
-            return odict()
-
-        ret: dict[str, Any] = {}
-        sort_keys: dict[str, PatchRowSortKey] = {}
-
-        reverse_prefix = registry_connector.get()[self.vendor].reverse
-        for row, children in config.items():
-            cmd_direct = not row.startswith(reverse_prefix)
-
-            sort_key = self.get_order(_path + (row,), cmd_direct=cmd_direct)
-            children = self.order_config(children, _path=(*_path, row))
-            ret[row] = children
-            sort_keys[row] = sort_key
+    vectors.sort(
+        key=lambda x: (
+            -len(x[1][0]),  # pick vectors with most precise position
+            reversed_sort_by(x[0]),  # then amongst them ones with the biggest weight
+            x[1],  # if there are multiple options - pick the one with smallest index
+        )
+    )
 
-        return odict((row, children) for row, children in sorted(ret.items(), key=lambda kv: sort_keys[kv[0]]))
+    return (
+        vectors[0][  # the coolest vector - the one we are looking for!
+            1
+        ]  # pass only sort key, weights are no longer important
+    )
 
 
 # =====
@@ -533,15 +619,14 @@ def strip_unchanged(diff: Diff) -> Diff:
 
 
 def make_diff(
-    old: MutableMapping[str, Any],
-    new: MutableMapping[str, Any],
+    old: Mapping[str, Any],
+    new: Mapping[str, Any],
     rb: Mapping[str, Any],
     acl_rules_list: list[Rules | None],
 ) -> Diff:
-    # do not let the logic code modify the config
-    old = copy.deepcopy(old)
-    new = copy.deepcopy(new)
-    diff_pre = apply_diff_rb(old, new, rb)
+    # the rows not matching the rulebook are left out of pruned copies sharing the untouched subtrees,
+    # so the diff logics must not modify the config
+    diff_pre, old, new = prune_diff_rb(old, new, rb)
     # old/new/diff_pre are OrderedDicts at runtime; call_diff_logic returns
     # rulebook.common.DiffItem tuples which are structurally the annet.types.Diff shape.
     diff: Diff = cast(
@@ -581,6 +666,54 @@ def apply_diff_rb(
     return diff_pre
 
 
+def prune_diff_rb(
+    old: Mapping[str, Any], new: Mapping[str, Any], rb: Mapping[str, Any]
+) -> tuple[dict[str, Any], MutableMapping[str, Any], MutableMapping[str, Any]]:
+    """Same as apply_diff_rb() but leaves old and new intact
+
+    Returns diff pre along with old and new without the rows not matching the rulebook.
+    A subtree without such rows is returned as is rather than copied.
+    """
+    diff_pre: dict[str, Any] = odict()
+    pruned_children: dict[str, tuple[MutableMapping[str, Any], MutableMapping[str, Any]]] = {}
+    old_pruned = new_pruned = False
+    for row in uniq(old, new):
+        match, children_rules = _match_row_to_rules(row, rb["patching"])
+        if match:
+            old_children = old.get(row, odict())
+            new_children = new.get(row, odict())
+            subtree, old_children_pruned, new_children_pruned = prune_diff_rb(
+                old_children,
+                new_children,
+                rb={"patching": children_rules},  # only the part related to patching rules is needed
+            )
+            diff_pre[row] = {"match": match, "subtree": subtree}
+            pruned_children[row] = (old_children_pruned, new_children_pruned)
+            old_pruned |= old_children_pruned is not old_children
+            new_pruned |= new_children_pruned is not new_children
+        else:
+            old_pruned |= row in old
+            new_pruned |= row in new
+    # each side keeps its own order of rows, so that base_diff still sees the moved ones
+    return (
+        diff_pre,
+        _pruned(old, pruned_children, 0) if old_pruned else cast(MutableMapping[str, Any], old),
+        _pruned(new, pruned_children, 1) if new_pruned else cast(MutableMapping[str, Any], new),
+    )
+
+
+def _pruned(
+    tree: Mapping[str, Any],
+    pruned_children: Mapping[str, tuple[MutableMapping[str, Any], MutableMapping[str, Any]]],
+    side: int,
+) -> MutableMapping[str, Any]:
+    ret: MutableMapping[str, Any] = odict()
+    for row in tree:
+        if row in pruned_children:
+            ret[row] = pruned_children[row][side]
+    return ret
+
+
 def filter_rows_by_rulebook_selector(
     config: Config, rb: dict[str, Any] | None, selector: str
 ) -> set[tuple[str, ...]] | None:
@@ -986,10 +1119,13 @@ def _best_matches(matches_with_metric: list[tuple[_AclMetric, _AclMatchItem]]) -
 
 
 def match_row_to_acl(row: str, rules: Rules, exclusive: bool = False) -> tuple[_AclMatch | None, Rules | None]:
-    matches_with_metric = _find_acl_matches(row, rules)
+    matches_with_metric, groups = _find_acl_matches(row, rules)
     if matches_with_metric:
         matches = [item for _metric, item in matches_with_metric]
-        match, children_rules = _select_match(matches, rules)
+        # the attrs of the rules are shared, only the groups of this row are set in the copy
+        match, children_rules = _select_match(matches, rules, copy_attrs=dict)
+        if match is not None:
+            match["attrs"]["match"] = groups[id(matches[0][0][0])]
         # cant_delete and exclusivity must only consider rules that matched the
         # row equally well (same %prio and same string_similarity).  Otherwise
         # a generic catch-all like `diffserv domain *` would drop the
@@ -1034,14 +1170,25 @@ def _match_row_to_rules(row: str, rules: Rules) -> tuple[_AclMatch | None, Rules
     return None, None
 
 
-def _find_acl_matches(row: str, rules: Rules) -> list[tuple[_AclMetric, _AclMatchItem]]:
+def _find_acl_matches(
+    row: str, rules: Rules
+) -> tuple[list[tuple[_AclMetric, _AclMatchItem]], dict[int, dict[str, str | Any]]]:
+    """Find the rules matching the row directly or in the reverse form
+
+    Returns the matches along with the named groups of every matched rule by its id.
+    When a rule matched both forms the groups of the reverse one win.
+    """
     res: list[tuple[_AclMetric, _AclMatchItem]] = []
+    groups: dict[int, dict[str, str | Any]] = {}
+    # NOCDEV-5940 Junipers have a special "inactive:" marker, such rows can't be looked up by the first word
+    lookup = row == jun_activate(row)
     for regexp_key in ["direct_regexp", "reverse_regexp"]:
-        for (_, rule), is_global in _rules_local_global(rules):
+        index = _rules_index(rules, regexp_key)
+        for _, rule, is_global in index.candidates(row) if lookup else index.all:
             row_to_match = _normalize_row_for_acl(row, rule)
             match = rule["attrs"][regexp_key].match(row_to_match)
             if match:
-                rule["attrs"]["match"] = match.groupdict()
+                groups[id(rule)] = match.groupdict()
                 # FIXME: the ignore type is not used at all right now, but it does show up in ACLs sometimes.
                 # The problem is that ACLs get merged, and ignores break everything. We need to figure out what to do.
                 # At the moment ignore acl only works in filter-acl, since that one is self-contained and is applied
@@ -1066,12 +1213,12 @@ def _find_acl_matches(row: str, rules: Rules) -> list[tuple[_AclMetric, _AclMatc
     res.sort(key=operator.itemgetter(0), reverse=True)
     # Return (metric, item) pairs so callers can tell apart best matches from
     # less specific ones (see `match_row_to_acl` / `_aggregate_cant_delete`).
-    return res
+    return res, groups
 
 
 def _find_rules_matches(row: str, rules: Rules) -> list[_AclMatchItem]:
     matches: list[tuple[tuple[_AclRule, bool], _AclMatch, float]] = []
-    for (raw_rule, rule), is_global in _rules_local_global(rules):
+    for raw_rule, rule, is_global in _rules_index(rules).candidates(row):
         if match := rule["attrs"]["regexp"].match(row):
             if rule["type"] == "ignore":
                 return []
@@ -1087,33 +1234,96 @@ def _find_rules_matches(row: str, rules: Rules) -> list[_AclMatchItem]:
     return [(item[0], item[1]) for item in matches]
 
 
-def _select_match(matches: list[_AclMatchItem], rules: Rules) -> tuple[_AclMatch | None, Rules | None]:
+class _RulesIndex:
+    """Rules of a rulebook level grouped by the first word of the rows they can match.
+
+    Rules without a fixed first word are tried for every row. The candidates keep the order
+    of _rules_local_global(), so the matching is the same as trying all the rules in turn.
+    """
+
+    def __init__(self, rules: Rules, regexp_key: str = "regexp") -> None:
+        self.rules = rules  # keeps the id of rules from being reused while the index is cached
+        self.all: list[tuple[str, _AclRule, bool]] = []
+        by_token: dict[str, list[tuple[int, str, _AclRule, bool]]] = defaultdict(list)
+        any_token: list[tuple[int, str, _AclRule, bool]] = []
+        for position, ((raw_rule, rule), is_global) in enumerate(_rules_local_global(rules)):
+            item = (position, raw_rule, rule, is_global)
+            self.all.append(item[1:])
+            if (token := first_literal_token(rule["attrs"][regexp_key])) is not None:
+                by_token[token].append(item)
+            else:
+                any_token.append(item)
+        self.any_token: list[tuple[str, _AclRule, bool]] = [item[1:] for item in any_token]
+        # positions are unique, so the rules themselves are never compared
+        self.by_token: dict[str, list[tuple[str, _AclRule, bool]]] = {
+            token: [item[1:] for item in sorted(items + any_token)] for token, items in by_token.items()
+        }
+
+    def candidates(self, row: str) -> list[tuple[str, _AclRule, bool]]:
+        tokens = row.split(maxsplit=1)
+        if tokens and (candidates := self.by_token.get(tokens[0])) is not None:
+            return candidates
+        return self.any_token
+
+
+# the levels of the rulebooks and the children rules merged from them are built once,
+# but the ad hoc ones are not, so the caches are just dropped once they grow too big
+_RULES_CACHE_SIZE = 4096
+_rules_indexes: dict[tuple[int, str], _RulesIndex] = {}
+_merged_children_rules: dict[tuple[int, ...], tuple[tuple[Any, ...], Rules]] = {}
+
+
+def _rules_index(rules: Rules, regexp_key: str = "regexp") -> _RulesIndex:
+    key = (id(rules), regexp_key)
+    index = _rules_indexes.get(key)
+    if index is None or index.rules is not rules:
+        if len(_rules_indexes) >= _RULES_CACHE_SIZE:
+            _rules_indexes.clear()
+        index = _rules_indexes[key] = _RulesIndex(rules, regexp_key)
+    return index
+
+
+def _select_match(
+    matches: list[_AclMatchItem],
+    rules: Rules,
+    copy_attrs: Callable[[dict[str, Any]], dict[str, Any]] = copy.deepcopy,
+) -> tuple[_AclMatch | None, Rules | None]:
     ((f_rule, is_f_cr_allowed), f_other) = matches[0]  # f == first
     if f_rule["type"] == "ignore":
         # At the moment this branch is only reachable from filter-acl
         return (None, None)
 
-    # Merge all the children that matched
+    children_rules = _children_rules(matches if is_f_cr_allowed else [], rules)
+
+    match = {"attrs": copy_attrs(f_rule["attrs"])}
+    match.update(f_other)
+
+    return match, children_rules
+
+
+def _children_rules(matches: list[_AclMatchItem], rules: Rules) -> Rules:
+    """Merge the children of the matched rules, the result is shared by the rows matching the same rules"""
+    sources = tuple(rule for (rule, is_cr_allowed), _ in matches if is_cr_allowed) + (rules["global"],)
+    key = tuple(map(id, sources))
+    if (cached := _merged_children_rules.get(key)) is not None and all(map(operator.is_, cached[0], sources)):
+        return cached[1]
+
     local_children: dict[Any, Any] = odict()
     global_children: dict[Any, Any] = odict()
-    if is_f_cr_allowed:
-        for rule, is_cr_allowed in map(operator.itemgetter(0), matches):
-            if is_cr_allowed:
-                local_children = merge_dicts(local_children, rule["children"]["local"])
-                # optional break on is_cr_allowed==False?
-                global_children = merge_dicts(global_children, rule["children"]["global"])
-
+    for rule in sources[:-1]:
+        local_children = merge_dicts(local_children, rule["children"]["local"])
+        # optional break on is_cr_allowed==False?
+        global_children = merge_dicts(global_children, rule["children"]["global"])
     global_children = merge_dicts(global_children, rules["global"])
 
     children_rules = {
         "local": local_children,
         "global": global_children,
     }
-
-    match = {"attrs": copy.deepcopy(f_rule["attrs"])}
-    match.update(f_other)
-
-    return match, children_rules
+    if len(_merged_children_rules) >= _RULES_CACHE_SIZE:
+        _merged_children_rules.clear()
+    _merged_children_rules[key] = (sources, children_rules)
+    return children_rules
 
 
 def _rules_local_global(rules: Rules) -> Iterator[tuple[tuple[str, _AclRule], bool]]:
@@ -44,7 +44,8 @@ class MakeMessageMatcher:
             regexp = re.compile(self.__text[1:-1].strip(), flags=re.I)
             self._fn: Callable[[str], re.Match[str] | bool | None] = regexp.match
         else:
-            self._fn = lambda arg: _simplify_text(self.__text) in _simplify_text(arg)
+            # a partial, not a lambda, so that the compiled rulebooks can be pickled
+            self._fn = functools.partial(_contains_text, self.__text)
 
     @property
     def text(self) -> str:
@@ -70,3 +71,7 @@ class MakeMessageMatcher:
 @functools.lru_cache()
 def _simplify_text(text: str) -> str:
     return re.sub(r"\s", "", text).lower()
+
+
+def _contains_text(text: str, intext: str) -> bool:
+    return _simplify_text(text) in _simplify_text(intext)
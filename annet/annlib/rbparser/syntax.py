@@ -136,6 +136,46 @@ def compile_row_regexp(row: str, flags: int = 0) -> re.Pattern[str]:
     return re.compile("^" + row, flags=flags)
 
 
+# a regexp starting with a literal word only matches the rows starting with that word
+_FIRST_TOKEN_RE = re.compile(r"\^([\w-]+)(?:\\s\+|\(\?:\\s\|\$\))")
+
+
+def _has_top_level_alternation(pattern: str) -> bool:
+    depth = 0
+    idx = 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        if char == "\\":
+            idx += 1
+        elif char == "[":
+            # skip the class, a ] right after [ or [^ is a literal one
+            idx += 2 if pattern.startswith("[^", idx) else 1
+            if pattern.startswith("]", idx):
+                idx += 1
+            while idx < len(pattern) and pattern[idx] != "]":
+                idx += 2 if pattern[idx] == "\\" else 1
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+        idx += 1
+    return False
+
+
+def first_literal_token(regexp: re.Pattern[str]) -> str | None:
+    """The first word of all the rows a row regexp can match or None if it is not fixed"""
+    if regexp.flags & re.IGNORECASE:
+        return None
+    # ^foo\s+bar|baz also matches the rows starting with baz
+    if _has_top_level_alternation(regexp.pattern):
+        return None
+    if match := _FIRST_TOKEN_RE.match(regexp.pattern):
+        return match.group(1)
+    return None
+
+
 # =====
 def _split_rows(text: str) -> Iterator[str]:
     for row in re.split(r"\n(?!\s*%(?!context))", text):
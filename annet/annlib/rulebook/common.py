@@ -300,6 +300,8 @@ def call_diff_logic(
     attributes set in the rulebook and call each logic in turn, then
     stitch the results back together in the order of the commands in old and new, preferring
     old (i.e. removals come first)
+
+    The logics get the subtrees of old and new as is, so they must not modify them
     """
     diff_logics: odict[typing.Any, typing.Any] = odict()
     for row in old:
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import abc
+import hashlib
 import os
 import re
 import sys
@@ -36,12 +37,14 @@ from annet import gen as ann_gen
 from annet.annlib import jsontools
 from annet.annlib.netdev.views.hardware import HardwareView
 from annet.annlib.types import GeneratorType
+from annet.config_cache import ParsedConfigCache, parse_config
 from annet.deploy import DeployDriver, Fetcher
 from annet.diff import file_differ_connector
 from annet.filtering import Filterer
 from annet.hardware import hardware_connector
 from annet.output import format_file_diff, output_driver_connector, print_err_label
 from annet.parallel import Parallel, TaskResult
+from annet.perf_report import GeneratorPerfReport, print_stages, timed_stage
 from annet.reference import RefTracker
 from annet.rulebook import deploying
 from annet.storage import Device, Storage, get_storage
@@ -84,17 +87,22 @@ def _diff_and_patch(
     ref_track: RefTracker | None = None,
     do_commit: bool = True,
     rb: Any = None,
+    stages: dict[str, float] | None = None,
 ) -> tuple[Diff, patching.PatchTree]:
     if rb is None:
         rb = rulebook.get_rulebook(device.hw)
     # [NOCDEV-5532] Pass only the config parts relevant to the logic into the diff
     if acl_rules is not None:
-        old = patching.apply_acl(old, acl_rules)
-        new = patching.apply_acl(new, acl_rules, with_annotations=add_comments)
-
-    diff_tree = patching.make_diff(old, new, rb, [acl_rules, filter_acl_rules])
-    pre = patching.make_pre(diff_tree)
-    patch_tree = patch_from_pre(pre, device.hw, rb, add_comments, ref_track, do_commit)
+        with timed_stage(stages, "diff_acl"):
+            old = patching.apply_acl(old, acl_rules)
+            new = patching.apply_acl(new, acl_rules, with_annotations=add_comments)
+
+    with timed_stage(stages, "make_diff"):
+        diff_tree = patching.make_diff(old, new, rb, [acl_rules, filter_acl_rules])
+    with timed_stage(stages, "make_pre"):
+        pre = patching.make_pre(diff_tree)
+    with timed_stage(stages, "make_patch"):
+        patch_tree = patch_from_pre(pre, device.hw, rb, add_comments, ref_track, do_commit)
     diff_tree = patching.strip_unchanged(diff_tree)
 
     return (diff_tree, patch_tree)
@@ -139,15 +147,16 @@ def _read_old_new_hw(
         hw = HardwareView(args.hw, "")
     else:
         hw = args.hw
+    cache = ParsedConfigCache(args.config_cache) if args.config_cache else None
 
     try:
-        old, old_hw, old_score = _parse_device_config(old_config, hw)
+        old, old_hw, old_score = _parse_device_config(old_config, hw, cache)
     except tabparser.ParserError:
         _logger.exception("Parser error: %r", old_path)
         raise
 
     try:
-        new, new_hw, new_score = _parse_device_config(new_config, hw)
+        new, new_hw, new_score = _parse_device_config(new_config, hw, cache)
     except tabparser.ParserError:
         _logger.exception("Parser error: %r", new_path)
         raise
@@ -191,17 +200,16 @@ def _read_old_new_cfgdumps(args: cli_args.FileInputOptions) -> Iterator[tuple[st
         yield (old_path_name, new_path_name)
 
 
-def _parse_device_config(text: str, hw: HardwareView) -> tuple[Any, HardwareView, float]:
+def _parse_device_config(
+    text: str, hw: HardwareView, cache: ParsedConfigCache | None = None
+) -> tuple[Any, HardwareView, float]:
     score: float = 1
     vendor_registry = registry_connector.get()
 
     if not hw:
         hw, score = guess_hw(text)
 
-    config = tabparser.parse_to_tree(
-        text=text,
-        splitter=vendor_registry.match(hw).make_formatter().split,
-    )
+    config = parse_config(text, vendor_registry.match(hw).make_formatter(), cache)
 
     return config, hw, score
 
@@ -279,6 +287,23 @@ class PoolProgressLogger:
         return task_result
 
 
+class PoolRulebookPreloader:
+    """Compiles rulebooks of all hardware of a run before workers take tasks"""
+
+    def __init__(self, devices: Iterable[Device]):
+        self.hws = list(dict.fromkeys(device.hw for device in devices))
+
+    def __call__(self, pool: Parallel) -> None:
+        for hw in self.hws:
+            rulebook.get_rulebook(hw)
+
+
+def _add_perf_report(pool: Parallel, args: cli_args.GenOptions) -> None:
+    if args.profile_report:
+        report = GeneratorPerfReport(args.profile_report)
+        pool.add_callback(report).add_finalizer(report.finish)
+
+
 def log_host_progress_cb(pool: Parallel, task_result: TaskResult) -> None:
     warnings.warn(
         "log_host_progress_cb is deprecated, use PoolProgressLogger",
@@ -299,14 +324,24 @@ def log_host_progress_cb(pool: Parallel, task_result: TaskResult) -> None:
 # =====
 def gen(args: cli_args.ShowGenOptions, loader: ann_gen.Loader) -> tuple[Mapping[Any, Any], Mapping[Any, BaseException]]:
     """Generate the config for the devices"""
+    return _gen_pool(args, loader).run(loader.device_ids, args.tolerate_fails, args.strict_exit_code)
+
+
+def igen(args: cli_args.ShowGenOptions, loader: ann_gen.Loader) -> Iterator[TaskResult]:
+    """Generate the config for the devices, yielding the results as soon as the devices are done"""
+    return _gen_pool(args, loader).irun(loader.device_ids, args.tolerate_fails)
+
+
+def _gen_pool(args: cli_args.ShowGenOptions, loader: ann_gen.Loader) -> Parallel:
     stdin = args.stdin(filter_acl=args.filter_acl, config=None)
 
     filterer = filtering.filterer_connector.get()
     pool = Parallel(ann_gen.worker, args, stdin, loader, filterer).tune_args(args)
+    pool.add_preload(PoolRulebookPreloader(loader.devices))
+    _add_perf_report(pool, args)
     if args.show_hosts_progress:
         pool.add_callback(PoolProgressLogger(loader.device_fqdns))
-
-    return pool.run(loader.device_ids, args.tolerate_fails, args.strict_exit_code)
+    return pool
 
 
 # =====
@@ -316,6 +351,15 @@ def patch(
     args: cli_args.ShowPatchOptions, loader: ann_gen.Loader
 ) -> tuple[Mapping[Any, Any], Mapping[Any, BaseException]]:
     """Generate the patch for the devices"""
+    return _patch_pool(args, loader).run(loader.device_ids, args.tolerate_fails, args.strict_exit_code)
+
+
+def ipatch(args: cli_args.ShowPatchOptions, loader: ann_gen.Loader) -> Iterator[TaskResult]:
+    """Generate the patch for the devices, yielding the results as soon as the devices are done"""
+    return _patch_pool(args, loader).irun(loader.device_ids, args.tolerate_fails)
+
+
+def _patch_pool(args: cli_args.ShowPatchOptions, loader: ann_gen.Loader) -> Parallel:
     current_state = annet.lib.do_async(
         ann_gen.get_current_state(
             args.config,
@@ -330,9 +374,11 @@ def patch(
 
     filterer = filtering.filterer_connector.get()
     pool = Parallel(_patch_worker, args, stdin, loader, filterer, current_state).tune_args(args)
+    pool.add_preload(PoolRulebookPreloader(loader.devices))
+    _add_perf_report(pool, args)
     if args.show_hosts_progress:
         pool.add_callback(PoolProgressLogger(loader.device_fqdns))
-    return pool.run(loader.device_ids, args.tolerate_fails, args.strict_exit_code)
+    return pool
 
 
 def _patch_worker(
@@ -399,9 +445,13 @@ def res_diff_patch(
         if res.old_json_fragment_files or new_json_fragment_files:
             yield res, None, None
         elif old is not None:
+            diff_stages: dict[str, float] = {}
             (diff_tree, patch_tree) = _diff_and_patch(
-                device, old, new, acl_rules, res.filter_acl_rules, args.add_comments
+                device, old, new, acl_rules, res.filter_acl_rules, args.add_comments, stages=diff_stages
             )
+            res.stages.update(diff_stages)
+            if args.profile:
+                print_stages(device.hostname, diff_stages)
             yield res, diff_tree, patch_tree
 
 
@@ -409,6 +459,18 @@ def diff(
     args: cli_args.DiffOptions, loader: ann_gen.Loader, device_ids: List[Any]
 ) -> tuple[Mapping[Device, Union[Diff, PCDiff]], Mapping[Device, Exception]]:
     """Generate the diff for the devices"""
+    return cast(
+        "tuple[Mapping[Device, Union[Diff, PCDiff]], Mapping[Device, Exception]]",
+        _diff_pool(args, loader, device_ids).run(device_ids, args.tolerate_fails, args.strict_exit_code),
+    )
+
+
+def idiff(args: cli_args.DiffOptions, loader: ann_gen.Loader, device_ids: List[Any]) -> Iterator[TaskResult]:
+    """Generate the diff for the devices, yielding the results as soon as the devices are done"""
+    return _diff_pool(args, loader, device_ids).irun(device_ids, args.tolerate_fails)
+
+
+def _diff_pool(args: cli_args.DiffOptions, loader: ann_gen.Loader, device_ids: List[Any]) -> Parallel:
     devices = [device for device in loader.devices if device.id in device_ids]
     current_state = annet.lib.do_async(
         ann_gen.get_current_state(
@@ -424,14 +486,12 @@ def diff(
 
     filterer = filtering.filterer_connector.get()
     pool = Parallel(ann_diff.worker, args, stdin, loader, filterer, current_state).tune_args(args)
+    pool.add_preload(PoolRulebookPreloader(devices))
+    _add_perf_report(pool, args)
     if args.show_hosts_progress:
         fqdns = {k: v for k, v in loader.device_fqdns.items() if k in device_ids}
         pool.add_callback(PoolProgressLogger(fqdns))
-
-    return cast(
-        "tuple[Mapping[Device, Union[Diff, PCDiff]], Mapping[Device, Exception]]",
-        pool.run(device_ids, args.tolerate_fails, args.strict_exit_code),
-    )
+    return pool
 
 
 def collapse_texts(texts: Mapping[str, str | Generator[str, None, None]]) -> Mapping[Tuple[str, ...], str]:
@@ -440,22 +500,56 @@ def collapse_texts(texts: Mapping[str, str | Generator[str, None, None]]) -> Map
     :param texts:
     :return: a dict with several hostnames in the key.
     """
-    diffs_with_orig: dict[str, tuple[str, list[str]]] = {}
+    collapser = TextCollapser()
     for key, value in texts.items():
+        collapser.add(key, value)
+    return collapser.collapse()
+
+
+class TextCollapser:
+    """Incremental collapse_texts(), keeps a single copy of equal texts"""
+
+    def __init__(self) -> None:
+        self._texts: dict[str, str] = {}
+        self._labels: dict[str, tuple[bytes, str]] = {}
+
+    def add(self, label: str, value: str | Iterable[str]) -> None:
         if isinstance(value, str):
-            diffs_with_orig[key] = (value, value.splitlines())
+            text, lines = value, value.splitlines()
         else:
             lines = list(value)
-            diffs_with_orig[key] = ("".join(lines), lines)
-
-    res: dict[tuple[str, ...], str] = {}
-    for _, collapsed_diff_iter in groupby(
-        sorted(diffs_with_orig.items(), key=lambda x: (x[0], x[1][1])), key=lambda x: x[1][1]
-    ):
-        collapsed_diff = list(collapsed_diff_iter)
-        res[tuple(x[0] for x in collapsed_diff)] = collapsed_diff[0][1][0]
-
-    return res
+            text = "".join(lines)
+        digest = hashlib.sha256()
+        for line in lines:
+            encoded = line.encode()
+            digest.update(b"%d:" % len(encoded))
+            digest.update(encoded)
+        self._labels[label] = (digest.digest(), self._texts.setdefault(text, text))
+
+    def collapse(self) -> Mapping[Tuple[str, ...], str]:
+        """Group the labels having the same lines next to each other in the labels order"""
+        res: dict[tuple[str, ...], str] = {}
+        for _, collapsed_iter in groupby(sorted(self._labels.items()), key=lambda x: x[1][0]):
+            collapsed = list(collapsed_iter)
+            res[tuple(label for label, _ in collapsed)] = collapsed[0][1][1]
+        return res
+
+
+class ResultsStream:
+    """Passes the devices results through as they arrive, only the failures are kept"""
+
+    def __init__(self, task_results: Iterable[TaskResult]) -> None:
+        self._task_results = task_results
+        self.done = 0
+        self.fail: dict[Any, BaseException] = {}
+
+    def __iter__(self) -> Iterator[tuple[Any, Any]]:
+        for task_result in self._task_results:
+            self.done += 1
+            if task_result.exc is not None:
+                self.fail[task_result.device_id] = task_result.exc
+            else:
+                yield task_result.device_id, task_result.result
 
 
 class DeployerJob(abc.ABC):
@@ -17,7 +17,7 @@ from contextlog import get_logger
 from valkit.python import valid_logging_level
 
 from annet import api, cli_args, filtering, generators
-from annet.api import Deployer, collapse_texts
+from annet.api import Deployer, ResultsStream, TextCollapser
 from annet.argparse import ArgParser, subcommand
 from annet.deploy import get_deployer
 from annet.diff import gen_sort_diff
@@ -25,6 +25,7 @@ from annet.gen import CurrentState, Loader, get_current_state, old_raw
 from annet.generators.base import BaseGenerator
 from annet.lib import do_async, get_context_path, repair_context_file
 from annet.output import OutputDriver, output_driver_connector
+from annet.rulebook import DefaultRulebookProvider, rulebook_provider_connector
 from annet.storage import Device, Storage, get_storage
 from annet.types import ExitCode
 
@@ -209,57 +210,74 @@ def show_generators(args: cli_args.ShowGeneratorsOptions) -> None:
             print()
 
 
+def _collapse_output(items: Iterable[Tuple[str, Any, bool]]) -> list[Tuple[str, Any, bool]]:
+    collapser = TextCollapser()
+    for label, text, _ in items:
+        collapser.add(label, text)
+    return [(", ".join(key), value, False) for key, value in collapser.collapse().items()]
+
+
+def _write_stream(
+    args: cli_args.ShowGenOptions | cli_args.ShowDiffOptions | cli_args.ShowPatchOptions,
+    loader: Loader,
+    stream: ResultsStream,
+    items: Iterable[Tuple[str, Any, bool]],
+) -> None:
+    """Write the items as they are produced, the failures are written after them
+
+    With --strict-exit-code nothing is written if any device has failed,
+    so the items are collected before the output is started.
+    """
+    output_driver = output_driver_connector.get()
+    total = len(loader.device_ids)
+    if args.strict_exit_code:
+        items = list(items)
+        if stream.fail:
+            raise RuntimeError("failed for %d/%d devices" % (len(stream.fail), total))
+
+    def _items_and_fails() -> Iterator[Tuple[str, Any, bool]]:
+        yield from items
+        yield from output_driver.format_fails(stream.fail, loader.device_fqdns)
+
+    if not total:
+        get_logger().error("No devices found for %s", args.query)
+    output_driver.write_output(args, _items_and_fails(), total)
+
+
 @subcommand(cli_args.ShowGenOptions)
 def gen(args: cli_args.ShowGenOptions) -> None:
     """Generate configuration for devices"""
     with get_loader(args, args) as loader:
-        (success, fail) = api.gen(args, loader)
-
-        out = [item for items in success.values() for item in items]
-        output_driver = output_driver_connector.get()
+        stream = ResultsStream(api.igen(args, loader))
+        out: Iterable[Tuple[str, Any, bool]] = (item for _, items in stream for item in items)
         if args.dest is None:
-            text_mapping = {item[0]: item[1] for item in out}
-            out = [(", ".join(key), value, False) for key, value in collapse_texts(text_mapping).items()]
-
-        out.extend(output_driver.format_fails(fail, loader.device_fqdns))
-        total = len(success) + len(fail)
-        if not total:
-            get_logger().error("No devices found for %s", args.query)
-        output_driver.write_output(args, out, total)
+            # equal configs are shown once, so they are collapsed in the second pass
+            out = _collapse_output(out)
+        _write_stream(args, loader, stream, out)
 
 
 @subcommand(cli_args.ShowDiffOptions)
 def diff(args: cli_args.ShowDiffOptions) -> None:
     """Generate configuration for devices and show a diff with current configuration using the rulebook"""
     with get_loader(args, args) as loader:
-        success, fail = api.diff(args, loader, loader.device_ids)
-
-        out = list(gen_sort_diff({loader.get_device(k): v for k, v in success.items()}, args))
-        output_driver = output_driver_connector.get()
-        if args.dest is None:
-            text_mapping = {item[0]: item[1] for item in out}
-            out = [(", ".join(key), value, False) for key, value in collapse_texts(text_mapping).items()]
-        out.extend(output_driver.format_fails(fail, loader.device_fqdns))
-
-        if total := len(success) + len(fail):
-            output_driver.write_output(args, out, total)
+        stream = ResultsStream(api.idiff(args, loader, loader.device_ids))
+        out: Iterable[Tuple[str, Any, bool]]
+        if args.no_collapse and args.dest is not None:
+            out = (item for k, v in stream for item in gen_sort_diff({loader.get_device(k): v}, args))
         else:
-            get_logger().error("No devices found for %s", args.query)
+            # collapsing the diffs needs all of them
+            out = gen_sort_diff({loader.get_device(k): v for k, v in stream}, args)
+            if args.dest is None:
+                out = _collapse_output(out)
+        _write_stream(args, loader, stream, out)
 
 
 @subcommand(cli_args.ShowPatchOptions)
 def patch(args: cli_args.ShowPatchOptions) -> None:
     """Generate configuration patch for devices"""
     with get_loader(args, args) as loader:
-        (success, fail) = api.patch(args, loader)
-
-        out = [item for items in success.values() for item in items]
-        output_driver = output_driver_connector.get()
-        out.extend(output_driver.format_fails(fail, loader.device_fqdns))
-        total = len(success) + len(fail)
-        if not total:
-            get_logger().error("No devices found for %s", args.query)
-        output_driver.write_output(args, out, total)
+        stream = ResultsStream(api.ipatch(args, loader))
+        _write_stream(args, loader, stream, (item for _, items in stream for item in items))
 
 
 @subcommand(cli_args.DeployOptions)
@@ -362,3 +380,29 @@ def context_edit() -> None:
 def context_repair() -> None:
     """Try to fix the context file's structure if it was generated for the older versions of annet"""
     repair_context_file()
+
+
+@subcommand(is_group=True)
+def rulebook() -> None:
+    """A group of commands for managing rulebooks"""
+    pass
+
+
+@subcommand(cli_args.QueryOptions, parent=rulebook)
+def rulebook_precompile(args: cli_args.QueryOptions) -> None:
+    """Compile the rulebooks of the devices' hardware models and store them in the compiled rulebooks cache.
+
+    The cache directory is set with the ANN_RULEBOOK_CACHE_PATH environment variable
+    or the cache_path option of the rulebook section of the context.
+    """
+    provider = rulebook_provider_connector.get()
+    if not isinstance(provider, DefaultRulebookProvider):
+        raise TypeError("%s does not support precompiling rulebooks" % type(provider).__name__)
+    gen_args = cli_args.GenOptions(args)
+    with get_loader(gen_args, args) as loader:
+        if not loader.devices:
+            get_logger().error("No devices found for %s", args.query)
+        hws = {(device.hw.model, device.hw.soft): device.hw for device in loader.devices}
+        for (model, soft), hw in sorted(hws.items()):
+            status = "compiled" if provider.precompile(hw) else "cached"
+            print("%s: %s" % (" ".join(filter(None, (model, soft))), status))
@@ -134,8 +134,40 @@ opt_required_packages_check = Arg(
     help="Check that the deb-packages, required for the Entire-generators, are installed",
 )
 
+opt_gen_cache = Arg(
+    "--gen-cache",
+    default="",
+    help="A directory to cache generators results in. Devices whose data, generators and rulebooks "
+    "did not change since the previous run are not generated again. Only the storage data of the device itself "
+    "is tracked, clear the cache once the data of other devices the generators use changes",
+)
+
+opt_config_cache = Arg(
+    "--config-cache",
+    default="",
+    help="A directory to cache parsed device configs in. Configs which did not change since the previous run "
+    "are not parsed again",
+)
+
+opt_gen_threads = Arg(
+    "--gen-threads",
+    type=int,
+    default=1,
+    help="An amount of threads to run the partial generators of a device with. Generators run concurrently, "
+    "ref generators start once the generators they refer to are done, the results are merged in the usual order. "
+    "Storage request times are not collected per generator then",
+)
+
 opt_profile = Arg("--profile", default=False, help="Print time spent by generators and inventory requests to stderr")
 
+opt_profile_report = Arg(
+    "--profile-report",
+    default="",
+    help="A file to write time spent by generators reduced over all the devices to: "
+    "calls, total, 50/95/99 percentiles and inventory requests time. CSV for a .csv file, JSON otherwise. "
+    "The stages of processing the devices go to the same file with a .stages suffix before the extension",
+)
+
 
 opt_parallel = Arg(
     "-P",
@@ -145,6 +177,14 @@ opt_parallel = Arg(
     help="An amount of threads/processes to use as defined in a configured connector",
 )
 
+opt_parallel_backend = Arg(
+    "--parallel-backend",
+    default=None,
+    choices=["process", "thread", "inline", "asyncio"],
+    help="How to run the tasks in parallel: in worker processes, threads, inline or on an asyncio event loop. "
+    "Defaults to parallel.backend of the context or to processes",
+)
+
 opt_max_tasks = Arg(
     "--max-tasks",
     type=int,
@@ -153,6 +193,43 @@ opt_max_tasks = Arg(
     "Defaults to infinity",
 )
 
+opt_memory_budget = Arg(
+    "--memory-budget",
+    type=int,
+    default=None,
+    help="MiB of resident memory for all the worker processes. Limits the number of workers, "
+    "pauses dispatching and recycles the biggest worker when exceeded",
+)
+
+opt_device_timeout = Arg(
+    "--device-timeout",
+    type=float,
+    default=None,
+    help="Seconds a worker process may spend on a single device. A stuck worker has its stack dumped "
+    "and is replaced, the device is retried --device-timeout-retries times and then failed",
+)
+
+opt_device_timeout_retries = Arg(
+    "--device-timeout-retries",
+    type=int,
+    default=0,
+    help="How many times to retry a device which has exceeded --device-timeout",
+)
+
+opt_duration_history = Arg(
+    "--duration-history",
+    default="",
+    help="A file to keep devices processing durations in. When set, the longest expected devices are processed first "
+    "and the predicted and actual run times are logged",
+)
+
+opt_max_worker_rss = Arg(
+    "--max-worker-rss",
+    type=int,
+    default=None,
+    help="Restart a worker after a task if its resident memory exceeds this amount of MiB. Defaults to infinity",
+)
+
 opt_annotate = Arg("--annotate", default=False, help="Annotate configuration lines to show their sources")
 
 opt_config = Arg(
@@ -337,7 +414,13 @@ class QueryOptionsOptional(QueryOptionsBase):
 
 class ParallelOptions(ArgGroup):
     parallel = opt_parallel
+    parallel_backend = opt_parallel_backend
     max_tasks = opt_max_tasks
+    max_worker_rss = opt_max_worker_rss
+    memory_budget = opt_memory_budget
+    duration_history = opt_duration_history
+    device_timeout = opt_device_timeout
+    device_timeout_retries = opt_device_timeout_retries
 
 
 class GenSelectOptions(ArgGroup):
@@ -357,6 +440,10 @@ class GenOptions(QueryOptions, GenSelectOptions, CacheOptions, ParallelOptions):
     filter_peers = opt_filter_peers
     filter_policies = opt_filter_policies
     profile = opt_profile
+    profile_report = opt_profile_report
+    gen_cache = opt_gen_cache
+    config_cache = opt_config_cache
+    gen_threads = opt_gen_threads
     tolerate_fails = opt_tolerate_fails
     required_packages_check = opt_required_packages_check
     strict_exit_code = opt_strict_exit_code
@@ -406,6 +493,7 @@ class FileInputOptions(ArgGroup):
     hw = opt_hw
     fails_only = opt_fails_only
     include_missing = opt_include_missing
+    config_cache = opt_config_cache
 
 
 class PatchOptions(DiffOptions):
@@ -0,0 +1,109 @@
+"""On-disk cache of parsed device configs.
+
+A config text is parsed with tabparser.parse_to_tree() using the formatter of the device
+vendor. The parsed tree is stored keyed by the formatter (its class and the sources of
+the modules defining it) and the hash of the text, so the configs which did not change
+since the previous run are not parsed again. Trees are stored as nested tuples
+serialized with marshal, which is both compact and fast to load.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import marshal
+import os
+import tempfile
+from collections import OrderedDict as odict
+from typing import Any
+
+from contextlog import get_logger
+
+from annet.gen_cache import module_digest
+from annet.vendors import tabparser
+
+
+# bump when the layout of the entries changes
+CACHE_FORMAT_VERSION = 1
+
+
+_fingerprints: dict[type, str] = {}
+
+
+def formatter_fingerprint(formatter_cls: type) -> str:
+    """Name of the formatter class and digests of the modules defining it and its bases"""
+    if (fingerprint := _fingerprints.get(formatter_cls)) is None:
+        modules = {cls.__module__ for cls in formatter_cls.__mro__ if cls is not object}
+        modules.add(tabparser.__name__)
+        fingerprint = _fingerprints[formatter_cls] = "%s.%s\n%s" % (
+            formatter_cls.__module__,
+            formatter_cls.__qualname__,
+            "\n".join(module_digest(name) for name in sorted(modules)),
+        )
+    return fingerprint
+
+
+def _dump_tree(tree: odict[str, Any]) -> tuple[Any, ...]:
+    return tuple((row, _dump_tree(children)) for row, children in tree.items())
+
+
+def _load_tree(items: tuple[Any, ...]) -> odict[str, Any]:
+    return odict((row, _load_tree(children)) for row, children in items)
+
+
+class ParsedConfigCache:
+    """Content-addressed storage of parsed config trees in a directory.
+
+    Entries are written atomically, so the cache can be shared by pool workers.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(os.path.expanduser(path))
+
+    def make_key(self, formatter: tabparser.CommonFormatter, text: str) -> str:
+        digest = hashlib.sha256()
+        for part in (str(CACHE_FORMAT_VERSION), formatter_fingerprint(type(formatter)), text):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key + ".marshal")
+
+    def load(self, key: str) -> odict[str, Any] | None:
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                return _load_tree(marshal.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            get_logger().warning("ignoring broken parsed config cache entry %s: %r", path, exc)
+            return None
+
+    def store(self, key: str, tree: odict[str, Any]) -> None:
+        path = self._entry_path(key)
+        data = marshal.dumps(_dump_tree(tree))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def parse(self, text: str, formatter: tabparser.CommonFormatter) -> odict[str, Any]:
+        """Same as tabparser.parse_to_tree(text, formatter.split) but parses every text once"""
+        key = self.make_key(formatter, text)
+        tree = self.load(key)
+        if tree is None:
+            tree = tabparser.parse_to_tree(text=text, splitter=formatter.split)
+            self.store(key, tree)
+        return tree
+
+
+def parse_config(text: str, formatter: tabparser.CommonFormatter, cache: ParsedConfigCache | None) -> odict[str, Any]:
+    if cache is None:
+        return tabparser.parse_to_tree(text=text, splitter=formatter.split)
+    return cache.parse(text, formatter)
@@ -21,6 +21,7 @@ from annet.annlib.output import LABEL_NEW_PREFIX, format_file_diff
 from annet.cli_args import ShowDiffOptions
 from annet.connectors import CachedConnector
 from annet.output import output_driver_connector
+from annet.perf_report import print_stages, timed_stage
 from annet.storage import Device
 from annet.types import Diff, PCDiff, PCDiffFile
 from annet.vendors import registry_connector, tabparser
@@ -122,15 +123,23 @@ def worker(
             pc_diff_files.sort(key=lambda f: f.label)
             return PCDiff(hostname=device.hostname, diff_files=pc_diff_files)
         elif old is not None:
+            diff_stages: dict[str, float] = {}
             orderer = patching.Orderer.from_hw(device.hw)
             rb = rulebook.get_rulebook(device.hw)
-            diff_tree = patching.make_diff(
-                cast("dict[str, Any]", old),
-                orderer.order_config(cast("dict[str, Any]", new)),
-                rb,
-                cast("list[dict[str, Any] | None]", [acl_rules, res.filter_acl_rules]),
-            )
-            diff_tree = patching.strip_unchanged(diff_tree)
+            with timed_stage(diff_stages, "order_config"):
+                ordered_new = orderer.order_config(cast("dict[str, Any]", new))
+            with timed_stage(diff_stages, "make_diff"):
+                diff_tree = patching.make_diff(
+                    cast("dict[str, Any]", old),
+                    ordered_new,
+                    rb,
+                    cast("list[dict[str, Any] | None]", [acl_rules, res.filter_acl_rules]),
+                )
+                diff_tree = patching.strip_unchanged(diff_tree)
+            # res.stages is passed to the main process along with the result
+            res.stages.update(diff_stages)
+            if args.profile:
+                print_stages(device.hostname, diff_stages)
             return diff_tree
     return None
 
@@ -27,11 +27,14 @@ import tabulate
 from contextlog import get_logger
 
 from annet import generators, implicit, patching, rulebook, tracing
+from annet.annlib.configtree import compact_tree
 from annet.annlib.netdev.views.hardware import HardwareView
 from annet.annlib.rbparser.acl import compile_acl_text
 from annet.cli_args import DeployOptions, GenOptions, ShowGenOptions
+from annet.config_cache import ParsedConfigCache, parse_config
 from annet.deploy import get_fetcher, scrub_config
 from annet.filtering import Filterer
+from annet.gen_cache import CachedGeneration, GenCache
 from annet.generators import (
     BaseGenerator,
     Entire,
@@ -41,17 +44,15 @@ from annet.generators import (
     PartialGenerator,
     RefGenerator,
 )
+from annet.generators.result import RunGeneratorResult
 from annet.lib import do_async, merge_dicts, percentile
 from annet.output import output_driver_connector
+from annet.parallel import add_task_extra
+from annet.perf_report import ALL_GENS, PERF_EXTRA_KEY, STAGES_EXTRA_KEY, print_stages, timed_stage
 from annet.storage import Device, Storage
 from annet.tracing import tracing_connector
 from annet.types import OldNewResult as OldNewResult
-from annet.vendors import registry_connector, tabparser
-
-
-# The output of all generators together.
-# The value is the same as for the equivalent constant in the Checkist.
-ALL_GENS = "_all_gens"
+from annet.vendors import registry_connector
 
 
 @dataclasses.dataclass
@@ -122,6 +123,8 @@ class OldNewDeviceContext:
     failed_packages: Dict[Device, Exception]
     device_count: int
     do_print_perf: bool
+    gen_cache: Optional[GenCache] = None
+    config_cache: Optional[ParsedConfigCache] = None
 
 
 @tracing.function
@@ -129,6 +132,7 @@ def _old_new_per_device(ctx: OldNewDeviceContext, device: Device, filterer: Filt
     tracing_connector.get().set_device_attributes(tracing_connector.get().get_current_span(), device)
 
     start = time.monotonic()
+    collect_perf = ctx.args.profile or bool(ctx.args.profile_report)
     acl_rules = None
     acl_safe_rules = None
     old: dict[str, Any] = odict()
@@ -137,6 +141,7 @@ def _old_new_per_device(ctx: OldNewDeviceContext, device: Device, filterer: Filt
     new: dict[str, Any] = odict()
     safe_new: dict[str, Any] = odict()
     combined_perf: dict[str, Any] = {}
+    stages: dict[str, float] = {}
     partial_results: dict[str, generators.GeneratorPartialResult] = {}
     entire_results: dict[str, generators.GeneratorEntireResult] = {}
     implicit_rules: Optional[Dict[str, Any]] = None
@@ -145,9 +150,21 @@ def _old_new_per_device(ctx: OldNewDeviceContext, device: Device, filterer: Filt
     new_json_fragment_files: dict[str, tuple[Any, str | None]] = {}
     json_fragment_results: dict[str, generators.GeneratorJSONFragmentResult] = {}
 
+    cache_key: Optional[str] = None
+    cached: Optional[CachedGeneration] = None
+    partial_run: Optional[RunGeneratorResult] = None
+    files_run: Optional[RunGeneratorResult] = None
+    if ctx.gen_cache is not None and not ctx.no_new:
+        with timed_stage(stages, "gen_cache"):
+            cache_key = ctx.gen_cache.make_key(device, _device_gens(ctx.gens, device), _gen_cache_options(ctx))
+            cached = ctx.gen_cache.load(cache_key)
+        if cached is not None:
+            get_logger(host=device.hostname).debug("using cached generators results")
+
     if not device.is_pc():
         try:
-            text = _old_new_get_config_cli(ctx, device)
+            with timed_stage(stages, "get_config"):
+                text = _old_new_get_config_cli(ctx, device)
         except Exception as exc:
             return OldNewResult(device=device, err=exc)
 
@@ -165,13 +182,12 @@ def _old_new_per_device(ctx: OldNewDeviceContext, device: Device, filterer: Filt
 
         old = odict()
         if ctx.config != "empty":
-            old = tabparser.parse_to_tree(
-                text=text,
-                splitter=registry_connector.get().match(device.hw).make_formatter().split,
-            )
+            with timed_stage(stages, "parse_config"):
+                old = parse_config(text, registry_connector.get().match(device.hw).make_formatter(), ctx.config_cache)
         if not old:
-            res = generators.run_partial_initial(device)
-            old = res.config_tree()
+            with timed_stage(stages, "initial"):
+                res = generators.run_partial_initial(device)
+                old = res.config_tree()
             perf = res.perf_mesures()
             if ctx.args.profile and ctx.do_print_perf:
                 _print_perf("INITIAL", perf)
@@ -182,72 +198,85 @@ def _old_new_per_device(ctx: OldNewDeviceContext, device: Device, filterer: Filt
             annotate=ctx.add_annotations,
             generators_context=ctx.args.generators_context,
             no_new=ctx.no_new,
+            gen_threads=ctx.args.gen_threads or 1,
         )
-        res = generators.run_partial_generators(
-            ctx.gens.partial[device],
-            ctx.gens.ref[device],
-            run_args,
-        )
-        partial_results = res.partial_results
-        perf = res.perf_mesures()
-        if ctx.no_new:
-            new = odict()
-            safe_new = odict()
-        elif partial_results:
-            # skip one gen with not supported device
-            new = res.config_tree()
-            safe_new = res.config_tree(safe=True)
-
-        if ctx.args.profile:
-            if ctx.do_print_perf:
+        with timed_stage(stages, "partial_generators"):
+            if cached is not None:
+                res = cached.to_result()
+            else:
+                res = partial_run = generators.run_partial_generators(
+                    ctx.gens.partial[device],
+                    ctx.gens.ref[device],
+                    run_args,
+                )
+            partial_results = res.partial_results
+            # a cached result holds the timings of the run which has stored it
+            perf = res.perf_mesures() if cached is None else {}
+            if ctx.no_new:
+                new = odict()
+                safe_new = odict()
+            elif partial_results:
+                # skip one gen with not supported device
+                new = res.config_tree()
+                safe_new = res.config_tree(safe=True)
+
+        if collect_perf:
+            if ctx.args.profile and ctx.do_print_perf:
                 _print_perf("PARTIAL", perf)
             combined_perf.update(perf)
 
-        implicit_rules = implicit.compile_rules(device)
-        if ctx.add_implicit:
-            # implicit.config is typed to accept OrderedDict; config_tree() returns a plain
-            # dict at runtime, so bridge the invariant-mapping mismatch here.
-            old = merge_dicts(old, implicit.config(cast("odict[str, Any]", old), implicit_rules))
-            new = merge_dicts(new, implicit.config(cast("odict[str, Any]", new), implicit_rules))
-            safe_new = merge_dicts(safe_new, implicit.config(cast("odict[str, Any]", safe_new), implicit_rules))
+        with timed_stage(stages, "implicit"):
+            implicit_rules = implicit.compile_rules(device)
+            if ctx.add_implicit:
+                # implicit.config is typed to accept OrderedDict; config_tree() returns a plain
+                # dict at runtime, so bridge the invariant-mapping mismatch here.
+                old = merge_dicts(old, implicit.config(cast("odict[str, Any]", old), implicit_rules))
+                new = merge_dicts(new, implicit.config(cast("odict[str, Any]", new), implicit_rules))
+                safe_new = merge_dicts(safe_new, implicit.config(cast("odict[str, Any]", safe_new), implicit_rules))
 
         if not ctx.args.no_acl:
-            acl_rules = generators.compile_acl_text(res.acl_text(), device.hw.vendor)
-            old = old and patching.apply_acl(old, acl_rules)
-
-            new = patching.apply_acl(
-                new,
-                acl_rules,
-                exclusive=not ctx.args.no_acl_exclusive,
-                with_annotations=ctx.add_annotations,
-            )
-            if ctx.args.acl_safe:
-                acl_safe_rules = generators.compile_acl_text(res.acl_safe_text(), device.hw.vendor)
-                safe_old = old and patching.apply_acl(old, acl_safe_rules)
-                safe_new = patching.apply_acl(
-                    safe_new,
-                    acl_safe_rules,
+            with timed_stage(stages, "acl"):
+                acl_rules = generators.compile_acl_text(res.acl_text(), device.hw.vendor)
+                old = old and patching.apply_acl(old, acl_rules)
+
+                new = patching.apply_acl(
+                    new,
+                    acl_rules,
                     exclusive=not ctx.args.no_acl_exclusive,
                     with_annotations=ctx.add_annotations,
                 )
-
-        filter_acl_rules = build_filter_acl(filterer, device, ctx.stdin, ctx.args, ctx.config)
-        if filter_acl_rules is not None:
-            rb = rulebook.get_rulebook(device.hw)
-            # apply_acl types rb as a plain dict; get_rulebook returns a Rulebook mapping.
-            rb_dict = cast("dict[str, Any]", rb)
-            old = old and patching.apply_acl(old, filter_acl_rules, fatal_acl=False, forbid_ordered=True, rb=rb_dict)
-            new = patching.apply_acl(
-                new,
-                filter_acl_rules,
-                fatal_acl=False,
-                with_annotations=ctx.add_annotations,
-                forbid_ordered=True,
-                rb=rb_dict,
-            )
+            if ctx.args.acl_safe:
+                with timed_stage(stages, "acl_safe"):
+                    acl_safe_rules = generators.compile_acl_text(res.acl_safe_text(), device.hw.vendor)
+                    safe_old = old and patching.apply_acl(old, acl_safe_rules)
+                    safe_new = patching.apply_acl(
+                        safe_new,
+                        acl_safe_rules,
+                        exclusive=not ctx.args.no_acl_exclusive,
+                        with_annotations=ctx.add_annotations,
+                    )
+
+        with timed_stage(stages, "filter_acl"):
+            filter_acl_rules = build_filter_acl(filterer, device, ctx.stdin, ctx.args, ctx.config)
+            if filter_acl_rules is not None:
+                rb = rulebook.get_rulebook(device.hw)
+                # apply_acl types rb as a plain dict; get_rulebook returns a Rulebook mapping.
+                rb_dict = cast("dict[str, Any]", rb)
+                old = old and patching.apply_acl(
+                    old, filter_acl_rules, fatal_acl=False, forbid_ordered=True, rb=rb_dict
+                )
+                new = patching.apply_acl(
+                    new,
+                    filter_acl_rules,
+                    fatal_acl=False,
+                    with_annotations=ctx.add_annotations,
+                    forbid_ordered=True,
+                    rb=rb_dict,
+                )
     else:  # vendor == pc
         try:
-            old_files = _old_new_get_config_files(ctx, device)
+            with timed_stage(stages, "get_config"):
+                old_files = _old_new_get_config_files(ctx, device)
         except Exception as exc:
             return OldNewResult(device=device, err=exc)
 
@@ -264,10 +293,14 @@ def _old_new_per_device(ctx: OldNewDeviceContext, device: Device, filterer: Filt
                     error_msg = "; ".join(errors)
                     get_logger(host=device.hostname).error(error_msg)
                     return OldNewResult(device=device, err=Exception(error_msg))
-        res = generators.run_file_generators(
-            ctx.gens.file_gens(device),
-            device,
-        )
+        with timed_stage(stages, "file_generators"):
+            if cached is not None:
+                res = cached.to_result()
+            else:
+                res = files_run = generators.run_file_generators(
+                    ctx.gens.file_gens(device),
+                    device,
+                )
 
         entire_results = res.entire_results
         json_fragment_results = res.json_fragment_results
@@ -294,12 +327,21 @@ def _old_new_per_device(ctx: OldNewDeviceContext, device: Device, filterer: Filt
                 filters=filters,
             )
 
-    if ctx.args.profile:
-        perf = res.perf_mesures()
+    if ctx.gen_cache is not None and cache_key is not None and cached is None:
+        with timed_stage(stages, "gen_cache"):
+            ctx.gen_cache.store(cache_key, CachedGeneration.from_results(partial_run, files_run))
+
+    if collect_perf:
+        perf = res.perf_mesures() if cached is None else {}
         combined_perf[ALL_GENS] = {"total": time.monotonic() - start}
         combined_perf.update(perf)
-        if ctx.do_print_perf:
+        if ctx.args.profile and ctx.do_print_perf:
             _print_perf("ENTIRE", perf)
+            print_stages(device.hostname, stages)
+
+    # the results are kept until the whole run is done
+    with timed_stage(stages, "compact_trees"):
+        old, new, safe_old, safe_new = map(compact_tree, (old, new, safe_old, safe_new))
 
     return OldNewResult(
         device=device,
@@ -321,6 +363,23 @@ def _old_new_per_device(ctx: OldNewDeviceContext, device: Device, filterer: Filt
         safe_new_files=safe_new_files,
         safe_new_json_fragment_files=safe_new_json_fragment_files,
         filter_acl_rules=filter_acl_rules,
+        stages=stages,
+    )
+
+
+def _device_gens(gens: DeviceGenerators, device: Device) -> Iterator[BaseGenerator]:
+    yield from gens.partial.get(device, [])
+    yield from gens.ref.get(device, [])
+    yield from gens.file_gens(device)
+
+
+def _gen_cache_options(ctx: OldNewDeviceContext) -> tuple[Any, ...]:
+    # everything except the device and the generators themselves that affects generators results
+    return (
+        ctx.args.no_acl,
+        ctx.args.acl_safe,
+        ctx.args.generators_context,
+        ctx.add_annotations,
     )
 
 
@@ -434,6 +493,8 @@ def old_new(
         failed_packages=failed_packages,
         device_count=len(devices),
         do_print_perf=do_print_perf,
+        gen_cache=GenCache(args.gen_cache) if args.gen_cache else None,
+        config_cache=ParsedConfigCache(args.config_cache) if args.config_cache else None,
     )
     for device in devices:
         logger = get_logger(host=device.hostname)
@@ -443,6 +504,11 @@ def old_new(
             logger.error("ACL error: more than one acl rules matches to this command: %s", err)
             raise GeneratorError from err
         if result is not None:
+            if args.profile_report:
+                # to be reduced over all the devices by GeneratorPerfReport in the main process,
+                # the diff and patch workers add their stages to result.stages later on
+                add_task_extra(PERF_EXTRA_KEY, result.perf)
+                add_task_extra(STAGES_EXTRA_KEY, result.stages)
             yield result
 
 
@@ -540,9 +606,11 @@ def worker(
         # Otherwise treat it as if no supported generators have been found.
         if args.no_acl or res.get_acl_rules(args.acl_safe):
             orderer = patching.Orderer.from_hw(device.hw)
+            with timed_stage(res.stages, "order_config"):
+                ordered = orderer.order_config(cast("dict[str, Any]", new))
             yield (
                 output_driver.cfg_file_names(device)[0],
-                format_config_blocks(orderer.order_config(cast("dict[str, Any]", new)), device.hw, args.indent),
+                format_config_blocks(ordered, device.hw, args.indent),
                 False,
             )
 
@@ -599,7 +667,7 @@ def _print_perf(gen_type: str, perf: dict[str, dict[str, Any]]) -> None:
                     reverse=True,
                 )
                 for (method, stat) in sorted(
-                    [(None, [{"time": gen_perf["total"], "op": None}])] + list(gen_perf["rt"].items()),
+                    [(None, [{"time": gen_perf["total"], "op": None}])] + list((gen_perf["rt"] or {}).items()),
                     key=(lambda item: sum(map(itemgetter("time"), item[1]))),
                     reverse=True,
                 )
@@ -787,8 +855,7 @@ def _old_new_get_config_files(ctx: OldNewDeviceContext, device: Device) -> Devic
 def _old_resolve_gens(args: GenOptions, storage: Storage, devices: Iterable[Device]) -> DeviceGenerators:
     per_device_gens = DeviceGenerators()
     device_list: list[Device | None] = list(devices) or [None]  # get all generators if no devices provided
-    for device in device_list:
-        gens = generators.build_generators(storage, gens=args, device=device)
+    for device, gens in generators.build_generators_for_devices(storage, gens=args, devices=device_list):
         per_device_gens.partial[device] = gens.partial
         per_device_gens.entire[device] = gens.entire
         per_device_gens.json_fragment[device] = gens.json_fragment
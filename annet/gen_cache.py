@@ -0,0 +1,302 @@
+"""On-disk cache of generator results for old/new runs.
+
+A cached entry holds everything the generators produced for a device (partial, entire
+and json fragment results). It is keyed by a fingerprint of the device's storage data,
+the sources of the generator packages applied to it and of all the modules they import,
+the device's rulebook texts and the options affecting generation. The current ("old")
+side of a diff is never cached.
+
+Only the storage data of the device itself is tracked: generators reading the data of
+other devices or other storage objects get stale results once that data changes, so the
+cache has to be cleared by hand then.
+"""
+
+from __future__ import annotations
+
+import ast
+import dataclasses
+import hashlib
+import importlib.machinery
+import importlib.util
+import inspect
+import os
+import pickle
+import re
+import sys
+import sysconfig
+import tempfile
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
+from typing import Any
+
+from contextlog import get_logger
+
+from annet import rulebook
+from annet.generators import BaseGenerator
+from annet.generators.result import RunGeneratorResult
+from annet.storage import Device
+from annet.types import GeneratorEntireResult, GeneratorJSONFragmentResult, GeneratorPartialResult
+
+
+# bump when the layout of CachedGeneration changes
+CACHE_FORMAT_VERSION = 2
+
+_ADDRESS_RE = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+@dataclasses.dataclass
+class CachedGeneration:
+    partial_results: dict[str, GeneratorPartialResult]
+    entire_results: dict[str, GeneratorEntireResult]
+    json_fragment_results: dict[str, GeneratorJSONFragmentResult]
+
+    @classmethod
+    def from_results(cls, partial: RunGeneratorResult | None, files: RunGeneratorResult | None) -> CachedGeneration:
+        return cls(
+            partial_results=partial.partial_results if partial else {},
+            entire_results=files.entire_results if files else {},
+            json_fragment_results=files.json_fragment_results if files else {},
+        )
+
+    def to_result(self) -> RunGeneratorResult:
+        ret = RunGeneratorResult()
+        ret.partial_results = self.partial_results
+        ret.entire_results = self.entire_results
+        ret.json_fragment_results = self.json_fragment_results
+        return ret
+
+
+@lru_cache(maxsize=None)
+def _file_digest(path: str, mtime_ns: int) -> str:  # pylint: disable=unused-argument
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def module_digest(module_name: str) -> str:
+    module = sys.modules.get(module_name)
+    path = None
+    if module is not None:
+        try:
+            path = inspect.getsourcefile(module)
+        except TypeError:  # builtin module
+            path = None
+    if not path or not os.path.exists(path):
+        return module_name
+    return "%s:%s" % (module_name, _file_digest(path, os.stat(path).st_mtime_ns))
+
+
+def device_fingerprint(device: Device) -> str:
+    """Stable textual representation of the device data taken from the storage
+
+    The identity of the device goes first, a dump of the device data is not bound to have it.
+    """
+    storage_cls = type(device.storage)
+    lines = [
+        f"device.id = {device.id!r}",
+        f"device.fqdn = {device.fqdn!r}",
+        f"storage = {storage_cls.__module__}.{storage_cls.__qualname__}",
+    ]
+    if hasattr(device, "dump"):
+        lines.extend(device.dump("device"))
+    else:
+        lines.append(repr(device))
+    return "\n".join(_ADDRESS_RE.sub("", line) for line in lines)
+
+
+def _is_stdlib(module_name: str) -> bool:
+    return module_name.partition(".")[0] in sys.stdlib_module_names
+
+
+_SITE_DIRS = tuple(sorted({sysconfig.get_paths()[key] for key in ("purelib", "platlib")}))
+
+
+def _module_origin(name: str) -> str | None:
+    """Where a module is loaded from ("built-in" or a file path), None for a missing module.
+
+    Modules which are not loaded yet are looked up without importing them or their packages.
+    """
+    if (module := sys.modules.get(name)) is not None:
+        spec = getattr(module, "__spec__", None)
+        origin = getattr(spec, "origin", None) or getattr(module, "__file__", None)
+        return origin if isinstance(origin, str) else "built-in"
+    package, _, _ = name.rpartition(".")
+    search_path = None
+    if package:
+        parent = sys.modules.get(package)
+        if parent is not None:
+            search_path = getattr(parent, "__path__", None)
+        elif (parent_origin := _module_origin(package)) is not None and parent_origin.endswith("__init__.py"):
+            search_path = [os.path.dirname(parent_origin)]
+        if search_path is None:
+            return None
+    try:
+        spec = importlib.machinery.PathFinder.find_spec(name, search_path)
+    except Exception:  # broken finders and the like
+        return None
+    return spec.origin if spec is not None else None
+
+
+@lru_cache(maxsize=None)
+def _file_imports(path: str, mtime_ns: int, package: str) -> tuple[str, ...]:  # pylint: disable=unused-argument
+    """Names of the modules a source file imports, functions bodies included.
+
+    For "from x import y" both x and x.y are returned, since y may be a submodule.
+    """
+    try:
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read(), path)
+    except (OSError, SyntaxError, ValueError):
+        return ()
+    names: list[str] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            try:
+                base = importlib.util.resolve_name("." * node.level + (node.module or ""), package)
+            except ImportError:  # relative import beyond the top-level package
+                continue
+            names.append(base)
+            names.extend("%s.%s" % (base, alias.name) for alias in node.names if alias.name != "*")
+    return tuple(names)
+
+
+def _package_modules(package: str) -> Iterator[str]:
+    """Names of all the modules in the directory of a package, loaded or not"""
+    origin = _module_origin(package)
+    if origin is None or os.path.basename(origin) != "__init__.py":
+        return
+    package_dir = os.path.dirname(origin)
+    for dirpath, dirnames, filenames in os.walk(package_dir):
+        dirnames[:] = sorted(name for name in dirnames if name.isidentifier())
+        subdir = os.path.relpath(dirpath, package_dir)
+        prefix = package if subdir == os.curdir else ".".join([package, *subdir.split(os.sep)])
+        for filename in sorted(filenames):
+            stem, ext = os.path.splitext(filename)
+            if ext == ".py" and stem.isidentifier():
+                yield prefix if stem == "__init__" else "%s.%s" % (prefix, stem)
+
+
+def _generator_module_origins(root_names: Iterable[str]) -> dict[str, str]:
+    roots = set(root_names)
+    queue = sorted(roots)
+    for package in sorted({name.partition(".")[0] for name in roots}):
+        queue.extend(_package_modules(package))
+
+    origins: dict[str, str] = {}
+    while queue:
+        name = queue.pop()
+        if name in origins or _is_stdlib(name) or (origin := _module_origin(name)) is None:
+            continue
+        origins[name] = origin
+        # importing a submodule runs the __init__ of its packages
+        queue.extend(name.rsplit(".", depth)[0] for depth in range(1, name.count(".") + 1))
+        # installed distributions are tracked by their own files only
+        if origin.endswith(".py") and not origin.startswith(_SITE_DIRS) and os.path.exists(origin):
+            is_package = os.path.basename(origin) == "__init__.py"
+            package = name if is_package else name.rpartition(".")[0]
+            queue.extend(_file_imports(origin, os.stat(origin).st_mtime_ns, package))
+    return origins
+
+
+def generator_modules(root_names: Iterable[str]) -> list[str]:
+    """The modules the output of the generators defined in the root modules may depend on.
+
+    These are all the modules of the root modules' packages, loaded or not, and all
+    the modules their sources import, transitively. The standard library is left out.
+    The set depends only on the sources, not on what is imported at the moment.
+    """
+    return sorted(_generator_module_origins(root_names))
+
+
+def _origin_digest(name: str, origin: str) -> str:
+    if not origin.endswith(".py") or not os.path.exists(origin):
+        return name
+    return "%s:%s" % (name, _file_digest(origin, os.stat(origin).st_mtime_ns))
+
+
+def _classes_fingerprint(classes: Iterable[type]) -> str:
+    classes = set(classes)
+    items = sorted("%s.%s" % (cls.__module__, cls.__qualname__) for cls in classes)
+    origins = _generator_module_origins(cls.__module__ for cls in classes)
+    items.extend(_origin_digest(name, origins[name]) for name in sorted(origins))
+    return "\n".join(items)
+
+
+def generators_fingerprint(gens: Iterable[BaseGenerator]) -> str:
+    return _classes_fingerprint(type(gen) for gen in gens)
+
+
+class GenCache:
+    """Content-addressed storage of CachedGeneration objects in a directory.
+
+    Entries are written atomically, so the cache can be shared by pool workers.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(os.path.expanduser(path))
+        # the sources are not expected to change during a run
+        self._fingerprints: dict[frozenset[type], str] = {}
+
+    def _generators_fingerprint(self, gens: Iterable[BaseGenerator]) -> str:
+        classes = frozenset(type(gen) for gen in gens)
+        fingerprint = self._fingerprints.get(classes)
+        if fingerprint is None:
+            fingerprint = self._fingerprints[classes] = _classes_fingerprint(classes)
+        return fingerprint
+
+    def make_key(
+        self,
+        device: Device,
+        gens: Iterable[BaseGenerator],
+        options: Iterable[Any],
+    ) -> str:
+        texts = rulebook.get_rulebook(device.hw)["texts"]
+        digest = hashlib.sha256()
+        for part in (
+            str(CACHE_FORMAT_VERSION),
+            str(device.hw),
+            device_fingerprint(device),
+            self._generators_fingerprint(gens),
+            texts["patching"],
+            texts["ordering"],
+            texts["deploying"],
+            repr(tuple(options)),
+        ):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key + ".pickle")
+
+    def load(self, key: str) -> CachedGeneration | None:
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            get_logger().warning("ignoring broken generation cache entry %s: %r", path, exc)
+            return None
+        if not isinstance(entry, CachedGeneration):
+            return None
+        return entry
+
+    def store(self, key: str, entry: CachedGeneration) -> None:
+        path = self._entry_path(key)
+        try:
+            data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as exc:
+            get_logger().debug("generation result is not cacheable: %r", exc)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
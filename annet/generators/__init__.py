@@ -1,15 +1,23 @@
 from __future__ import annotations
 
+import collections
+import contextvars
+import copy
 import dataclasses
+import functools
 import importlib
 import importlib.machinery
+import importlib.util
 import os
 import re
+import sys
 import textwrap
+import threading
 from collections import OrderedDict as odict
 from collections.abc import Callable, Collection, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from types import ModuleType
-from typing import Any, FrozenSet, Iterable, List, Optional, Union, cast
+from typing import Any, FrozenSet, Iterable, List, Optional, TypeVar, Union, cast
 
 from contextlog import get_logger
 from valkit.common import valid_string_list
@@ -20,6 +28,7 @@ from annet.annlib.rbparser.acl import compile_acl_text as compile_acl_text
 from annet.annlib.rbparser.syntax import parse_raw_rule
 from annet.cli_args import GenSelectOptions, ShowGeneratorsOptions
 from annet.lib import get_context
+from annet.reference import RefMatcher
 from annet.storage import Device, Storage
 from annet.tracing import tracing_connector
 from annet.types import (
@@ -63,6 +72,8 @@ from .result import RunGeneratorResult
 # =====
 DISABLED_TAG = "disable"
 
+GeneratorT = TypeVar("GeneratorT", bound=BaseGenerator)
+
 
 # =====
 def get_list(args: ShowGeneratorsOptions) -> dict[str, dict[str, Any]]:
@@ -109,25 +120,97 @@ class Generators:
     json_fragment: List[JSONFragment] = dataclasses.field(default_factory=list)
 
 
+def build_generators_for_devices(
+    storage: Storage, gens: GenSelectOptions, devices: Iterable[Optional[Device]]
+) -> Iterator[tuple[Optional[Device], Generators]]:
+    """Same as build_generators() for every device.
+
+    The devices matching the same per_device_property share the instances of STATELESS
+    generators. Only the modules which have returned other generators are asked for them
+    again for every device.
+    """
+    if gens.generators_context is not None:
+        os.environ["ANN_GENERATORS_CONTEXT"] = gens.generators_context
+    groups: dict[Optional[str], tuple[Generators, set[str]]] = {}
+    for device in devices:
+        prop = _matched_device_property(get_context()["generators"], device)
+        if (group := groups.get(prop)) is None:
+            shared, stateful_modules = groups[prop] = _build_generators(storage, gens, device)
+            yield device, shared
+            continue
+        shared, stateful_modules = group
+        if not stateful_modules:
+            yield device, shared
+            continue
+        own, _ = _build_generators(storage, gens, device, only_modules=stateful_modules)
+        merged = _share_stateless(own, shared)
+        if merged is None:  # the modules have returned other generators this time
+            merged, _ = _build_generators(storage, gens, device)
+        yield device, merged
+
+
+def _share_stateless(own: Generators, shared: Generators) -> Optional[Generators]:
+    """Replace the generators of shared which are not STATELESS with the ones of the same classes from own"""
+    ret = Generators()
+    for field in dataclasses.fields(shared):
+        own_instances: dict[type, collections.deque[BaseGenerator]] = collections.defaultdict(collections.deque)
+        for gen in getattr(own, field.name):
+            if not gen.STATELESS:
+                own_instances[type(gen)].append(gen)
+        merged = []
+        for gen in getattr(shared, field.name):
+            if not gen.STATELESS:
+                if not own_instances[type(gen)]:
+                    return None
+                gen = own_instances[type(gen)].popleft()
+            merged.append(gen)
+        if any(own_instances.values()):
+            return None
+        setattr(ret, field.name, merged)
+    return ret
+
+
 def build_generators(storage: Storage, gens: GenSelectOptions, device: Optional[Device] = None) -> Generators:
     """Return generators that meet the gens filter conditions."""
     if gens.generators_context is not None:
         os.environ["ANN_GENERATORS_CONTEXT"] = gens.generators_context
-    all_generators = _get_generators(get_context()["generators"], storage, device)
-    ref_generators = _get_ref_generators(get_context()["generators"], storage, device)
-    validate_genselect(gens, all_generators)
+    return _build_generators(storage, gens, device)[0]
+
+
+def _build_generators(
+    storage: Storage,
+    gens: GenSelectOptions,
+    device: Optional[Device] = None,
+    only_modules: Optional[Collection[str]] = None,
+) -> tuple[Generators, set[str]]:
+    """Same as build_generators() plus the modules which have returned generators that are not STATELESS
+
+    With only_modules the generators of the other modules are left out.
+    """
+    gens_modules = list(_iter_generators(get_context()["generators"], storage, device, only_modules))
+    ref_modules = list(_iter_ref_generators(get_context()["generators"], storage, device, only_modules))
+    all_generators = [gen for _, gen in gens_modules]
+    if only_modules is None:
+        validate_genselect(gens, all_generators)
     classes = list(select_generators(gens, all_generators))
+    selected = {id(gen) for gen in classes}
+    stateful_modules = {
+        module_path
+        for module_path, gen in [*gens_modules, *ref_modules]
+        if not gen.STATELESS and (id(gen) in selected or isinstance(gen, RefGenerator))
+    }
     classes.sort(key=lambda x: x.get_name())
     partial = cast(List[PartialGenerator], [obj for obj in classes if obj.TYPE == "PARTIAL"])
     entire = cast(List[Entire], [obj for obj in classes if obj.TYPE == "ENTIRE"])
     entire.sort(key=lambda x: x.prio, reverse=True)
     json_fragment = cast(List[JSONFragment], [obj for obj in classes if obj.TYPE == "JSON_FRAGMENT"])
-    return Generators(
+    generators = Generators(
         partial=partial,
         entire=entire,
         json_fragment=json_fragment,
-        ref=ref_generators,
+        ref=[gen for _, gen in ref_modules],
     )
+    return generators, stateful_modules
 
 
 @tracing.function
@@ -153,40 +236,105 @@ def run_partial_generators(
     if run_args.generators_context is not None:
         os.environ["ANN_GENERATORS_CONTEXT"] = run_args.generators_context
 
+    gens = list(gens)  # the list is shared by devices, matched ref generators are added to a copy
     for ref_gen in ref_gens:
         # RefMatcher stores the generator object itself (its API types the slot as ``type``).
         ret.ref_matcher.add(ref_gen.ref(run_args.device), cast("type", ref_gen))
 
     logger.debug("Generating selected PARTIALs ...")
 
-    for gen in gens:
-        try:
-            result = _run_partial_generator(gen, run_args)
-        except NotSupportedDevice as exc:
-            logger.info("generator %s raised unsupported error: %r", gen, exc)
-            continue
-
-        if not result:
-            continue
-
-        ref_match = ret.ref_matcher.match(result.config)
-        for matched_obj, groups in ref_match:
-            # match yields back the stored generator objects (API types them as ``type``).
-            matched_gen = cast("RefGenerator", matched_obj)
-            gens.append(matched_gen.with_groups(groups))
+    for gen, result, matched_gens in _iter_partial_results(gens, ret.ref_matcher, run_args):
+        for matched_gen in matched_gens:
             ret.ref_track.add(gen.__class__, matched_gen.__class__)
-
         ret.ref_track.config(gen.__class__, result.config)
         ret.add_partial(result)
 
     return ret
 
 
+_PartialNode = tuple[GeneratorPartialResult, List["RefGenerator"]]
+
+
+def _iter_partial_results(
+    gens: List["PartialGenerator"],
+    ref_matcher: RefMatcher,
+    run_args: GeneratorPartialRunArgs,
+) -> Iterator[tuple["PartialGenerator", GeneratorPartialResult, List["RefGenerator"]]]:
+    """Runs the generators and the ref generators matching their results
+
+    The results come in the order of running the generators one by one, with the matched
+    ref generators queued after the given ones. With run_args.gen_threads the generators
+    run concurrently, a ref generator starts as soon as the result it matches is ready.
+    """
+    if run_args.gen_threads <= 1:
+        queue = list(gens)
+        for gen in queue:
+            if node := _run_partial_node(gen, ref_matcher, run_args):
+                queue.extend(node[1])
+                yield gen, *node
+        return
+
+    executor = ThreadPoolExecutor(max_workers=run_args.gen_threads, thread_name_prefix="gen")
+
+    def submit(gen: "PartialGenerator") -> tuple["PartialGenerator", Future[_PartialNode | None]]:
+        # keep the tracing context of the device in the worker threads
+        ctx = contextvars.copy_context()
+        return gen, executor.submit(ctx.run, _run_partial_node, gen, ref_matcher, run_args)
+
+    order = collections.deque(submit(gen) for gen in gens)
+    running = {future for _, future in order}
+    # the dependents of a finished generator, they are put in order once it's the generator's turn
+    dependents: dict[Future[_PartialNode | None], list[tuple["PartialGenerator", Future[_PartialNode | None]]]] = {}
+    try:
+        while order:
+            gen, future = order[0]
+            if future not in dependents:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for finished in done:
+                    node = None if finished.exception() else finished.result()
+                    dependents[finished] = [submit(ref_gen) for ref_gen in node[1]] if node else []
+                    running.update(ref_future for _, ref_future in dependents[finished])
+                continue
+            order.popleft()
+            order.extend(dependents.pop(future))
+            if node := future.result():
+                yield gen, *node
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _run_partial_node(
+    gen: "PartialGenerator",
+    ref_matcher: RefMatcher,
+    run_args: GeneratorPartialRunArgs,
+) -> _PartialNode | None:
+    try:
+        result = _run_partial_generator(gen, run_args)
+    except NotSupportedDevice as exc:
+        get_logger(host=run_args.device.hostname).info("generator %s raised unsupported error: %r", gen, exc)
+        return None
+
+    if not result:
+        return None
+
+    matched_gens = []
+    for matched_obj, groups in ref_matcher.match(result.config):
+        # match yields back the stored generator objects (API types them as ``type``).
+        matched_gens.append(cast("RefGenerator", matched_obj).with_groups(groups))
+    return result, matched_gens
+
+
+def _private_instance(gen: GeneratorT) -> GeneratorT:
+    """STATELESS instances are shared by devices, the state of a run is kept in a copy of them"""
+    return copy.copy(gen) if gen.STATELESS else gen
+
+
 @tracing.function(name="run_partial_generator")
 def _run_partial_generator(gen: "PartialGenerator", run_args: GeneratorPartialRunArgs) -> GeneratorPartialResult | None:
+    gen = _private_instance(gen)
     logger = get_logger(generator=_make_generator_ctx(gen))
     device = run_args.device
-    output = ""
+    output: str | Callable[[], str] = ""
     config: odict[str, Any] = odict()
     safe_config: odict[str, Any] = odict()
 
@@ -209,8 +357,12 @@ def _run_partial_generator(gen: "PartialGenerator", run_args: GeneratorPartialRu
         if not run_args.no_new:
             if gen.get_user_runner(device):
                 logger.info("Generating PARTIAL ...")
+            fmtr = registry_connector.get().match(device.hw).make_formatter()
+            # annotated rows are parsed along with their annotations, so they need the text
+            split_row = None if run_args.annotate else tabparser.row_splitter(fmtr)
+
             try:
-                output = gen(device, run_args.annotate)
+                tree = gen._generate(device, split_row)  # pylint: disable=protected-access
             except NotSupportedDevice:  # this exception must be passed up as-is
                 raise
             except Exception as err:
@@ -220,13 +372,16 @@ def _run_partial_generator(gen: "PartialGenerator", run_args: GeneratorPartialRu
                     f"{gen} on {device.__class__.__name__}(id={device.id}, hostname={device.hostname})"
                 ) from err
 
-            fmtr = registry_connector.get().match(device.hw).make_formatter()
-
-            try:
-                config = tabparser.parse_to_tree(text=output, splitter=fmtr.split)
-            except tabparser.ParserError as err:
-                logger.exception("Parser error")
-                raise GeneratorError from err
+            if tree is not None:
+                config = tree
+                output = gen._deferred_render()  # pylint: disable=protected-access
+            else:
+                output = gen._render(run_args.annotate)  # pylint: disable=protected-access
+                try:
+                    config = tabparser.parse_to_tree(text=output, splitter=fmtr.split)
+                except tabparser.ParserError as err:
+                    logger.exception("Parser error")
+                    raise GeneratorError from err
 
     acl = gen.acl(device) or ""
     rules = compile_acl_text(textwrap.dedent(acl), device.hw.vendor)
@@ -322,6 +477,7 @@ def run_file_generators(
 
 @tracing.function(min_duration="0.5")
 def _run_entire_generator(gen: "Entire", device: "Device") -> GeneratorEntireResult | None:
+    gen = _private_instance(gen)
     logger = get_logger(generator=_make_generator_ctx(gen))
     span = tracing_connector.get().get_current_span()
     if span:
@@ -385,6 +541,7 @@ def _run_json_fragment_generator(
     gen: "JSONFragment",
     device: "Device",
 ) -> GeneratorJSONFragmentResult | None:
+    gen = _private_instance(gen)
     logger = get_logger(generator=_make_generator_ctx(gen))
 
     with GeneratorPerfMesurer(gen) as pm:
@@ -428,58 +585,128 @@ def _run_json_fragment_generator(
 def _get_generators(
     module_paths: Union[List[str], dict[str, Any]], storage: Storage | None, device: Optional[Device] = None
 ) -> List[BaseGenerator]:
+    return [gen for _, gen in _iter_generators(module_paths, storage, device)]
+
+
+def _iter_generators(
+    module_paths: Union[List[str], dict[str, Any]],
+    storage: Storage | None,
+    device: Optional[Device] = None,
+    only_modules: Optional[Collection[str]] = None,
+) -> Iterator[tuple[str, BaseGenerator]]:
+    """Generators of the modules of the device along with the modules they come from"""
     if isinstance(module_paths, dict):
-        if device is None:
+        matched_property = _matched_device_property(module_paths, device)
+        if matched_property is None:
             module_paths = module_paths.get("default", [])
         else:
             modules = []
             seen = set()
-            matched_property = None
-            for prop, prop_modules in module_paths.get("per_device_property", {}).items():
-                if getattr(device, prop, False) is True:
-                    if matched_property is not None:
-                        raise RuntimeError(
-                            f"Device {device.hostname} is matched by more than one "
-                            f"per_device_property: {matched_property} and {prop}"
-                        )
-                    matched_property = prop
-                    for module in prop_modules:
-                        if module not in seen:
-                            modules.append(module)
-                            seen.add(module)
+            for module in module_paths["per_device_property"][matched_property]:
+                if module not in seen:
+                    modules.append(module)
+                    seen.add(module)
             module_paths = modules or module_paths.get("default", [])
-    res_generators: List[BaseGenerator] = []
     for module_path in module_paths:
+        if only_modules is not None and module_path not in only_modules:
+            continue
         module = _load_gen_module(module_path)
         if hasattr(module, "get_generators"):
             generators: List[BaseGenerator] = module.get_generators(storage)
-            res_generators += generators
-    return res_generators
+            for gen in generators:
+                yield module_path, gen
+
+
+def _matched_device_property(
+    module_paths: Union[List[str], dict[str, Any]], device: Optional[Device] = None
+) -> Optional[str]:
+    """Return the per_device_property defining the generators modules of the device"""
+    if not isinstance(module_paths, dict) or device is None:
+        return None
+    matched_property = None
+    for prop in module_paths.get("per_device_property", {}):
+        if getattr(device, prop, False) is True:
+            if matched_property is not None:
+                raise RuntimeError(
+                    f"Device {device.hostname} is matched by more than one "
+                    f"per_device_property: {matched_property} and {prop}"
+                )
+            matched_property = prop
+    return matched_property
 
 
 def _load_gen_module(module_path: str) -> ModuleType:
+    module_abs_path = os.path.abspath(module_path)
+    with _path_modules_lock:
+        if module := _cached_path_module(module_abs_path):
+            return module
+        try:
+            module = importlib.import_module(module_path)
+        except ModuleNotFoundError as e:
+            try:  # maybe it's a path to module
+                module = _load_path_module(module_abs_path)
+            except ModuleNotFoundError:
+                raise e
+    return module
+
+
+# modules loaded by a file path: absolute path -> (mtime, module)
+_path_modules: dict[str, tuple[int, ModuleType]] = {}
+_path_modules_lock = threading.RLock()
+
+
+def _cached_path_module(module_abs_path: str) -> ModuleType | None:
+    cached = _path_modules.get(module_abs_path)
+    if cached is None:
+        return None
+    mtime, module = cached
+    try:
+        if os.stat(module_abs_path).st_mtime_ns == mtime:
+            return module
+    except OSError:
+        pass
+    del _path_modules[module_abs_path]
+    return None
+
+
+def _load_path_module(module_abs_path: str) -> ModuleType:
+    # SourceFileLoader keeps the bytecode in __pycache__ next to the file, so only the
+    # first process after the file is changed compiles it
+    mtime = os.stat(module_abs_path).st_mtime_ns
+    name = re.sub(r"[./]", "_", module_abs_path).strip("_")
+    loader = importlib.machinery.SourceFileLoader(name, module_abs_path)
+    spec = importlib.util.spec_from_file_location(name, module_abs_path, loader=loader)
+    assert spec is not None
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
     try:
-        module = importlib.import_module(module_path)
-    except ModuleNotFoundError as e:
-        try:  # maybe it's a path to module
-            module_abs_path = os.path.abspath(module_path)
-            module = importlib.machinery.SourceFileLoader(
-                re.sub(r"[./]", "_", module_abs_path).strip("_"), module_abs_path
-            ).load_module()
-        except ModuleNotFoundError:
-            raise e
+        loader.exec_module(module)
+    except BaseException:
+        sys.modules.pop(name, None)
+        raise
+    _path_modules[module_abs_path] = (mtime, module)
     return module
 
 
 def _get_ref_generators(module_paths: List[str], storage: Storage, device: Optional[Device]) -> List[RefGenerator]:
+    return [gen for _, gen in _iter_ref_generators(module_paths, storage, device)]
+
+
+def _iter_ref_generators(
+    module_paths: Union[List[str], dict[str, Any]],
+    storage: Storage | None,
+    device: Optional[Device],  # pylint: disable=unused-argument
+    only_modules: Optional[Collection[str]] = None,
+) -> Iterator[tuple[str, RefGenerator]]:
     if isinstance(module_paths, dict):
-        module_paths = module_paths.get("default")
-    res_generators: List[RefGenerator] = []
+        module_paths = module_paths.get("default", [])
     for module_path in module_paths:
+        if only_modules is not None and module_path not in only_modules:
+            continue
         module = _load_gen_module(module_path)
         if hasattr(module, "get_ref_generators"):
-            res_generators += module.get_ref_generators(storage)
-    return res_generators
+            for gen in module.get_ref_generators(storage):
+                yield module_path, gen
 
 
 def select_generators(gens: GenSelectOptions, classes: Iterable[BaseGenerator]) -> Iterator[BaseGenerator]:
@@ -4,8 +4,9 @@ import abc
 import contextlib
 import re
 import textwrap
+from collections import OrderedDict as odict
 from collections.abc import Callable, Iterator, Sequence
-from typing import Union, cast
+from typing import Any, Union, cast
 
 from annet import tracing
 from annet.storage import Device, Storage
@@ -62,11 +63,67 @@ def _split_and_strip(text: str) -> list[str]:
     return rows
 
 
+class _TreeBuilder:
+    """Builds the same config tree as tabparser.parse_to_tree() does from the generated text
+
+    Rows are added as they are generated. Once a row needs the text parser to figure out
+    where it belongs (rows with own indentation, blocks without indentation or with a dropped
+    header row) the builder gives up and `failed` is set.
+    """
+
+    def __init__(self, split_row: Callable[[str], str | None], comments: tuple[str, ...] = ("!", "#")) -> None:
+        self.split_row = split_row
+        self.comments = comments
+        self.tree: odict[str, Any] = odict()
+        self.failed = False
+        self._stack: list[odict[str, Any]] = [self.tree]
+        self._last: odict[str, Any] | None = None
+
+    def add_row(self, row: str) -> None:
+        if self.failed:
+            return
+        if row.startswith((" ", "\t")):
+            self.failed = True
+            return
+        key = self.split_row(row)
+        if key is not None:
+            key = key.strip()
+        if not key or key.startswith(self.comments):
+            self._last = None
+            return
+        level = self._stack[-1]
+        node = level.get(key)
+        if node is None:
+            node = level[key] = odict()
+        self._last = node
+
+    def begin_block(self) -> None:
+        self._last = None
+
+    def push_block(self, indent: str) -> None:
+        if self.failed:
+            return
+        if not indent or self._last is None:
+            self.failed = True
+            return
+        self._stack.append(self._last)
+        self._last = None
+
+    def pop_block(self) -> None:
+        if self.failed:
+            return
+        self._stack.pop(-1)
+        self._last = None
+
+
 # =====
 class BaseGenerator:
     TYPE: str
     TAGS: list[str] = []
     ALLOW_NONE = False
+    # the generator keeps no per-device state, so one instance serves all the devices
+    # matching the same per_device_property
+    STATELESS = False
     storage: Storage
 
     def supports_device(self, device: Device) -> bool:  # pylint: disable=unused-argument
@@ -87,6 +144,7 @@ class TreeGenerator(BaseGenerator):
         self._rows: list[str] = []
         self._block_path: list[str] = []
         self._indent = indent
+        self._tree_builder: _TreeBuilder | None = None
 
     @tracing.contextmanager(min_duration="0.1")
     @contextlib.contextmanager
@@ -98,10 +156,16 @@ class TreeGenerator(BaseGenerator):
         indent = self._indent if indent is None else indent
         block = " ".join(map(_filter_str, tokens))
         self._block_path.append(block)
+        if self._tree_builder:
+            self._tree_builder.begin_block()
         self._append_text(block)
         self._indents.append(indent)
+        if self._tree_builder:
+            self._tree_builder.push_block(indent)
         yield
         self._indents.pop(-1)
+        if self._tree_builder:
+            self._tree_builder.pop_block()
         self._block_path.pop(-1)
 
     @contextlib.contextmanager
@@ -151,6 +215,8 @@ class TreeGenerator(BaseGenerator):
         for row in _split_and_strip(text):
             if row_cb:
                 row = row_cb(row)
+            if self._tree_builder:
+                self._tree_builder.add_row(row)
             self._rows.append("".join(self._indents) + row)
 
 
@@ -83,6 +83,9 @@ class JSONFragment(TreeGenerator):
             self._config_pointer.pop()
 
     def __call__(self, device: Device, annotate: bool = False) -> dict[str, Any] | list[Any]:
+        # a STATELESS instance is run as a shallow copy, the containers of the run must be its own
+        self._config_pointer = []
+        self._json_config = {}
         try:
             for cfg_fragment in self.run(device):
                 self._set_or_replace_dict(self._config_pointer, cfg_fragment)
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import functools
+from collections import OrderedDict
 from collections.abc import Callable
 from types import GeneratorType
 from typing import Any, Iterable, cast
@@ -8,7 +10,7 @@ from annet.lib import add_annotation, flatten
 from annet.storage import Device, Storage
 
 from .annotate import AbstractAnnotateFormatter, annotate_formatter_connector
-from .base import NONE_SEARCHER, TreeGenerator, _filter_str
+from .base import NONE_SEARCHER, TreeGenerator, _filter_str, _TreeBuilder
 from .exceptions import InvalidValueFromGenerator
 
 
@@ -55,19 +57,36 @@ class PartialGenerator(TreeGenerator):
     # =====
 
     def __call__(self, device: Device, annotate: bool = False) -> str:
+        self._generate(device)
+        return self._render(annotate)
+
+    def _generate(
+        self, device: Device, split_row: Callable[[str], str | None] | None = None
+    ) -> OrderedDict[str, Any] | None:
+        """Runs the generator, the rows are kept to be rendered by _render()
+
+        With split_row given the config tree is built while the rows are generated, so the text
+        doesn't have to be parsed back. Returns None if the tree wasn't built.
+        """
         self._indents = []
         self._rows = []
-
-        running_gen = self.run(device)
-        if running_gen is None:
-            raise InvalidValueFromGenerator("%s.run() returned None" % type(self).__name__)
-        self._running_gen = cast("GeneratorType[str | tuple[Any, ...], None, None]", running_gen)
-        for text in self._running_gen:
-            if isinstance(text, tuple):
-                text = " ".join(map(_filter_str, flatten(text)))
-            else:
-                text = _filter_str(text)
-            self._append_text(text)
+        self._block_path = []
+        self._annotations = []
+        self._tree_builder = _TreeBuilder(split_row) if split_row else None
+
+        try:
+            running_gen = self.run(device)
+            if running_gen is None:
+                raise InvalidValueFromGenerator("%s.run() returned None" % type(self).__name__)
+            self._running_gen = cast("GeneratorType[str | tuple[Any, ...], None, None]", running_gen)
+            for text in self._running_gen:
+                if isinstance(text, tuple):
+                    text = " ".join(map(_filter_str, flatten(text)))
+                else:
+                    text = _filter_str(text)
+                self._append_text(text)
+        finally:
+            tree_builder, self._tree_builder = self._tree_builder, None
 
         if not self.ALLOW_NONE:
             for row, annotation in zip(self._rows, self._annotations):
@@ -76,13 +95,25 @@ class PartialGenerator(TreeGenerator):
                         "Found 'None' in yield result: %s" % add_annotation(row, annotation)
                     )
 
+        if tree_builder is None or tree_builder.failed:
+            return None
+        return tree_builder.tree
+
+    def _render(self, annotate: bool = False) -> str:
         generated_rows: Iterable[str]
         if annotate:
             generated_rows = (add_annotation(x, y) for (x, y) in zip(self._rows, self._annotations))
         else:
             generated_rows = self._rows
 
-        return "\n".join((*generated_rows, ""))
+        return _join_rows(generated_rows)
+
+    def _deferred_render(self) -> Callable[[], str]:
+        """Same as _render() without annotations, but the text is rendered on call
+
+        The rows of the current run are bound, so it survives the next run and pickling.
+        """
+        return functools.partial(_join_rows, self._rows)
 
     def _append_text(self, text: str) -> None:
         def annotation_cb(row: str) -> str:
@@ -102,3 +133,7 @@ class PartialGenerator(TreeGenerator):
 
     def __repr__(self) -> str:
         return "<%s>" % self.__class__.__name__
+
+
+def _join_rows(rows: Iterable[str]) -> str:
+    return "\n".join((*rows, ""))
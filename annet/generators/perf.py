@@ -59,6 +59,9 @@ class GeneratorPerfMesurer:
         assert self._span_ctx is not None
         self._span_ctx.__exit__(exc_type, exc_val, exc_tb)
         rt = self._gen.storage.flush_perf()
+        if self._run_args is not None and self._run_args.gen_threads > 1:
+            # the storage counters are shared by the generators running at the same time
+            rt = None
 
         meta: dict[str, Any] = {}
         if tracing_connector.get().enabled:
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 from collections import OrderedDict as odict
-from collections.abc import Mapping
+from collections.abc import Iterable, Mapping
+from functools import lru_cache
 from typing import TYPE_CHECKING, Any, cast
 
 from annet.annlib.rbparser import syntax
@@ -14,8 +15,14 @@ if TYPE_CHECKING:
 
 def config(config_tree: Mapping[str, Any], rules: Mapping[str, Any]) -> odict[str, Any]:
     implicit_config_tree = odict()
+    index: dict[str, list[str]] | None = None
     for row, rule in rules.items():
-        matched_lines = [line for line in config_tree.keys() if rule["regexp"].match(line)]
+        lines: Iterable[str] = config_tree.keys()
+        if first_token := rule.get("first_token"):
+            if index is None:
+                index = _first_token_index(config_tree)
+            lines = index.get(first_token, ())
+        matched_lines = [line for line in lines if rule["regexp"].match(line)]
         if rule["type"] != "ignore":
             if not any(matched_lines) and row not in config_tree:
                 implicit_config_tree[row] = config(odict(), rule["children"])
@@ -24,23 +31,45 @@ def config(config_tree: Mapping[str, Any], rules: Mapping[str, Any]) -> odict[st
     return implicit_config_tree
 
 
+def _first_token_index(config_tree: Mapping[str, Any]) -> dict[str, list[str]]:
+    index: dict[str, list[str]] = {}
+    for line in config_tree:
+        tokens = line.split(maxsplit=1)
+        if tokens:
+            index.setdefault(tokens[0], []).append(line)
+    return index
+
+
 def compile_rules(device: Device) -> odict[str, Any]:
-    return compile_tree(_implicit_tree(device))
+    # the rules depend on the hardware, the software version and a few device attributes,
+    # all of them end up in the text, so the compiled rules are shared by equal texts
+    return _compile_text(_implicit_text(device))
+
+
+@lru_cache(maxsize=None)
+def _compile_text(text: str) -> odict[str, Any]:
+    return compile_tree(parse_text(text))
 
 
 def compile_tree(tree: odict[Any, Any]) -> odict[str, Any]:
     rules = odict()
     for _, attrs in tree.items():
+        regexp = attrs["params"]["regexp"] or syntax.compile_row_regexp(attrs["row"])
         rule = {
             "type": attrs["type"],
             "children": compile_tree(attrs["children"]) if attrs.get("children") else odict(),
-            "regexp": attrs["params"]["regexp"] or syntax.compile_row_regexp(attrs["row"]),
+            "regexp": regexp,
+            "first_token": syntax.first_literal_token(regexp),
         }
         rules[attrs["row"]] = rule
     return rules
 
 
 def _implicit_tree(device: Device) -> odict[Any, Any]:
+    return parse_text(_implicit_text(device))
+
+
+def _implicit_text(device: Device) -> str:
     text = ""
     if device.hw.Huawei:
         # Docs on different software versions of "S300, S500, S2700, S5700, and S6700" series:
@@ -254,7 +283,7 @@ def _implicit_tree(device: Device) -> odict[Any, Any]:
                 no 160mhz-support
         """
 
-    return parse_text(text)
+    return text
 
 
 def parse_text(text: str) -> odict[Any, Any]:
@@ -118,22 +118,21 @@ class OutputDriverBasic(OutputDriver):
         dest = arg_out.dest
         suggest_dir = arg_out.dest_force_create_dir or os.sep in first_result[0]
         dir_mode = dir_or_file_output(dest, query_result_count, suggest_dir=suggest_dir)
-        _reassembled_items = list(_reassemble_items())
+        is_json = dest is None and hasattr(arg_out, "format") and arg_out.format == "json"
 
-        for output_no, (label, output, is_fail) in enumerate(_reassembled_items):
+        # the items are written as soon as they are produced
+        for output_no, (label, output, is_fail) in enumerate(_reassemble_items()):
             writer = output if isinstance(output, OutputWriter) else OutputWriter(output)
             label = os.path.normpath(label)
             label_color = colorama.Back.RED if is_fail else colorama.Back.GREEN
             if dest is None:
-                if hasattr(arg_out, "format") and arg_out.format == "json":
+                if is_json:
                     if output_no > 0:
                         sys.stdout.write(",")
                     elif output_no == 0:
                         sys.stdout.write("{")
                     sys.stdout.write('"%s": ' % label)
                     writer.write(sys.stdout)
-                    if output_no == len(_reassembled_items) - 1:
-                        sys.stdout.write("}")
                 else:
                     if not arg_out.no_label:
                         print_label(label, back_color=label_color)
@@ -174,6 +173,8 @@ class OutputDriverBasic(OutputDriver):
                 logger.info("writing '%s'", dest)
                 with open(dest, "w") as file:
                     writer.write(file)
+        if is_json:
+            sys.stdout.write("}")
 
     def format_fails(
         self, fail: Mapping[Any, BaseException], fqdns: Optional[Dict[int, str]] = None
@@ -1,22 +1,31 @@
 import asyncio
+import contextlib
+import contextvars
 import dataclasses
 import enum
 import faulthandler
+import heapq
 import inspect
+import io
+import itertools
+import json
+import mmap
 import multiprocessing as mp
 import os
 import pickle
-import platform
-import queue
 import re
 import signal
 import sys
 import tempfile
+import threading
 import time
 import traceback
 import warnings
-from collections.abc import Iterator
-from typing import Any, Callable, List, Optional, Protocol, Type, cast
+from collections import defaultdict, deque
+from collections.abc import Iterable, Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import connection as mp_connection
+from typing import Any, Callable, List, Optional, Protocol, Type, Union, cast
 from uuid import uuid4
 
 from contextlog import get_logger
@@ -24,13 +33,29 @@ from contextlog import get_logger
 import annet
 from annet import tracing
 from annet.connectors import Connector
-from annet.lib import catch_ctrl_c, find_exc_in_stack
+from annet.lib import catch_ctrl_c, find_exc_in_stack, get_context
 from annet.output import capture_output
 from annet.tracing import tracing_connector
 
 
+class ParallelBackend(enum.Enum):
+    PROCESS = "process"  # a pool of worker processes
+    THREAD = "thread"  # a pool of threads sharing caches, processes are used when output is captured
+    INLINE = "inline"  # everything runs in the calling thread
+    ASYNCIO = "asyncio"  # coroutines on an event loop of the calling thread, a plain function runs in threads
+
+
+def get_default_backend() -> ParallelBackend:
+    try:
+        backend = get_context().get("parallel", {}).get("backend")
+    except FileNotFoundError:
+        backend = None
+    return ParallelBackend(backend or ParallelBackend.PROCESS.value)
+
+
 class PoolWorkerTaskType(enum.Enum):
     INVOKE = "invoke"
+    INVOKE_BATCH = "invoke_batch"
     STOP = "stop"
 
 
@@ -89,15 +114,177 @@ class PickleSafeException(Exception):
         )
 
 
+# (worker name, task duration, whether the task ends its batch, results, exception)
+_DoneMessage = tuple[str, float, bool, list["TaskResult"], PickleSafeException | None]
+# (worker name, payloads of the batch taken by the worker)
+_TakenMessage = tuple[str, list[Any]]
+_WorkerMessage = Union[_DoneMessage, _TakenMessage]
+
+
+@dataclasses.dataclass
+class _WorkerBatch:
+    payloads: deque[Any]  # the first one is being processed
+    started: float  # when the worker has started the first payload
+
+
+class _BatchDispatcher:
+    """Feeds the task queues of the workers with batches of payloads.
+
+    The batch size is adapted so that a batch takes about batch_time seconds,
+    which amortizes queue round trips for cheap tasks without hurting the balance
+    of the expensive ones. Every worker has its own queue with a couple of batches
+    at most, so the batches of a worker which is gone are known exactly.
+    """
+
+    BATCHES_PER_WORKER = 2
+
+    def __init__(self, payloads: Iterable[Any], workers: int, max_batch_size: int, batch_time: float) -> None:
+        self._pending = deque(payloads)
+        self._workers = workers
+        self._max_batch_size = max(1, max_batch_size)
+        self._batch_time = batch_time
+        self._avg_duration: float | None = None
+        # the batches sent to the workers and not done yet, the first one is taken first
+        self._sent: dict[str, deque[list[Any]]] = defaultdict(deque)
+
+    @property
+    def exhausted(self) -> bool:
+        return not self._pending
+
+    @property
+    def outstanding(self) -> int:
+        return sum(map(len, self._sent.values()))
+
+    @property
+    def idle(self) -> bool:
+        """Everything has been dispatched and all the batches are done"""
+        return not self._pending and not self.outstanding
+
+    def retry(self, payloads: Iterable[Any]) -> None:
+        self._pending.extendleft(reversed(list(payloads)))
+
+    def observe(self, duration: float) -> None:
+        if self._avg_duration is None:
+            self._avg_duration = duration
+        else:
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+
+    def current_batch(self, worker_name: str) -> list[Any]:
+        """The batch the worker takes next or has taken last"""
+        return self._sent[worker_name][0]
+
+    def batch_done(self, worker_name: str) -> None:
+        if self._sent[worker_name]:
+            self._sent[worker_name].popleft()
+
+    def worker_lost(self, worker_name: str) -> list[list[Any]]:
+        """Forget the batches sent to a worker which is gone and return them"""
+        return list(self._sent.pop(worker_name, ()))
+
+    def batch_size(self) -> int:
+        if self._avg_duration is None:
+            return 1
+        size = int(self._batch_time / max(self._avg_duration, 1e-6))
+        # leave enough batches for every worker till the end of the run
+        size = min(size, len(self._pending) // (2 * self._workers))
+        return max(1, min(size, self._max_batch_size))
+
+    def feed(self, task_queues: "Mapping[str, mp.Queue[PoolWorkerTask]]", max_outstanding: int | None = None) -> None:
+        if max_outstanding is None:
+            max_outstanding = self.BATCHES_PER_WORKER * self._workers
+        outstanding = self.outstanding
+        while self._pending and outstanding < max_outstanding:
+            name = min(task_queues, key=lambda name: len(self._sent[name]), default=None)
+            if name is None or len(self._sent[name]) >= self.BATCHES_PER_WORKER:
+                break
+            size = self.batch_size()
+            batch = [self._pending.popleft() for _ in range(min(size, len(self._pending)))]
+            task_queues[name].put(PoolWorkerTask(type=PoolWorkerTaskType.INVOKE_BATCH, payload=batch))
+            self._sent[name].append(batch)
+            outstanding += 1
+
+
+class _ResultChannel:
+    """A one-way pipe from a worker to the parent.
+
+    Unlike mp.Queue it exposes the reading end, so the parent can wait for results and
+    for workers exits at once with multiprocessing.connection.wait().
+    Every worker has its own channel, so a worker killed while sending a message
+    can't leave a lock held or a truncated message to the others.
+    """
+
+    def __init__(self) -> None:
+        self.reader, self._writer = mp.Pipe(duplex=False)
+
+    def put(self, message: _WorkerMessage) -> None:
+        self._writer.send_bytes(pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def detach_writer(self) -> None:
+        """Close the writing end in the parent once the worker has been started
+
+        Then the reader gets EOF when the worker exits instead of waiting for the rest of a truncated message.
+        """
+        self._writer.close()
+
+    def get_all(self) -> list[_WorkerMessage]:
+        messages = []
+        try:
+            while self.reader.poll():
+                messages.append(cast(_WorkerMessage, pickle.loads(self.reader.recv_bytes())))
+        except (EOFError, OSError):
+            # the worker has exited, possibly amid a message
+            pass
+        return messages
+
+    def close(self) -> None:
+        self.reader.close()
+        if not self._writer.closed:
+            self._writer.close()
+
+
+_retirement_requested = False
+
+# TaskResult.extra of the task being run, see add_task_extra()
+_current_task_extra: contextvars.ContextVar[dict[str, Any] | None] = contextvars.ContextVar(
+    "_current_task_extra", default=None
+)
+
+
+def add_task_extra(key: str, value: Any) -> None:
+    """Append a value to extra[key] of the TaskResult of the task being run
+
+    This way a task passes data to the pool callbacks in the main process besides its result.
+    Does nothing outside of a Parallel task.
+    """
+    extra = _current_task_extra.get()
+    if extra is not None:
+        extra.setdefault(key, []).append(value)
+
+
+@contextlib.contextmanager
+def _collecting_task_extra(task_result: "TaskResult") -> Iterator[None]:
+    token = _current_task_extra.set(task_result.extra)
+    try:
+        yield
+    finally:
+        _current_task_extra.reset(token)
+
+
+def _request_retirement(signum: int, frame: Any) -> None:  # pylint: disable=unused-argument
+    global _retirement_requested  # pylint: disable=global-statement
+    _retirement_requested = True
+
+
 @catch_ctrl_c
 def pool_worker(
     pool: "Parallel",
     index: int,
     task_queue: "mp.Queue[PoolWorkerTask]",
-    done_queue: "mp.Queue[tuple[str, PoolWorkerTask, list[TaskResult], PickleSafeException | None]]",
+    done_channel: _ResultChannel,
     context_carrier: dict[str, str],
 ) -> None:
     faulthandler.register(signal.SIGUSR1)
+    signal.signal(signal.SIGUSR2, _request_retirement)
 
     tracing_connector.get().attach_context(tracing_connector.get().extract_context(context_carrier))
 
@@ -109,7 +296,11 @@ def pool_worker(
             pass
         asyncio.set_event_loop(asyncio.new_event_loop())
 
-    return _pool_worker(pool, index, task_queue, done_queue)
+    if mp.get_start_method() != "fork":
+        # forked workers inherit the caches warmed up by the parent in irun()
+        pool._run_preloads()  # pylint: disable=protected-access
+
+    return _pool_worker(pool, index, task_queue, done_channel)
 
 
 @tracing.function(flush=True)
@@ -117,7 +308,7 @@ def _pool_worker(
     pool: "Parallel",
     index: int,
     task_queue: "mp.Queue[PoolWorkerTask]",
-    done_queue: "mp.Queue[tuple[str, PoolWorkerTask, list[TaskResult], PickleSafeException | None]]",
+    done_channel: _ResultChannel,
 ) -> None:
     worker_id = uuid4().hex
 
@@ -132,7 +323,7 @@ def _pool_worker(
 
     _logger = get_logger()
     tasks_done = 0
-    device_ids = []
+    device_ids: list[str] = []
     worker_name = mp.current_process().name
 
     while True:
@@ -141,73 +332,347 @@ def _pool_worker(
             _logger.debug("I received STOP, terminating...")
             return
 
-        device_id: Optional[str] = None
-        if isinstance(task.payload, tuple):
-            if len(task.payload) > 0:
-                match = re.search(r"([^/]+).cfg", task.payload[0])
-                if match:
-                    device_id = match.group(1)
+        if task.type == PoolWorkerTaskType.INVOKE_BATCH:
+            payloads = cast("list[Any]", task.payload)
         else:
-            device_id = str(task.payload)
+            payloads = [task.payload]
+        # let the parent know what the worker is busy with to watch the devices deadlines
+        done_channel.put((worker_name, payloads))
+        for num, payload in enumerate(payloads):
+            device_id = _payload_device_id(payload)
+            if device_id:
+                device_ids.append(device_id)
+
+            if pool_span:
+                pool_span.set_attribute("device.ids", device_ids)
+
+            task_result, ret_exc = _invoke_payload(
+                pool, index, worker_id, worker_name, payload, device_id, cap_stdout, cap_stderr
+            )
+            duration = task_result.extra["duration"]
+            results = list(pool._run_callbacks(task_result, in_thread=True))  # pylint: disable=protected-access
+            for result in results:
+                ret_exc = _defer_result(pool, result) or ret_exc
+            done_channel.put((worker_name, duration, num == len(payloads) - 1, results, ret_exc))
+            tasks_done += 1
 
-        if device_id:
-            device_ids.append(device_id)
+        if pool.max_tasks and tasks_done >= pool.max_tasks:
+            _logger.debug("Maximum tasks limit reached. Now I can retire")
+            tracing_connector.get().force_flush()
+            sys.exit(9)
+        if pool.max_worker_rss and (rss := get_rss()) is not None and rss >= pool.max_worker_rss * 2**20:
+            _logger.debug("RSS %d MiB exceeds the limit of %d MiB. Now I can retire", rss // 2**20, pool.max_worker_rss)
+            tracing_connector.get().force_flush()
+            sys.exit(9)
+        if _retirement_requested:
+            _logger.debug("The parent has asked me to free memory. Now I can retire")
+            tracing_connector.get().force_flush()
+            sys.exit(9)
 
-        if pool_span:
-            pool_span.set_attribute("device.ids", device_ids)
 
-        task_result = TaskResult(worker_name, task.payload)
-        task_result.extra["start_time"] = time.monotonic()
-        ret_exc = None
+def _payload_device_id(payload: Any) -> Optional[str]:
+    if isinstance(payload, tuple):
+        if len(payload) > 0:
+            match = re.search(r"([^/]+).cfg", payload[0])
+            if match:
+                return match.group(1)
+        return None
+    return str(payload)
 
-        try:
-            with tracing_connector.get().start_as_current_span(
-                "pool_worker.invoke",
-            ) as span:
+
+def _invoke_payload(
+    pool: "Parallel",
+    index: int,
+    worker_id: str,
+    worker_name: str,
+    payload: Any,
+    device_id: Optional[str],
+    cap_stdout: Optional[io.IOBase],
+    cap_stderr: Optional[io.IOBase],
+) -> tuple["TaskResult", PickleSafeException | None]:
+    _logger = get_logger()
+    task_result = TaskResult(worker_name, payload)
+    task_result.extra["start_time"] = time.monotonic()
+    ret_exc = None
+
+    try:
+        with tracing_connector.get().start_as_current_span(
+            "pool_worker.invoke",
+        ) as span:
+            if device_id:
+                span.set_attribute("device.id", device_id)
+
+            name = "invoke"
+            invoke_span_ctx = tracing_connector.get().start_as_linked_span(name, tracer_name=__name__)
+            capture_output_ctx = capture_output(cap_stdout, cap_stderr)
+
+            with invoke_span_ctx as invoke_span, capture_output_ctx as _, _collecting_task_extra(task_result):
+                invoke_span.set_attribute("func", pool.func.__name__)
+                invoke_span.set_attribute("worker.id", worker_id)
                 if device_id:
-                    span.set_attribute("device.id", device_id)
-
-                name = "invoke"
-                invoke_span_ctx = tracing_connector.get().start_as_linked_span(name, tracer_name=__name__)
-                capture_output_ctx = capture_output(cap_stdout, cap_stderr)
-
-                with invoke_span_ctx as invoke_span, capture_output_ctx as _:
-                    invoke_span.set_attribute("func", pool.func.__name__)
-                    invoke_span.set_attribute("worker.id", worker_id)
-                    if device_id:
-                        invoke_span.set_attribute("device.id", device_id)
-
-                    _logger.warning("Worker-%d start invoke %s", index, device_id)
-                    task_result.result = invoke_retry(
-                        pool.func, pool.net_retry, task.payload, *pool.args, **pool.kwargs
-                    )
-                    _logger.warning("Worker-%d finish invoke %s", index, device_id)
-
-                    # Check if the result is picklable and throw an exception if not.
-                    # Otherwise the exception will be thrown inside the multiprocessing
-                    # code and we won't be able to handle it.
-                    pickle.dumps(task_result.result)
-        except KeyboardInterrupt:  # pylint: disable=try-except-raise
+                    invoke_span.set_attribute("device.id", device_id)
+
+                _logger.warning("Worker-%d start invoke %s", index, device_id)
+                task_result.result = invoke_retry(pool.func, pool.net_retry, payload, *pool.args, **pool.kwargs)
+                _logger.warning("Worker-%d finish invoke %s", index, device_id)
+    except KeyboardInterrupt:  # pylint: disable=try-except-raise
+        raise
+    except Exception as exc:
+        safe_exc = PickleSafeException.from_exc(exc, str(payload))
+        ret_exc = safe_exc
+        task_result.exc = safe_exc
+        task_result.result = None
+    task_result.extra["duration"] = time.monotonic() - task_result.extra["start_time"]
+    if pool.capture_output:
+        assert cap_stdout is not None
+        assert cap_stderr is not None
+        task_result.extra["cap_stdout"] = cap_stdout.read()
+        task_result.extra["cap_stderr"] = cap_stderr.read()
+    return task_result, ret_exc
+
+
+def _defer_result(pool: "Parallel", task_result: "TaskResult") -> PickleSafeException | None:
+    """Serialize the result of a task for the parent to deserialize it on demand
+
+    It is done here to throw an exception if the result is not picklable.
+    Otherwise the exception will be thrown inside the multiprocessing
+    code and we won't be able to handle it.
+    """
+    if task_result.exc is not None:
+        return None
+    try:
+        data = pickle.dumps(task_result.result, protocol=pickle.HIGHEST_PROTOCOL)
+        if pool._spill_dir and len(data) >= pool.spill_threshold:  # pylint: disable=protected-access
+            task_result.result = _SpilledResult.spill(data, pool._spill_dir)  # pylint: disable=protected-access
+        else:
+            task_result.result = _PickledResult(data)
+    except Exception as exc:
+        safe_exc = PickleSafeException.from_exc(exc, str(task_result.device_id))
+        task_result.exc = safe_exc
+        task_result.result = None
+        return safe_exc
+    return None
+
+
+def get_rss(pid: int | str = "self") -> int | None:
+    """Return the resident set size of a process in bytes or None if it can not be determined"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class _MemoryWatcher:
+    """Keeps the total RSS of the workers within a budget.
+
+    When the budget is exceeded, the fattest worker is asked to retire after its batch
+    and is replaced with a fresh one. Only the workers which have taken a batch are asked:
+    a just started worker may not have installed the SIGUSR2 handler yet and would be killed.
+    """
+
+    def __init__(self, budget: int) -> None:
+        self.budget = budget  # bytes
+        self.peak_rss: dict[str, int] = {}
+        self._ready: set[str] = set()
+        self._recycling: set[str] = set()
+
+    def check(self, pool: dict[str, "mp.Process"]) -> bool:
+        """Return whether the workers fit into the budget"""
+        rss = {}
+        for name, worker in pool.items():
+            if worker.pid is None or worker.exitcode is not None:
+                continue
+            if (worker_rss := get_rss(worker.pid)) is not None:
+                rss[name] = worker_rss
+                self.peak_rss[name] = max(self.peak_rss.get(name, 0), worker_rss)
+        total = sum(rss.values())
+        if total <= self.budget:
+            return True
+
+        candidates = {
+            name: worker_rss for name, worker_rss in rss.items() if name in self._ready and name not in self._recycling
+        }
+        if candidates:
+            fattest = max(candidates, key=lambda name: candidates[name])
+            get_logger().warning(
+                "Workers RSS %d MiB exceeds the budget of %d MiB, recycling '%s' (%d MiB)",
+                total // 2**20,
+                self.budget // 2**20,
+                fattest,
+                candidates[fattest] // 2**20,
+            )
+            os.kill(cast(int, pool[fattest].pid), signal.SIGUSR2)
+            self._recycling.add(fattest)
+        return False
+
+    def ready(self, name: str) -> None:
+        self._ready.add(name)
+
+    def retired(self, name: str) -> None:
+        """The worker has exited and is going to be replaced with a new one"""
+        self._ready.discard(name)
+        self._recycling.discard(name)
+
+    def report(self) -> str:
+        return "peak workers RSS: " + ", ".join(
+            "%s %d MiB" % (name, self.peak_rss[name] // 2**20) for name in sorted(self.peak_rss)
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class MakespanReport:
+    workers: int
+    devices: int
+    predicted: float | None  # None if nothing is known about the devices
+    actual: float
+    total: float  # sum of the devices durations
+
+    def __str__(self) -> str:
+        predicted = "unknown" if self.predicted is None else "%.2fs" % self.predicted
+        return "makespan: predicted %s, actual %.2fs, ideal %.2fs (%d devices, %d workers)" % (
+            predicted,
+            self.actual,
+            self.total / self.workers,
+            self.devices,
+            self.workers,
+        )
+
+
+class DurationHistory:
+    """Persistent per-device task durations.
+
+    Used to schedule the devices longest-expected-first (LPT), so that a few heavy
+    devices picked up last do not dominate the tail of a run. Durations of a device
+    are kept separately for every task function (gen, diff, patch, ...).
+    """
+
+    VERSION = 1
+    SMOOTHING = 0.5  # weight of the latest observation
+
+    def __init__(self, path: str, namespace: str) -> None:
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.namespace = namespace
+        self._durations: dict[str, dict[str, float]] = {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self._durations = data["durations"]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, AttributeError) as exc:
+            get_logger().warning("ignoring broken durations history %s: %r", self.path, exc)
+
+    @staticmethod
+    def _key(device_id: Any) -> str:
+        return repr(device_id)
+
+    def expected(self, device_id: Any) -> float | None:
+        return self._durations.get(self.namespace, {}).get(self._key(device_id))
+
+    def _expected_or_mean(self, device_ids: list[Any]) -> list[float] | None:
+        known = [self.expected(device_id) for device_id in device_ids]
+        known_durations = [duration for duration in known if duration is not None]
+        if not known_durations:
+            return None
+        mean = sum(known_durations) / len(known_durations)
+        return [mean if duration is None else duration for duration in known]
+
+    def schedule(self, device_ids: list[Any]) -> list[Any]:
+        """Order devices longest-expected-first, unknown ones are expected to take the mean time"""
+        expected = self._expected_or_mean(device_ids)
+        if expected is None:
+            return list(device_ids)
+        order = sorted(range(len(device_ids)), key=lambda i: expected[i], reverse=True)
+        return [device_ids[i] for i in order]
+
+    def predict_makespan(self, device_ids: list[Any], workers: int) -> float | None:
+        """Simulate greedy dispatch of the devices in the given order"""
+        expected = self._expected_or_mean(device_ids)
+        if expected is None:
+            return None
+        finish_times = [0.0] * workers
+        heapq.heapify(finish_times)
+        for duration in expected:
+            heapq.heappush(finish_times, heapq.heappop(finish_times) + duration)
+        return max(finish_times)
+
+    def update(self, durations: dict[Any, float]) -> None:
+        namespace = self._durations.setdefault(self.namespace, {})
+        for device_id, duration in durations.items():
+            key = self._key(device_id)
+            if key in namespace:
+                duration = self.SMOOTHING * duration + (1 - self.SMOOTHING) * namespace[key]
+            namespace[key] = duration
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": self.VERSION, "durations": self._durations}, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
             raise
-        except Exception as exc:
-            safe_exc = PickleSafeException.from_exc(exc, str(task.payload))
-            ret_exc = safe_exc
-            task_result.exc = safe_exc
-            task_result.result = None
-        if pool.capture_output:
-            assert cap_stdout is not None
-            assert cap_stderr is not None
-            task_result.extra["cap_stdout"] = cap_stdout.read()
-            task_result.extra["cap_stderr"] = cap_stderr.read()
-
-        results = list(pool._run_callbacks(task_result, in_thread=True))  # pylint: disable=protected-access
-        done_queue.put((worker_name, task, results, ret_exc))
-
-        tasks_done += 1
-        if pool.max_tasks and tasks_done >= pool.max_tasks:
-            _logger.debug("Maximum tasks limit reached. Now I can retire")
-            tracing_connector.get().force_flush()
-            sys.exit(9)
+
+
+class _DeferredResult:
+    """A task result serialized by a worker, it is deserialized on the first access to TaskResult.result"""
+
+    def load(self) -> Any:
+        raise NotImplementedError
+
+
+class _PickledResult(_DeferredResult):
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    def load(self) -> Any:
+        return pickle.loads(self.data)
+
+
+class _SpilledResult(_DeferredResult):
+    """A large result written to a file by a worker, only the file path travels over the result pipe"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file: io.BufferedReader | None = None
+
+    @classmethod
+    def spill(cls, data: bytes, directory: str) -> "_SpilledResult":
+        fd, path = tempfile.mkstemp(dir=directory, suffix=".pickle")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return cls(path)
+
+    def _take_file(self) -> io.BufferedReader:
+        # the data lives as long as the file is open, so it is gone with the last reference to the result
+        f = open(self.path, "rb")
+        os.unlink(self.path)
+        return f
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.path = state["path"]
+        self._file = self._take_file()
+
+    def load(self) -> Any:
+        f = self._file or self._take_file()
+        self._file = None
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return pickle.loads(data)
+
+
+def _spill_root() -> str | None:
+    # prefer memory-backed storage for spilled results
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return None
 
 
 class TaskResult:
@@ -220,10 +685,20 @@ class TaskResult:
     ) -> None:
         self.worker_name = worker_name
         self.device_id = device_id
-        self.result = result
+        self._result = result
         self.exc = exc
         self.extra: dict[str, Any] = {}
 
+    @property
+    def result(self) -> Any:
+        if isinstance(self._result, _DeferredResult):
+            self._result = self._result.load()
+        return self._result
+
+    @result.setter
+    def result(self, value: Any) -> None:
+        self._result = value
+
     def __repr__(self) -> str:
         return "TaskResult(worker_name=%s, device_id=%s, result=%s, exc=%s, extra=%s)" % (
             self.worker_name,
@@ -241,12 +716,28 @@ class Parallel:
         self.kwargs = kwargs
         self.callbacks: list[Callable[..., Any]] = []
         self.in_thread_callbacks: list[Callable[..., Any]] = []
+        self.preloads: list[Callable[..., Any]] = []
+        self.finalizers: list[Callable[..., Any]] = []
         self.parallel = mp.cpu_count()
+        self.parallel_backend: str | None = None  # one of ParallelBackend values, the context's one when not set
         self.task_timeout = 1800  # maximum seconds to wait for next task done
-        self.max_tasks = 25
+        self.device_timeout: float | None = None  # seconds, a worker stuck on a device longer is replaced
+        self.device_timeout_retries = 0  # times to retry a device which has timed out before failing it
+        self.max_idle_crashes = 3  # crashes in a row of a worker without taking a batch before the run fails
+        self.max_tasks: int | None = None
+        self.max_worker_rss: int | None = None  # MiB, a worker retires after a task when exceeded
+        self.memory_budget: int | None = None  # MiB for all the workers, limits the pool size and dispatching
+        self.memory_check_interval = 1.0  # seconds between checks of the workers RSS against the budget
+        self.peak_rss: dict[str, int] = {}  # bytes, per worker of the last run when memory_budget is set
+        self.max_batch_size = 32  # maximum devices sent to a worker at once, 1 disables batching
+        self.batch_time = 0.5  # desired seconds of work in a batch
+        self.duration_history = ""  # a file to keep devices durations in for longest-expected-first scheduling
+        self.makespan_report: MakespanReport | None = None
         self.tasks_done = 0
         self.net_retry = 3
         self.capture_output = False
+        self.spill_threshold = 2**20  # bytes, larger results of worker processes are passed through a file
+        self._spill_dir: str | None = None
 
     def tune(self, **kwargs: Any) -> "Parallel":
         for kw, arg in kwargs.items():
@@ -271,6 +762,34 @@ class Parallel:
             self.callbacks.append(func)
         return self
 
+    # func prototype: func(parallel_object)
+    def add_preload(self, func: Callable[..., Any]) -> "Parallel":
+        """Add a function warming up caches (rulebooks, compiled acls, ...) before workers take tasks.
+
+        With the fork start method it runs once in the parent and workers inherit its results,
+        otherwise every worker runs it on start.
+        """
+        if not callable(func):
+            raise annet.ExecError("preload must be a callable object or function")
+        self.preloads.append(func)
+        return self
+
+    def _run_preloads(self) -> None:
+        for preload in self.preloads:
+            preload(self)
+
+    # func prototype: func(parallel_object)
+    def add_finalizer(self, func: Callable[..., Any]) -> "Parallel":
+        """Add a function to run in the main process once all the tasks of a run are done"""
+        if not callable(func):
+            raise annet.ExecError("finalizer must be a callable object or function")
+        self.finalizers.append(func)
+        return self
+
+    def _run_finalizers(self) -> None:
+        for finalizer in self.finalizers:
+            finalizer(self)
+
     def _run_callbacks(self, task_result: TaskResult, in_thread: bool = False) -> Iterator[TaskResult]:
         task_results = [task_result]
         cbs = self.in_thread_callbacks if in_thread else self.callbacks
@@ -317,6 +836,38 @@ class Parallel:
         return success, fail
 
     def irun(self, device_ids: list[Any], tolerate_fails: bool = True) -> Iterator[TaskResult]:
+        yield from self._irun_history(device_ids, tolerate_fails)
+        self._run_finalizers()
+
+    def _irun_history(self, device_ids: list[Any], tolerate_fails: bool) -> Iterator[TaskResult]:
+        if not self.duration_history:
+            yield from self._irun(device_ids, tolerate_fails)
+            return
+
+        history = DurationHistory(self.duration_history, "%s.%s" % (self.func.__module__, self.func.__name__))
+        device_ids = history.schedule(device_ids)
+        workers = max(1, min(self.parallel, len(device_ids)))
+        predicted = history.predict_makespan(device_ids, workers)
+        observed: dict[Any, float] = {}
+        start = time.monotonic()
+        for task_result in self._irun(device_ids, tolerate_fails):
+            if "duration" in task_result.extra:
+                observed[task_result.device_id] = task_result.extra["duration"]
+            yield task_result
+        actual = time.monotonic() - start
+
+        self.makespan_report = MakespanReport(
+            workers=workers,
+            devices=len(device_ids),
+            predicted=predicted,
+            actual=actual,
+            total=sum(observed.values()),
+        )
+        get_logger().info("%s", self.makespan_report)
+        history.update(observed)
+        history.save()
+
+    def _irun(self, device_ids: list[Any], tolerate_fails: bool) -> Iterator[TaskResult]:
         _logger = get_logger()
         self.tasks_done = 0
         pool_size = self.parallel if len(device_ids) > self.parallel else len(device_ids)
@@ -325,8 +876,16 @@ class Parallel:
         if span:
             span.set_attribute("pool_size", pool_size)
 
+        backend = ParallelBackend(self.parallel_backend) if self.parallel_backend else get_default_backend()
+        if backend in (ParallelBackend.THREAD, ParallelBackend.ASYNCIO) and self.capture_output and pool_size > 1:
+            # sys.stdout and sys.stderr are shared by the threads, so the output of a task can't be told apart
+            _logger.warning("output capturing is not supported by the %s backend, using processes", backend.value)
+            backend = ParallelBackend.PROCESS
+        if pool_size == 1 or backend != ParallelBackend.PROCESS or mp.get_start_method() == "fork":
+            self._run_preloads()
+
         # single process way
-        if pool_size == 1:
+        if pool_size <= 1 or backend == ParallelBackend.INLINE:
             cap_stdout = tempfile.TemporaryFile(mode="w+") if self.capture_output else None
             cap_stderr = tempfile.TemporaryFile(mode="w+") if self.capture_output else None
             worker_name = mp.current_process().name
@@ -335,7 +894,7 @@ class Parallel:
                 task_result = TaskResult(worker_name, device_id)
                 task_result.extra["start_time"] = time.monotonic()
                 try:
-                    with capture_output(cap_stdout, cap_stderr):
+                    with capture_output(cap_stdout, cap_stderr), _collecting_task_extra(task_result):
                         task_result.result = invoke_retry(
                             self.func, self.net_retry, device_id, *self.args, **self.kwargs
                         )
@@ -344,6 +903,7 @@ class Parallel:
                     if not tolerate_fails:
                         raise safe_exc
                     task_result.exc = safe_exc
+                task_result.extra["duration"] = time.monotonic() - task_result.extra["start_time"]
                 if self.capture_output:
                     assert cap_stdout is not None
                     assert cap_stderr is not None
@@ -356,97 +916,322 @@ class Parallel:
                     for in_thread_result in self._run_callbacks(task_result, in_thread=True)
                     for result in self._run_callbacks(in_thread_result)
                 ]
+        elif backend == ParallelBackend.THREAD:
+            _logger.info("creating thread pool with %d workers", pool_size)
+            yield from self._irun_threads(device_ids, pool_size, tolerate_fails)
+        elif backend == ParallelBackend.ASYNCIO:
+            _logger.info("creating event loop with %d concurrent tasks", pool_size)
+            yield from self._irun_asyncio(device_ids, pool_size, tolerate_fails)
         else:
             # multiple processes way
+            memory: _MemoryWatcher | None = None
+            if self.memory_budget:
+                memory = _MemoryWatcher(self.memory_budget * 2**20)
+                # a worker starts as big as the parent is
+                if base_rss := get_rss():
+                    pool_size = max(1, min(pool_size, memory.budget // base_rss))
             _logger.info("creating process pool with %d workers", pool_size)
-            task_queue: mp.Queue[PoolWorkerTask] = mp.Queue()
-            done_queue: mp.Queue[tuple[str, PoolWorkerTask, list[TaskResult], PickleSafeException | None]] = mp.Queue()
-            for device_id in device_ids:
-                task_queue.put(PoolWorkerTask(type=PoolWorkerTaskType.INVOKE, payload=device_id))
+            dispatcher = _BatchDispatcher(device_ids, pool_size, self.max_batch_size, self.batch_time)
 
             context_carrier: dict[str, str] = {}
             tracing_connector.get().inject_context(context_carrier)
 
-            pool = {}
-            for index in range(pool_size):
-                task_queue.put(PoolWorkerTask(type=PoolWorkerTaskType.STOP))
-                worker_name = "Worker-%d" % index
-                worker_args = (self, index, task_queue, done_queue, context_carrier)
-
-                worker = mp.Process(name=worker_name, target=pool_worker, args=worker_args)
-                pool[worker_name] = worker
-                worker.start()
-                _logger.debug("Worker '%s' has been created with PID %d", worker_name, worker.pid)
-
-            last_task_ts = time.monotonic()
-            while True:
-                worker_exc: PickleSafeException | None = None
-                worker_name = None
-                in_thread_results = None
-
-                queue_empty = False
-                try:
-                    worker_name, _, in_thread_results, worker_exc = done_queue.get(True, 1)
-                    last_task_ts = time.monotonic()
-                except queue.Empty:
-                    queue_empty = True
-
-                retired_workers, failed_workers = self._check_children(pool)
-
-                terminate_by_timeout = False
-                terminate_exc: Exception | None = None
-                if queue_empty:
-                    if time.monotonic() - last_task_ts > self.task_timeout:
-                        # timeout hit
-                        terminate_by_timeout = True
-                        terminate_exc = annet.ExecError()
-
-                if not tolerate_fails:
-                    if worker_exc is not None:
-                        # worker returned exception
-                        terminate_exc = worker_exc
-                    elif failed_workers:
+            pool: dict[str, mp.Process] = {}
+            workers_index: dict[str, int] = {}
+            task_queues: dict[str, mp.Queue[PoolWorkerTask]] = {}
+            done_channels: dict[str, _ResultChannel] = {}
+            stop_sent = False
+
+            spill_dir = tempfile.TemporaryDirectory(prefix="annet-results-", dir=_spill_root())
+            self._spill_dir = spill_dir.name
+            try:
+
+                def start_worker(name: str, new_queue: bool = False) -> None:
+                    # the queue of a worker which is gone amid a get() may be left locked
+                    if new_queue or name not in task_queues:
+                        if old_queue := task_queues.pop(name, None):
+                            old_queue.cancel_join_thread()
+                            old_queue.close()
+                        task_queues[name] = mp.Queue()
+                        if stop_sent:
+                            task_queues[name].put(PoolWorkerTask(type=PoolWorkerTaskType.STOP))
+                    done_channel = _ResultChannel()
+                    args = (self, workers_index[name], task_queues[name], done_channel, context_carrier)
+                    pool[name] = mp.Process(name=name, target=pool_worker, args=args)
+                    pool[name].start()
+                    done_channel.detach_writer()
+                    done_channels[name] = done_channel
+
+                for index in range(pool_size):
+                    worker_name = "Worker-%d" % index
+                    workers_index[worker_name] = index
+                    start_worker(worker_name)
+                    _logger.debug("Worker '%s' has been created with PID %d", worker_name, pool[worker_name].pid)
+                dispatcher.feed(task_queues)
+
+                in_flight: dict[str, _WorkerBatch] = {}
+                timeouts: dict[Any, int] = {}
+                # crashes of the workers in a row without taking a batch
+                idle_crashes: dict[str, int] = {}
+                last_task_ts = time.monotonic()
+                while True:
+                    if dispatcher.idle and not stop_sent:
+                        for task_queue in task_queues.values():
+                            task_queue.put(PoolWorkerTask(type=PoolWorkerTaskType.STOP))
+                        stop_sent = True
+
+                    # wake up as soon as there is a result, some worker has exited or a device deadline has come
+                    timeout = max(0.0, self.task_timeout - (time.monotonic() - last_task_ts))
+                    if self.device_timeout and in_flight:
+                        deadline = min(batch.started for batch in in_flight.values()) + self.device_timeout
+                        timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+                    if memory is not None:
+                        timeout = min(timeout, self.memory_check_interval)
+                    waitables: list[Any] = [
+                        *(done_channel.reader for done_channel in done_channels.values()),
+                        *(worker.sentinel for worker in pool.values()),
+                    ]
+                    ready = mp_connection.wait(waitables, timeout)
+
+                    retired_workers, failed_workers = self._check_children(pool)
+                    # a worker writes its results before exiting, so results of the reaped ones are already in the pipe
+                    messages = []
+                    for name, done_channel in list(done_channels.items()):
+                        messages.extend(done_channel.get_all())
+                        if name not in pool or pool[name].exitcode is not None:
+                            del done_channels[name]
+                            done_channel.close()
+
+                    for message in messages:
+                        if len(message) == 2:
+                            worker_name, _ = message
+                            # the worker takes the batches of its queue in order
+                            in_flight[worker_name] = _WorkerBatch(
+                                deque(dispatcher.current_batch(worker_name)), time.monotonic()
+                            )
+                            idle_crashes.pop(worker_name, None)
+                            if memory is not None:
+                                memory.ready(worker_name)
+                            continue
+
+                        worker_name, duration, batch_done, in_thread_results, worker_exc = message
+                        last_task_ts = time.monotonic()
+                        if batch := in_flight.get(worker_name):
+                            batch.payloads.popleft()
+                            batch.started = last_task_ts
+                            if not batch.payloads:
+                                del in_flight[worker_name]
+                        dispatcher.observe(duration)
+                        if batch_done:
+                            dispatcher.batch_done(worker_name)
+                        if worker_exc is not None and not tolerate_fails:
+                            # worker returned exception
+                            self._terminate_pool(pool, dump_stacks=False)
+                            raise worker_exc
+
+                        self.tasks_done += 1
+                        _logger.debug("Got a result from worker '%s'", worker_name)
+                        yield from [
+                            result
+                            for in_thread_result in in_thread_results
+                            for result in self._run_callbacks(in_thread_result)
+                        ]
+
+                    if failed_workers and not tolerate_fails:
                         # some workers exited with non-zero (and non-9) code
-                        terminate_exc = annet.ExecError(f"Workers {failed_workers} exited with error")
-
-                if terminate_exc is not None:
-                    for name, worker in pool.items():
-                        if worker.exitcode is None:
-                            if terminate_by_timeout:
-                                assert worker.pid is not None
-                                os.kill(worker.pid, signal.SIGUSR1)  # force dump stacktrace
-                                time.sleep(10)
-                            worker.terminate()
-                            _logger.warning("Worker '%s' (PID: %d) has been terminated", name, worker.pid)
-                        worker.join()
-                    raise terminate_exc
-
-                if not queue_empty:
-                    self.tasks_done += 1
-
-                    qsize = "unknown"
-                    if platform.system() != "Darwin":
-                        # Not implemented for macOS
-                        qsize = str(done_queue.qsize())
-
-                    _logger.debug("Got a result from worker '%s', qsize is %s", worker_name, qsize)
+                        self._terminate_pool(pool, dump_stacks=False)
+                        raise annet.ExecError(f"Workers {failed_workers} exited with error")
+                    for name in failed_workers:
+                        _logger.debug("Worker '%s' has crashed. Restart it", name)
+                        if memory is not None:
+                            memory.retired(name)
+                        # the batches sent to the worker will never be done, including the ones
+                        # it has taken without telling. The device it was running is failed,
+                        # the rest is given to other workers
+                        lost = dispatcher.worker_lost(name)
+                        batch = in_flight.pop(name, None)
+                        if batch is not None:
+                            lost[0] = list(batch.payloads)
+                            payload = lost[0].pop(0)
+                        else:
+                            idle_crashes[name] = idle_crashes.get(name, 0) + 1
+                            if idle_crashes[name] > self.max_idle_crashes:
+                                self._terminate_pool(pool, dump_stacks=False)
+                                raise annet.ExecError(f"Worker {name} keeps crashing without running a task")
+                        dispatcher.retry(itertools.chain.from_iterable(lost))
+                        start_worker(name, new_queue=True)
+                        if batch is None:
+                            continue
+                        crash_exc = PickleSafeException.from_exc(
+                            annet.ExecError(f"Worker {name} exited with error"), str(payload)
+                        )
+                        self.tasks_done += 1
+                        yield from self._run_callbacks(TaskResult(name, payload, exc=crash_exc))
+                    if not ready and time.monotonic() - last_task_ts >= self.task_timeout:
+                        # timeout hit
+                        self._terminate_pool(pool, dump_stacks=True)
+                        raise annet.ExecError()
+
+                    for name, batch in list(in_flight.items()):
+                        if not self.device_timeout or time.monotonic() - batch.started < self.device_timeout:
+                            continue
+                        del in_flight[name]
+                        self._kill_stuck_worker(pool[name])
+                        # the messages of the killed worker are dropped: the device is timed out
+                        # and the rest of its batches is given to other workers
+                        done_channels.pop(name).close()
+                        if memory is not None:
+                            memory.retired(name)
+                        rest = list(itertools.chain.from_iterable(dispatcher.worker_lost(name)[1:]))
+                        start_worker(name, new_queue=True)
+                        payload = batch.payloads.popleft()
+                        rest[:0] = batch.payloads
+                        timeouts[payload] = timeouts.get(payload, 0) + 1
+                        if timeouts[payload] <= self.device_timeout_retries:
+                            _logger.warning("Device %s has timed out, retrying it", payload)
+                            dispatcher.retry([payload, *rest])
+                            continue
+                        dispatcher.retry(rest)
+                        timeout_exc = PickleSafeException.from_exc(
+                            TimeoutError("The device has not been done in %s seconds" % self.device_timeout),
+                            str(payload),
+                        )
+                        if not tolerate_fails:
+                            self._terminate_pool(pool, dump_stacks=False)
+                            raise timeout_exc
+                        self.tasks_done += 1
+                        yield from self._run_callbacks(TaskResult(name, payload, exc=timeout_exc))
+                    if memory is not None:
+                        for name in retired_workers:
+                            memory.retired(name)
+                        if memory.check(pool):
+                            dispatcher.feed(task_queues)
+                        else:
+                            # over the budget a single batch at a time is dispatched
+                            dispatcher.feed(task_queues, max_outstanding=1)
+                    else:
+                        dispatcher.feed(task_queues)
+
+                    if not pool:
+                        break
+
+                    for name in retired_workers:
+                        _logger.debug("Worker '%s' has retired. Restart it", name)
+                        start_worker(name)
+                if memory is not None:
+                    self.peak_rss = memory.peak_rss
+                    _logger.info("%s", memory.report())
+            finally:
+                for task_queue in task_queues.values():
+                    task_queue.close()
+                for done_channel in done_channels.values():
+                    done_channel.close()
+                self._spill_dir = None
+                spill_dir.cleanup()
+
+    def _irun_threads(self, device_ids: list[Any], pool_size: int, tolerate_fails: bool) -> Iterator[TaskResult]:
+        executor = ThreadPoolExecutor(pool_size, thread_name_prefix="Worker", initializer=_init_worker_thread)
+        try:
+            # copy the context for the tracing spans to be inherited by the tasks
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._thread_worker, device_id)
+                for device_id in device_ids
+            ]
+            for future in as_completed(futures):
+                in_thread_results = future.result()
+                for in_thread_result in in_thread_results:
+                    if in_thread_result.exc is not None and not tolerate_fails:
+                        raise in_thread_result.exc
+                self.tasks_done += 1
+                yield from [
+                    result for in_thread_result in in_thread_results for result in self._run_callbacks(in_thread_result)
+                ]
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
 
-                    assert in_thread_results is not None
+    def _thread_worker(self, device_id: Any) -> list[TaskResult]:
+        task_result = TaskResult(threading.current_thread().name, device_id)
+        task_result.extra["start_time"] = time.monotonic()
+        try:
+            with _collecting_task_extra(task_result):
+                task_result.result = invoke_retry(self.func, self.net_retry, device_id, *self.args, **self.kwargs)
+        except Exception as exc:
+            task_result.exc = PickleSafeException.from_exc(exc, device_id)
+        task_result.extra["duration"] = time.monotonic() - task_result.extra["start_time"]
+        return list(self._run_callbacks(task_result, in_thread=True))
+
+    def _irun_asyncio(self, device_ids: list[Any], pool_size: int, tolerate_fails: bool) -> Iterator[TaskResult]:
+        loop = asyncio.new_event_loop()
+        # a plain function is run in these threads
+        loop.set_default_executor(
+            ThreadPoolExecutor(pool_size, thread_name_prefix="Worker", initializer=_init_worker_thread)
+        )
+        semaphore = asyncio.Semaphore(pool_size)
+        pending = {loop.create_task(self._async_worker(semaphore, device_id)) for device_id in device_ids}
+        try:
+            while pending:
+                done, pending = loop.run_until_complete(asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+                for task in done:
+                    in_thread_results = task.result()
+                    for in_thread_result in in_thread_results:
+                        if in_thread_result.exc is not None and not tolerate_fails:
+                            raise in_thread_result.exc
+                    self.tasks_done += 1
                     yield from [
                         result
                         for in_thread_result in in_thread_results
                         for result in self._run_callbacks(in_thread_result)
                     ]
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+
+    async def _async_worker(self, semaphore: asyncio.Semaphore, device_id: Any) -> list[TaskResult]:
+        async with semaphore:
+            task = asyncio.current_task()
+            task_result = TaskResult(task.get_name() if task else "Task", device_id)
+            task_result.extra["start_time"] = time.monotonic()
+            try:
+                with _collecting_task_extra(task_result):
+                    if inspect.iscoroutinefunction(self.func):
+                        task_result.result = await ainvoke_retry(
+                            self.func, self.net_retry, device_id, *self.args, **self.kwargs
+                        )
+                    else:
+                        # the context is copied to the thread, so the task extra is collected there as well
+                        task_result.result = await asyncio.to_thread(
+                            invoke_retry, self.func, self.net_retry, device_id, *self.args, **self.kwargs
+                        )
+            except Exception as exc:
+                task_result.exc = PickleSafeException.from_exc(exc, device_id)
+            task_result.extra["duration"] = time.monotonic() - task_result.extra["start_time"]
+            return list(self._run_callbacks(task_result, in_thread=True))
 
-                if not pool:
-                    break
-
-                for name in retired_workers:
-                    _logger.debug("Worker '%s' has retired. Restart it", name)
-                    pool[name] = mp.Process(name=name, target=pool_worker, args=worker_args)
-                    pool[name].start()
-            task_queue.close()
-            done_queue.close()
+    def _kill_stuck_worker(self, worker: "mp.Process") -> None:
+        _logger = get_logger()
+        if worker.exitcode is None:
+            assert worker.pid is not None
+            _logger.error("Worker '%s' (PID: %d) is stuck, replacing it", worker.name, worker.pid)
+            os.kill(worker.pid, signal.SIGUSR1)  # force dump stacktrace
+            time.sleep(1)
+            worker.terminate()
+        worker.join()
+
+    def _terminate_pool(self, pool: dict[str, "mp.Process"], dump_stacks: bool) -> None:
+        _logger = get_logger()
+        for name, worker in pool.items():
+            if worker.exitcode is None:
+                if dump_stacks:
+                    assert worker.pid is not None
+                    os.kill(worker.pid, signal.SIGUSR1)  # force dump stacktrace
+                    time.sleep(10)
+                worker.terminate()
+                _logger.warning("Worker '%s' (PID: %d) has been terminated", name, worker.pid)
+            worker.join()
 
     def _check_children(self, pool: dict[str, "mp.Process"]) -> tuple[list[str], list[str]]:
         _logger = get_logger()
@@ -471,6 +1256,10 @@ class Parallel:
         return retired_workers, failed_workers
 
 
+def _init_worker_thread() -> None:
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+
 def invoke_retry(func: Callable[..., Any], net_retry: int, *args: Any, **kwargs: Any) -> Any:
     attempt = 0
     while True:
@@ -485,3 +1274,17 @@ def invoke_retry(func: Callable[..., Any], net_retry: int, *args: Any, **kwargs:
             if attempt >= net_retry:
                 raise
             attempt += 1
+
+
+async def ainvoke_retry(func: Callable[..., Any], net_retry: int, *args: Any, **kwargs: Any) -> Any:
+    """Same as invoke_retry() for a coroutine function"""
+    attempt = 0
+    while True:
+        try:
+            return await func(*args, **kwargs)
+        except Exception as exc:
+            if not find_exc_in_stack(exc, (BrokenPipeError, ConnectionResetError)):
+                raise
+            if attempt >= net_retry:
+                raise
+            attempt += 1
@@ -27,6 +27,9 @@ from annet.annlib.patching import (
 from annet.annlib.patching import (
     make_pre as make_pre,
 )
+from annet.annlib.patching import (
+    prune_diff_rb as prune_diff_rb,
+)
 from annet.annlib.patching import (
     strip_unchanged as strip_unchanged,
 )
@@ -0,0 +1,162 @@
+"""Per-generator timings reduced over all the devices of a run.
+
+The workers attach OldNewResult.perf of every device to their task results (see
+parallel.add_task_extra()), the report collects them in the main process as a pool
+callback and is written as JSON or CSV once the run is done.
+
+The stages of processing a device (see timed_stage()) are kept apart from the generators
+in OldNewResult.stages. They are reduced the same way and written next to the report.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from operator import itemgetter
+from typing import Any
+
+import tabulate
+
+from annet.lib import percentile
+from annet.parallel import Parallel, TaskResult
+from annet.tracing import tracing_connector
+
+
+PERF_EXTRA_KEY = "perf"
+STAGES_EXTRA_KEY = "stages"
+# The output of all generators together.
+# The value is the same as for the equivalent constant in the Checkist.
+ALL_GENS = "_all_gens"
+
+
+@contextlib.contextmanager
+def timed_stage(stages: dict[str, float] | None, name: str) -> Iterator[None]:
+    """Add the time spent in the block to stages[name]
+
+    The stage total is also set as the "stage.<name>" attribute of the current tracing span.
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        duration = time.monotonic() - start
+        if stages is not None:
+            duration = stages[name] = stages.get(name, 0.0) + duration
+        if span := tracing_connector.get().get_current_span():
+            span.set_attribute("stage.%s" % name, duration)
+
+
+def print_stages(hostname: str, stages: dict[str, float]) -> None:
+    print(file=sys.stderr)
+    print(
+        tabulate.tabulate(
+            sorted(stages.items(), key=itemgetter(1), reverse=True),
+            ["Stage (%s)" % hostname, "Total"],
+            tablefmt="orgtbl",
+            floatfmt=".4f",
+        ),
+        file=sys.stderr,
+    )
+    print(file=sys.stderr)
+
+
+def stages_path(path: str) -> str:
+    """The path of the stage report written along with the report at path"""
+    root, ext = os.path.splitext(path)
+    return root + ".stages" + ext
+
+
+def _totals_row(totals: list[float]) -> dict[str, Any]:
+    return {
+        "count": len(totals),
+        "total": sum(totals),
+        "p50": percentile(totals, 0.5),
+        "p95": percentile(totals, 0.95),
+        "p99": percentile(totals, 0.99),
+        "max": max(totals),
+    }
+
+
+def _write_rows(path: str, fields: tuple[str, ...], rows: list[dict[str, Any]]) -> None:
+    with open(path, "w", newline="") as f:
+        if path.endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, f, indent=2)
+            f.write("\n")
+
+
+class GeneratorPerfReport:
+    FIELDS = ("generator", "count", "total", "p50", "p95", "p99", "max", "rt_total", "rt_calls")
+    STAGE_FIELDS = ("stage", "count", "total", "p50", "p95", "p99", "max")
+
+    def __init__(self, path: str = "") -> None:
+        self.path = path
+        self.totals: dict[str, list[float]] = defaultdict(list)
+        self.rt_totals: dict[str, float] = defaultdict(float)
+        self.rt_calls: dict[str, int] = defaultdict(int)
+        self.stage_totals: dict[str, list[float]] = defaultdict(list)
+
+    def add(self, perf: dict[str, dict[str, Any]]) -> None:
+        """Add OldNewResult.perf of a device"""
+        for name, gen_perf in perf.items():
+            if name == ALL_GENS:
+                continue
+            self.totals[name].append(gen_perf["total"])
+            for stat in (gen_perf.get("rt") or {}).values():
+                self.rt_totals[name] += sum(item["time"] for item in stat)
+                self.rt_calls[name] += len(stat)
+
+    def add_stages(self, stages: dict[str, float]) -> None:
+        """Add OldNewResult.stages of a device"""
+        for name, total in stages.items():
+            self.stage_totals[name].append(total)
+
+    def rows(self) -> list[dict[str, Any]]:
+        rows: list[dict[str, Any]] = []
+        for name, totals in sorted(self.totals.items(), key=lambda item: sum(item[1]), reverse=True):
+            rows.append(
+                {
+                    "generator": name,
+                    **_totals_row(totals),
+                    "rt_total": self.rt_totals[name],
+                    "rt_calls": self.rt_calls[name],
+                }
+            )
+        return rows
+
+    def stage_rows(self) -> list[dict[str, Any]]:
+        return [
+            {"stage": name, **_totals_row(totals)}
+            for name, totals in sorted(self.stage_totals.items(), key=lambda item: sum(item[1]), reverse=True)
+        ]
+
+    def write(self, path: str) -> None:
+        """Write the report as CSV for a .csv file or as JSON otherwise
+
+        The stages, if any, are written the same way to stages_path(path).
+        """
+        _write_rows(path, self.FIELDS, self.rows())
+        if self.stage_totals:
+            _write_rows(stages_path(path), self.STAGE_FIELDS, self.stage_rows())
+
+    # pool callback
+    def __call__(self, pool: Parallel, task_result: TaskResult) -> TaskResult:  # pylint: disable=unused-argument
+        for perf in task_result.extra.get(PERF_EXTRA_KEY, ()):
+            self.add(perf)
+        for stages in task_result.extra.get(STAGES_EXTRA_KEY, ()):
+            self.add_stages(stages)
+        return task_result
+
+    # pool finalizer
+    def finish(self, pool: Parallel) -> None:  # pylint: disable=unused-argument
+        if self.path:
+            self.write(self.path)
@@ -25,6 +25,8 @@ def get_used_as_path_filters(
 
 class AsPathFilterGenerator(PartialGenerator, ABC):
     TAGS = ["policy", "rpl", "routing"]
+    # the devices share an instance, a subclass keeping a per-device state has to set it to False
+    STATELESS = True
 
     @abstractmethod
     def get_policies(self, device: Any) -> list[RoutingPolicy]:
@@ -116,6 +116,8 @@ def assert_unique_names(communities: Collection[CommunityList]) -> None:
 
 class CommunityListGenerator(PartialGenerator, ABC):
     TAGS = ["policy", "rpl", "routing"]
+    # the devices share an instance, a subclass keeping a per-device state has to set it to False
+    STATELESS = True
 
     @abstractmethod
     def get_policies(self, device: Any) -> list[RoutingPolicy]:
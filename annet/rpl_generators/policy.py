@@ -110,6 +110,8 @@ JUNIPER_RESULT_MAP = {ResultType.ALLOW: "accept", ResultType.DENY: "reject", Res
 
 class RoutingPolicyGenerator(PartialGenerator, ABC):
     TAGS = ["policy", "rpl", "routing"]
+    # the devices share an instance, a subclass keeping a per-device state has to set it to False
+    STATELESS = True
 
     @abstractmethod
     def get_prefix_lists(self, device: Any) -> list[IpPrefixList]:
@@ -12,6 +12,8 @@ from .entities import IpPrefixList, JuniperPrefixListNameGenerator, PrefixListNa
 
 class PrefixListFilterGenerator(PartialGenerator, ABC):
     TAGS = ["policy", "rpl", "routing"]
+    # the devices share an instance, a subclass keeping a per-device state has to set it to False
+    STATELESS = True
 
     @abstractmethod
     def get_policies(self, device: Any) -> list[RoutingPolicy]:
@@ -11,6 +11,8 @@ from .entities import RDFilter
 
 class RDFilterFilterGenerator(PartialGenerator, ABC):
     TAGS = ["policy", "rpl", "routing"]
+    # the devices share an instance, a subclass keeping a per-device state has to set it to False
+    STATELESS = True
 
     @abstractmethod
     def get_policies(self, device: Any) -> list[RoutingPolicy]:
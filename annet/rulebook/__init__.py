@@ -1,3 +1,4 @@
+import os
 import re
 import sys
 from abc import ABC
@@ -10,11 +11,13 @@ from valkit.python import valid_object_path
 
 from annet.annlib.lib import mako_render
 from annet.annlib.netdev.views.hardware import HardwareView
+from annet.annlib.rbparser import syntax
 from annet.annlib.rbparser.exceptions import RulebookSyntaxError
 from annet.annlib.rbparser.ordering import compile_ordering_text, dump_order_rulebook, merge_order_rulebooks
 from annet.annlib.rbparser.platform import VENDOR_ALIASES
 from annet.connectors import CachedConnector
 from annet.lib import get_context
+from annet.rulebook.cache import RULEBOOK_CACHE_PATH_ENV, RulebookCache
 from annet.rulebook.deploying import compile_deploying_text, dump_deploy_rulebook, merge_deploy_rulebooks
 from annet.rulebook.patching import compile_patching_text, dump_patch_rulebook, merge_patch_rulebooks
 from annet.rulebook.types import (
@@ -95,12 +98,22 @@ class DefaultRulebookProvider(RulebookProvider):
         "deploy": compile_deploying_text,
     }
 
+    # the modules compiling the rulebooks besides the ones of the provider and its compile/merge functions
+    compiler_modules: tuple[str, ...] = (
+        syntax.__name__,
+        "annet.annlib.rbparser.deploying",
+        "annet.annlib.rulebook.common",
+        "annet.rulebook.common",
+    )
+
     def __init__(self) -> None:
         try:
-            context_module = get_context().get("rulebook", {}).get("module")
+            rulebook_context = get_context().get("rulebook", {})
         except FileNotFoundError:
-            context_module = None
-        self.rulebook_module = context_module or self.DEFAULT_RULEBOOK_MODULE
+            rulebook_context = {}
+        self.rulebook_module = rulebook_context.get("module") or self.DEFAULT_RULEBOOK_MODULE
+        cache_path = os.getenv(RULEBOOK_CACHE_PATH_ENV) or rulebook_context.get("cache_path")
+        self.compiled_cache = RulebookCache(cache_path) if cache_path else None
         self._rulebook_cache: dict[HardwareView, Rulebook] = {}
         self._rulebook_text_cache: dict[tuple[str, Extension, HardwareView], AnyRulebookText] = {}
 
@@ -108,6 +121,64 @@ class DefaultRulebookProvider(RulebookProvider):
         if hw in self._rulebook_cache:
             return self._rulebook_cache[hw]
 
+        if self.compiled_cache is None:
+            rulebook = self._compile_rulebook(hw)
+        else:
+            key = self._compiled_cache_key(hw)
+            if (cached := self.compiled_cache.load(key)) is None:
+                cached = self._compile_rulebook(hw)
+                self.compiled_cache.store(key, cached)
+            rulebook = cached
+        self._rulebook_cache[hw] = rulebook
+        return rulebook
+
+    def precompile(self, hw: HardwareView) -> bool:
+        """Store the compiled rulebook of hw in the compiled rulebooks cache, False if it is already there"""
+        if self.compiled_cache is None:
+            raise ValueError(
+                "The compiled rulebooks cache is not set: use the %s environment variable "
+                "or the cache_path option of the rulebook context" % RULEBOOK_CACHE_PATH_ENV
+            )
+        key = self._compiled_cache_key(hw)
+        if self.compiled_cache.has(key):
+            return False
+        self.compiled_cache.store(key, self._compile_rulebook(hw))
+        return True
+
+    def _compiled_cache_key(self, hw: HardwareView) -> str:
+        assert self.compiled_cache is not None
+        modules = {cls.__module__ for cls in type(self).__mro__ if cls is not object}
+        modules.update(fn.__module__ for fn in self.compile_rulebooks.values())
+        modules.update(fn.__module__ for fn in self.merge_rulebooks.values())
+        modules.update(self.compiler_modules)
+        return self.compiled_cache.make_key(hw, self._get_rulebook_sources(hw), modules)
+
+    def _get_rulebook_sources(self, hw: HardwareView) -> list[str]:
+        """Paths and raw texts of the rulebook files the rulebook of hw is built from"""
+        vendor = hw.vendor
+        assert vendor is not None and vendor in registry_connector.get(), "Unknown vendor: %s" % (vendor)
+        queue: list[tuple[str, Extension]] = [
+            (".".join((self.rulebook_module, VENDOR_ALIASES.get(vendor, vendor))), "rul"),
+            (".".join((self.rulebook_module, vendor)), "order"),
+            (".".join((self.rulebook_module, vendor)), "deploy"),
+        ]
+        sources: list[str] = []
+        seen: set[tuple[str, Extension]] = set()
+        while queue:
+            rulebook_path, extension = item = queue.pop(0)
+            if item in seen:
+                continue
+            seen.add(item)
+            try:
+                raw_text = self._get_raw_rulebook_text(rulebook_path, extension)
+            except (FileNotFoundError, ValueError):  # compiling the rulebook fails on these the same way
+                raw_text = ""
+            sources.extend((f"{rulebook_path}.{extension}", raw_text))
+            # the parents are looked for in the whole text, in case %inherit_from is under a mako condition
+            queue.extend((path, extension) for path in re.findall(r"%inherit_from=(\S+)", raw_text))
+        return sources
+
+    def _compile_rulebook(self, hw: HardwareView) -> Rulebook:
         vendor = hw.vendor
         assert vendor is not None and vendor in registry_connector.get(), "Unknown vendor: %s" % (vendor)
         rul_vendor_name = VENDOR_ALIASES.get(vendor, vendor)
@@ -149,7 +220,7 @@ class DefaultRulebookProvider(RulebookProvider):
             deploying = OrderedDict()
             deploying_text = ""
 
-        self._rulebook_cache[hw] = Rulebook(
+        return Rulebook(
             patching=patching,
             ordering=ordering,
             deploying=deploying,
@@ -159,7 +230,6 @@ class DefaultRulebookProvider(RulebookProvider):
                 deploying=deploying_text,
             ),
         )
-        return self._rulebook_cache[hw]
 
     @overload
     def _get_rulebook_by_extension(  # noqa: E704
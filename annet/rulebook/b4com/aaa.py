@@ -1,5 +1,6 @@
 import re
 from collections import OrderedDict
+from collections.abc import Mapping
 from typing import Any
 
 from annet.annlib.rulebook.common import DiffItem
@@ -21,12 +22,12 @@ def _collect_hex_in_order(block: OrderedDict[str, Any]) -> str:
     parts: list[str] = []
 
     def _recurse(d: Any) -> None:
-        if not isinstance(d, OrderedDict):
+        if not isinstance(d, Mapping):
             return
         for key, value in d.items():
             if isinstance(key, str) and re.fullmatch(r"[0-9A-Fa-f ]+", key.strip()):
                 parts.append(key.strip())
-            if isinstance(value, OrderedDict):
+            if isinstance(value, Mapping):
                 _recurse(value)
 
     _recurse(block)
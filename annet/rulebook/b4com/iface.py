@@ -12,10 +12,9 @@ def diff(
     diff_pre: OrderedDict[str, Any],
     _pops: tuple[str, ...] = (Op.AFFECTED,),
 ) -> list[DiffItem]:
-    for iface_row in old:
-        _filter_channel_members(old[iface_row])
-    for iface_row in new:
-        _filter_channel_members(new[iface_row])
+    # the trees are shared with the config, filter the copies
+    old = OrderedDict((iface_row, _filter_channel_members(children)) for iface_row, children in old.items())
+    new = OrderedDict((iface_row, _filter_channel_members(children)) for iface_row, children in new.items())
 
     ret = common.default_diff(old, new, diff_pre, _pops)
     vpn_changed = False
@@ -37,11 +36,10 @@ def diff(
 # listing they are inherited from the port-channel itself
 
 
-def _filter_channel_members(tree: OrderedDict[str, Any]) -> None:
+def _filter_channel_members(tree: OrderedDict[str, Any]) -> OrderedDict[str, Any]:
     if any(is_in_channel(x) for x in tree):
-        for cmd in list(tree.keys()):
-            if not _is_allowed_on_channel(cmd):
-                del tree[cmd]
+        return OrderedDict((cmd, children) for cmd, children in tree.items() if _is_allowed_on_channel(cmd))
+    return OrderedDict(tree)
 
 
 def is_in_channel(cmd_line: str) -> bool:
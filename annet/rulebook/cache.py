@@ -0,0 +1,95 @@
+"""On-disk cache of compiled rulebooks.
+
+DefaultRulebookProvider renders the rulebook templates of a hardware model, then parses,
+compiles and merges them along their %inherit_from chains. That is done again by every
+worker process of every run. Compiled rulebooks are pickled to a directory keyed by the
+raw texts of the rulebook files, the hardware model and soft version, the annet version
+and the sources of the modules compiling the rulebooks, so that a worker only has to load
+them. The directory is set with the ANN_RULEBOOK_CACHE_PATH environment variable or the
+cache_path option of the rulebook section of the context.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import tempfile
+from collections.abc import Iterable
+from importlib import metadata
+from typing import cast
+
+from contextlog import get_logger
+
+from annet.annlib.netdev.views.hardware import HardwareView
+from annet.rulebook.types import Rulebook
+
+
+# bump when the layout of the entries changes
+CACHE_FORMAT_VERSION = 1
+
+RULEBOOK_CACHE_PATH_ENV = "ANN_RULEBOOK_CACHE_PATH"
+
+
+def _annet_version() -> str:
+    try:
+        return metadata.version("annet")
+    except metadata.PackageNotFoundError:
+        return ""
+
+
+class RulebookCache:
+    """Storage of pickled compiled rulebooks in a directory.
+
+    Entries are written atomically, so the cache can be shared by pool workers.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(os.path.expanduser(path))
+
+    def make_key(self, hw: HardwareView, sources: Iterable[str], modules: Iterable[str]) -> str:
+        """Key of a rulebook compiled from the sources (raw texts) by the modules"""
+        from annet.gen_cache import module_digest
+
+        digest = hashlib.sha256()
+        parts = [str(CACHE_FORMAT_VERSION), _annet_version(), hw.model, hw.soft, hw.vendor or ""]
+        parts.extend(module_digest(name) for name in sorted(set(modules)))
+        parts.extend(sources)
+        for part in parts:
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key + ".pickle")
+
+    def load(self, key: str) -> Rulebook | None:
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                return cast(Rulebook, pickle.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            get_logger().warning("ignoring broken rulebook cache entry %s: %r", path, exc)
+            return None
+
+    def store(self, key: str, rulebook: Rulebook) -> None:
+        path = self._entry_path(key)
+        try:
+            data = pickle.dumps(rulebook, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as exc:  # custom rulebook logics may be not picklable
+            get_logger().warning("can't store the rulebook to the rulebook cache: %r", exc)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def has(self, key: str) -> bool:
+        return os.path.exists(self._entry_path(key))
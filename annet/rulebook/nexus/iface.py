@@ -13,10 +13,9 @@ def diff(
     diff_pre: odict[str, Any],
     _pops: tuple[str, ...] = (Op.AFFECTED,),
 ) -> list[common.DiffItem]:
-    for iface_row in old:
-        _filter_channel_members(old[iface_row])
-    for iface_row in new:
-        _filter_channel_members(new[iface_row])
+    # the trees are shared with the config, filter the copies
+    old = odict((iface_row, _filter_channel_members(children)) for iface_row, children in old.items())
+    new = odict((iface_row, _filter_channel_members(children)) for iface_row, children in new.items())
 
     for iface_row in uniq(old, new):
         iface_old = old.get(iface_row, {})
@@ -50,11 +49,10 @@ def diff(
 # listing they are inherited from the port-channel itself
 
 
-def _filter_channel_members(tree: odict[str, Any]) -> None:
+def _filter_channel_members(tree: odict[str, Any]) -> odict[str, Any]:
     if any(is_in_channel(x) for x in tree):
-        for cmd in list(tree.keys()):
-            if not _is_allowed_on_channel(cmd):
-                del tree[cmd]
+        return odict((cmd, children) for cmd, children in tree.items() if _is_allowed_on_channel(cmd))
+    return odict(tree)
 
 
 def _is_allowed_on_channel(cmd_line: str) -> bool:
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from collections import OrderedDict
-from collections.abc import MutableMapping
+from collections.abc import Callable, Mapping, MutableMapping
 from typing import Any, NamedTuple, TypeAlias, cast
 
 from annet.annlib.jsontools import JsonFragmentAcl
@@ -53,6 +53,7 @@ class GeneratorPartialRunArgs:
         annotate: bool = False,
         generators_context: str | None = None,
         no_new: bool = False,
+        gen_threads: int | None = 1,
     ):
         self.device = device
         self.use_acl = use_acl  # filter the generator output by acl (--no-acl for debugging)
@@ -60,6 +61,8 @@ class GeneratorPartialRunArgs:
         self.annotate = annotate  # add information about where each output row was yielded from
         self.generators_context = generators_context  # string with the name of the generators context
         self.no_new = no_new  # for the --clear option, do not run the generators, return the acl only
+        # GenOptions built without argparse have None here
+        self.gen_threads = gen_threads or 1  # threads to run independent generators of the device with
 
 
 class GeneratorPartialResult:
@@ -75,7 +78,7 @@ class GeneratorPartialResult:
         acl_rules: dict[str, OrderedDict[Any, Any]],
         acl_safe: str,
         acl_safe_rules: dict[str, OrderedDict[Any, Any]],
-        output: str,
+        output: str | Callable[[], str],
         config: OrderedDict[str, Any],
         safe_config: OrderedDict[str, Any],
         perf: GeneratorPerf,
@@ -86,11 +89,21 @@ class GeneratorPartialResult:
         self.acl_rules = acl_rules
         self.acl_safe = acl_safe
         self.acl_safe_rules = acl_safe_rules
-        self.output = output
+        self._output = output  # the text is rendered on first access
         self.config = config
         self.safe_config = safe_config
         self.perf = perf
 
+    @property
+    def output(self) -> str:
+        if not isinstance(self._output, str):
+            self._output = self._output()
+        return self._output
+
+    @output.setter
+    def output(self, value: str) -> None:
+        self._output = value
+
 
 class GeneratorEntireResult:
     """
@@ -158,8 +171,8 @@ class OldNewResult:
     def __init__(
         self,
         device: Device | None = None,
-        old: MutableMapping[str, Any] | None = None,
-        new: MutableMapping[str, Any] | None = None,
+        old: Mapping[str, Any] | None = None,
+        new: Mapping[str, Any] | None = None,
         acl_rules: MutableMapping[str, Any] | None = None,
         new_files: MutableMapping[str, tuple[str, str]] | None = None,
         old_files: MutableMapping[str, str | None] | None = None,
@@ -172,15 +185,16 @@ class OldNewResult:
         implicit_rules: dict[str, Any] | None = None,
         perf: dict[str, dict[str, float]] | None = None,
         acl_safe_rules: MutableMapping[str, Any] | None = None,
-        safe_old: MutableMapping[str, Any] | None = None,
-        safe_new: MutableMapping[str, Any] | None = None,
+        safe_old: Mapping[str, Any] | None = None,
+        safe_new: Mapping[str, Any] | None = None,
         safe_new_files: MutableMapping[str, tuple[str, str]] | None = None,
         safe_new_json_fragment_files: dict[str, tuple[Any, str | None]] | None = None,
         filter_acl_rules: MutableMapping[str, Any] | None = None,
+        stages: dict[str, float] | None = None,
     ) -> None:
         self.device: Device = cast(Device, device)
-        self.old: MutableMapping[str, Any] = old if old else OrderedDict()
-        self.new: MutableMapping[str, Any] = new if new else OrderedDict()
+        self.old: Mapping[str, Any] = old if old else OrderedDict()
+        self.new: Mapping[str, Any] = new if new else OrderedDict()
         self.acl_rules: MutableMapping[str, Any] = cast(MutableMapping[str, Any], acl_rules)
         self.new_files: MutableMapping[str, tuple[str, str]] = new_files if new_files else {}
         self.old_files: MutableMapping[str, str | None] = old_files if old_files else {}
@@ -192,23 +206,25 @@ class OldNewResult:
         self.json_fragment_results: dict[str, GeneratorJSONFragmentResult] = json_fragment_result or {}
         self.implicit_rules: dict[str, Any] = implicit_rules or OrderedDict()
         self.perf: dict[str, dict[str, float]] = perf or {}
+        # seconds spent in the stages of processing the device, see perf_report.timed_stage()
+        self.stages: dict[str, float] = stages or {}
 
         # safe acl and configs with it applied
         self.acl_safe_rules: MutableMapping[str, Any] = acl_safe_rules or {}
-        self.safe_old: MutableMapping[str, Any] = safe_old if safe_old else OrderedDict()
-        self.safe_new: MutableMapping[str, Any] = safe_new if safe_new else OrderedDict()
+        self.safe_old: Mapping[str, Any] = safe_old if safe_old else OrderedDict()
+        self.safe_new: Mapping[str, Any] = safe_new if safe_new else OrderedDict()
         self.safe_new_files: MutableMapping[str, tuple[str, str]] = safe_new_files if safe_new_files else {}
         self.safe_new_json_fragment_files: dict[str, tuple[Any, str | None]] = safe_new_json_fragment_files or {}
 
         self.filter_acl_rules: MutableMapping[str, Any] | None = filter_acl_rules
 
-    def get_old(self, safe: bool = False) -> MutableMapping[str, Any]:
+    def get_old(self, safe: bool = False) -> Mapping[str, Any]:
         if safe:
             return self.safe_old
 
         return self.old
 
-    def get_new(self, safe: bool = False) -> MutableMapping[str, Any]:
+    def get_new(self, safe: bool = False) -> Mapping[str, Any]:
         if safe:
             return self.safe_new
 
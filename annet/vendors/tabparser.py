@@ -119,6 +119,13 @@ class CommonFormatter:
     def split(self, text: str) -> list[str]:
         return list(filter(None, text.split("\n")))
 
+    def split_row(self, row: str) -> str | None:
+        """Does to a single row without leading spaces what split() does to the text
+
+        Returns None if the row is dropped. See row_splitter().
+        """
+        return row
+
     def join(self, config: FormatterTree) -> str:
         return "\n".join(_filtered_block_marks(self._indent_blocks(self._blocks(config, is_patch=False))))
 
@@ -227,6 +234,11 @@ class BlockExitFormatter(CommonFormatter):
         res = super().split(text)
         return res
 
+    def split_row_remove_spaces(self, row: str) -> str:
+        if "  " not in row:
+            return row
+        return re.sub(r"(?<=\S)\ {2,}(?=\S)", " ", row)
+
     def block_exit(self, context: Optional[FormatterContext]) -> Iterable[Any]:
         current = context and context.row
         if current and not current.startswith(self.no_block_exit):
@@ -273,6 +285,12 @@ class HuaweiFormatter(BlockExitFormatter):
         tree[:] = filter(lambda x: not str(x).strip().startswith(self.policy_end_blocks), tree)
         return tree
 
+    def split_row(self, row: str) -> str | None:
+        row = self.split_row_remove_spaces(row)
+        if row.strip().startswith(self.policy_end_blocks):
+            return None
+        return row
+
     def block_exit(self, context: Optional[FormatterContext]) -> Iterable[Any]:
         current = context and context.row or ""
         next_row = context and context.row_next
@@ -494,19 +512,32 @@ class ArubaFormatter(BlockExitFormatter):
     def split(self, text: str) -> list[str]:
         return self.split_remove_spaces(text)
 
+    def split_row(self, row: str) -> str | None:
+        return self.split_row_remove_spaces(row)
+
 
 class AristaFormatter(BlockExitFormatter):
     def split(self, text: str) -> list[str]:
         return self.split_remove_spaces(text)
 
+    def split_row(self, row: str) -> str | None:
+        return self.split_row_remove_spaces(row)
+
 
 class AsrFormatter(BlockExitFormatter):
+    policy_end_blocks = ("end-set", "endif", "end-policy")
+
     def split(self, text: str) -> list[str]:
-        policy_end_blocks = ("end-set", "endif", "end-policy")
         tree = self.split_remove_spaces(text)
-        tree[:] = filter(lambda x: not x.endswith(policy_end_blocks), tree)
+        tree[:] = filter(lambda x: not x.endswith(self.policy_end_blocks), tree)
         return tree
 
+    def split_row(self, row: str) -> str | None:
+        row = self.split_row_remove_spaces(row)
+        if row.endswith(self.policy_end_blocks):
+            return None
+        return row
+
     def block_exit(self, context: Optional[FormatterContext]) -> Iterable[Any]:
         current = context and context.row or ""
         next_row = context and context.row_next
@@ -905,10 +936,27 @@ class SNRFormatter(BlockExitFormatter):
     def split(self, text: str) -> list[str]:
         return self.split_remove_spaces(text)
 
+    def split_row(self, row: str) -> str | None:
+        return self.split_row_remove_spaces(row)
+
 
 # ====
 
 
+def row_splitter(fmtr: CommonFormatter) -> Callable[[str], str | None] | None:
+    """Returns fmtr.split_row() if it matches the formatter's split()
+
+    A formatter which overrides split() without overriding split_row() as well
+    can't split the text row by row, so its text has to be parsed as a whole.
+    """
+    mro = type(fmtr).__mro__
+    split_owner = next(cls for cls in mro if "split" in cls.__dict__)
+    split_row_owner = next(cls for cls in mro if "split_row" in cls.__dict__)
+    if not issubclass(split_row_owner, split_owner):
+        return None
+    return fmtr.split_row
+
+
 def parse_to_tree(
     text: str, splitter: Callable[[str], Iterable[str]], comments: Iterable[str] = ("!", "#")
 ) -> odict[str, Any]:
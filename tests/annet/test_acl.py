@@ -5,6 +5,7 @@ from collections import OrderedDict
 import pytest
 
 from annet import patching
+from annet.annlib import patching as patching_impl
 from annet.annlib.rbparser.acl import compile_acl_text
 from annet.vendors import registry_connector, tabparser
 
@@ -576,3 +577,33 @@ def test_acl(ann_connectors, name, sample):
     result_text = fmtr.join(tree)
     result_text, output_text = result_text.strip(), output_text.strip()
     assert result_text == output_text
+
+
+@pytest.mark.parametrize("name, sample", patch_data.get_samples(dirname="annet/test_acl"))
+def test_indexed_acl_matching(ann_connectors, monkeypatch, name, sample):
+    vendor = sample["vendor"].lower()
+    fmtr = registry_connector.get().match(make_hw_stub(vendor)).make_formatter()
+    rules = compile_acl_text(textwrap.dedent(sample["acl"]), vendor, allow_ignore=True)
+    tree = tabparser.parse_to_tree(text=textwrap.dedent(sample["input"]), splitter=fmtr.split)
+
+    def walk(tree, rules):
+        for row, children in tree.items():
+            match, children_rules = patching_impl.match_row_to_acl(row, rules)
+            yield row, match
+            if match:
+                yield from walk(children, children_rules)
+
+    indexed = list(walk(tree, rules))
+    monkeypatch.setattr(patching_impl._RulesIndex, "candidates", lambda self, row: self.all)
+    assert list(walk(tree, rules)) == indexed
+
+
+def test_acl_match_groups_do_not_leak_into_rules():
+    rules = compile_acl_text("interface <name>\nundo shutdown", "huawei")
+    match, _ = patching_impl.match_row_to_acl("interface 10GE1", rules)
+    assert match["attrs"]["match"] == {"name": "10GE1"}
+    assert not match["is_reverse"]
+    match, _ = patching_impl.match_row_to_acl("undo interface Vlanif1", rules)
+    assert match["attrs"]["match"] == {"name": "Vlanif1"}
+    assert match["is_reverse"]
+    assert all("match" not in rule["attrs"] for rule in rules["local"].values())
@@ -3,6 +3,7 @@ from textwrap import dedent
 import pytest
 
 from annet import api
+from annet.parallel import TaskResult
 
 
 @pytest.mark.parametrize(
@@ -96,3 +97,27 @@ def test_guess_hw(ann_connectors, vendors, config_text):
     config_text = dedent(config_text)
     hw, _ = api.guess_hw(config_text)
     assert hw.vendor in vendors
+
+
+def test_collapse_texts():
+    texts = {
+        "sw1": "a\nb\n",
+        "sw2": "a\nb\n",
+        "sw3": "c\n",
+        "sw4": (line for line in ["a\n", "b\n"]),
+        "sw0": "c\n",
+    }
+    assert api.collapse_texts(texts) == {
+        ("sw0",): "c\n",
+        ("sw1", "sw2"): "a\nb\n",
+        ("sw3",): "c\n",
+        ("sw4",): "a\nb\n",
+    }
+
+
+def test_results_stream():
+    results = [TaskResult("Worker-0", 1, result="ok"), TaskResult("Worker-0", 2, exc=ValueError("fail"))]
+    stream = api.ResultsStream(iter(results))
+    assert list(stream) == [(1, "ok")]
+    assert stream.done == 2
+    assert list(stream.fail) == [2]
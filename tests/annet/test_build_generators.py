@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from annet import generators
+from annet.cli_args import GenSelectOptions
+from annet.generators import PartialGenerator
+
+
+class Hostname(PartialGenerator):
+    STATELESS = True
+
+    def run_huawei(self, device):
+        yield "sysname", device.hostname
+
+
+class Spine(PartialGenerator):
+    def run_huawei(self, device):
+        yield "spine", device.hostname
+
+
+class FakeModule:
+    def __init__(self, *classes):
+        self.classes = classes
+        self.calls = 0
+
+    def get_generators(self, storage):
+        self.calls += 1
+        return [cls(storage) for cls in self.classes]
+
+
+@pytest.fixture
+def modules(monkeypatch):
+    modules = {"gens.common": FakeModule(Hostname), "gens.spine": FakeModule(Spine)}
+    context = {
+        "generators": {
+            "default": ["gens.common"],
+            "per_device_property": {"is_spine": ["gens.common", "gens.spine"]},
+        }
+    }
+    monkeypatch.setattr(generators, "get_context", lambda: context)
+    monkeypatch.setattr(generators, "_load_gen_module", modules.__getitem__)
+    return modules
+
+
+class FakeDevice:
+    def __init__(self, hostname, is_spine=False, is_other=False):
+        self.hostname = hostname
+        self.is_spine = is_spine
+        self.is_other = is_other
+
+
+def test_stateless_generators_are_built_once_per_group(modules):
+    devices = [FakeDevice("leaf1"), FakeDevice("spine1", True), FakeDevice("leaf2"), FakeDevice("spine2", True)]
+    built = dict(generators.build_generators_for_devices(None, GenSelectOptions(), devices))
+
+    # the spine group has a generator keeping its state, so only its module is asked again for every spine
+    assert modules["gens.common"].calls == 2
+    assert modules["gens.spine"].calls == 2
+    assert [type(gen) for gen in built[devices[0]].partial] == [Hostname]
+    assert [type(gen) for gen in built[devices[1]].partial] == [Hostname, Spine]
+    assert [type(gen) for gen in built[devices[3]].partial] == [Hostname, Spine]
+    assert built[devices[0]] is built[devices[2]]
+    assert built[devices[1]].partial[0] is built[devices[3]].partial[0]
+    assert built[devices[1]].partial[1] is not built[devices[3]].partial[1]
+
+
+def test_only_stateless_generators_are_copied_for_a_run():
+    hostname, spine = Hostname(None), Spine(None)
+    assert generators._private_instance(spine) is spine
+    copied = generators._private_instance(hostname)
+    assert copied is not hostname and type(copied) is Hostname
+
+
+def test_ambiguous_device_property(modules):
+    modules["gens.other"] = FakeModule(Hostname)
+    generators.get_context()["generators"]["per_device_property"]["is_other"] = ["gens.other"]
+    device = FakeDevice("sw1", is_spine=True, is_other=True)
+    with pytest.raises(RuntimeError, match="more than one"):
+        list(generators.build_generators_for_devices(None, GenSelectOptions(), [device]))
+
+
+def test_path_module_is_loaded_once(tmp_path):
+    path = tmp_path / "gens.py"
+    path.write_text("VERSION = 1\n")
+    module = generators._load_gen_module(str(path))
+    assert module.VERSION == 1
+    assert generators._load_gen_module(str(path)) is module
+
+    path.write_text("VERSION = 2\n")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    reloaded = generators._load_gen_module(str(path))
+    assert reloaded is not module
+    assert reloaded.VERSION == 2
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import pytest
+
+from annet import cli
+from annet.api import ResultsStream
+from annet.parallel import TaskResult
+
+
+class FakeOutputDriver:
+    def __init__(self):
+        self.written = []
+
+    def format_fails(self, fail, fqdns):
+        return [(fqdns[device_id], str(exc), True) for device_id, exc in fail.items()]
+
+    def write_output(self, args, items, total):
+        self.written.extend(items)
+
+
+@pytest.fixture
+def output_driver(monkeypatch):
+    driver = FakeOutputDriver()
+    monkeypatch.setattr(cli.output_driver_connector, "get", lambda: driver)
+    return driver
+
+
+def _write(strict_exit_code, results):
+    args = SimpleNamespace(strict_exit_code=strict_exit_code, query="sw*")
+    loader = SimpleNamespace(device_ids=[1, 2], device_fqdns={1: "sw1", 2: "sw2"})
+    stream = ResultsStream(iter(results))
+    cli._write_stream(args, loader, stream, ((k, v, False) for k, v in stream))
+
+
+def test_write_stream_writes_fails_after_results(output_driver):
+    _write(False, [TaskResult("Worker-0", 2, exc=ValueError("fail")), TaskResult("Worker-0", 1, result="ok")])
+    assert output_driver.written == [(1, "ok", False), ("sw2", "fail", True)]
+
+
+def test_strict_exit_code_fails_before_output(output_driver):
+    with pytest.raises(RuntimeError, match="failed for 1/2 devices"):
+        _write(True, [TaskResult("Worker-0", 1, result="ok"), TaskResult("Worker-0", 2, exc=ValueError("fail"))])
+    assert output_driver.written == []
+
+
+def test_strict_exit_code_writes_output_without_fails(output_driver):
+    _write(True, [TaskResult("Worker-0", 1, result="ok"), TaskResult("Worker-0", 2, result="ok")])
+    assert output_driver.written == [(1, "ok", False), (2, "ok", False)]
@@ -0,0 +1,56 @@
+from unittest import mock
+
+import pytest
+
+from annet.config_cache import ParsedConfigCache
+from annet.vendors import registry_connector, tabparser
+
+from .. import make_hw_stub
+
+
+CONFIG = """
+sysname sw1
+interface 10GE1/0/1
+  description uplink
+  port link-type trunk
+#
+interface 10GE1/0/2
+"""
+
+
+def _formatter(vendor):
+    return registry_connector.get().match(make_hw_stub(vendor)).make_formatter()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ParsedConfigCache(str(tmp_path))
+
+
+def test_parse_is_cached(cache):
+    fmtr = _formatter("huawei")
+    expected = tabparser.parse_to_tree(CONFIG, fmtr.split)
+    tree = cache.parse(CONFIG, fmtr)
+    assert tree == expected
+    with mock.patch.object(tabparser, "parse_to_tree", side_effect=AssertionError):
+        cached = cache.parse(CONFIG, fmtr)
+    assert cached == expected
+    assert list(cached["interface 10GE1/0/1"]) == ["description uplink", "port link-type trunk"]
+    assert cached is not tree
+
+
+def test_key_depends_on_formatter_and_text(cache):
+    key = cache.make_key(_formatter("huawei"), CONFIG)
+    assert key == cache.make_key(_formatter("huawei"), CONFIG)
+    assert key != cache.make_key(_formatter("arista"), CONFIG)
+    assert key != cache.make_key(_formatter("huawei"), CONFIG + "undo telnet server enable\n")
+
+
+def test_broken_entry_is_ignored(cache):
+    fmtr = _formatter("huawei")
+    key = cache.make_key(fmtr, CONFIG)
+    cache.parse(CONFIG, fmtr)
+    with open(cache._entry_path(key), "wb") as f:
+        f.write(b"broken")
+    assert cache.load(key) is None
+    assert cache.parse(CONFIG, fmtr) == tabparser.parse_to_tree(CONFIG, fmtr.split)
@@ -0,0 +1,123 @@
+import copy
+import pickle
+from collections import OrderedDict as odict
+from textwrap import dedent
+
+import pytest
+
+from annet import patching, rulebook
+from annet.annlib.configtree import EMPTY_TREE, ConfigTree, compact_tree
+from annet.annlib.netdev.views.hardware import HardwareView
+from annet.rulebook.common import default_diff
+from annet.rulebook.patching import compile_patching_text
+from annet.types import Op
+
+from .. import make_hw_stub
+
+
+@pytest.fixture
+def tree():
+    return odict(
+        [
+            ("interface 10GE1/0/1", odict([("description uplink", odict()), ("undo shutdown", odict())])),
+            ("interface 10GE1/0/2", odict([("undo shutdown", odict())])),
+            ("sysname sw1", odict()),
+        ]
+    )
+
+
+def test_compact_tree_keeps_rows_and_order(tree):
+    compact = compact_tree(tree)
+    assert isinstance(compact, ConfigTree)
+    assert compact == tree
+    assert list(compact) == list(tree)
+    assert list(compact["interface 10GE1/0/1"]) == ["description uplink", "undo shutdown"]
+    assert compact_tree(compact) is compact
+
+
+def test_compact_tree_shares_leaves_and_rows(tree):
+    compact = compact_tree(tree)
+    assert compact["sysname sw1"] is EMPTY_TREE
+    assert compact["interface 10GE1/0/2"]["undo shutdown"] is EMPTY_TREE
+    [first, second] = [list(compact[iface])[-1] for iface in ("interface 10GE1/0/1", "interface 10GE1/0/2")]
+    assert first is second
+
+
+def test_compact_tree_is_read_only(tree):
+    compact = compact_tree(tree)
+    with pytest.raises(TypeError):
+        compact["sysname sw2"] = EMPTY_TREE
+    with pytest.raises(TypeError):
+        del compact["sysname sw1"]
+    with pytest.raises(TypeError):
+        compact.pop("sysname sw1")
+    with pytest.raises(TypeError):
+        EMPTY_TREE.setdefault("row", EMPTY_TREE)
+    assert EMPTY_TREE == {}
+
+
+def test_compact_tree_copies(tree):
+    compact = compact_tree(tree)
+    for restored in (pickle.loads(pickle.dumps(compact)), copy.deepcopy(compact)):
+        assert isinstance(restored, ConfigTree)
+        assert list(restored) == list(tree)
+        assert restored == tree
+        assert restored["sysname sw1"] is EMPTY_TREE
+
+
+def test_compact_tree_compares_rows_in_order(tree):
+    compact = compact_tree(tree)
+    reordered = odict(reversed(tree.items()))
+    assert compact != reordered
+    assert compact != compact_tree(reordered)
+    assert compact_tree(reordered) == reordered
+
+
+def test_diff_of_reordered_multiline_children(ann_connectors):
+    rb = rulebook.get_rulebook(make_hw_stub("huawei"))
+
+    def config(*key_lines):
+        key = odict([("public-key-code begin", odict((line, odict()) for line in key_lines))])
+        return odict([("rsa peer-public-key k1", key)])
+
+    old, new = config("0001 AAAA", "0002 BBBB"), config("0002 BBBB", "0001 AAAA")
+    diff = patching.make_diff(old, new, rb, [])
+    assert diff
+    assert patching.make_diff(compact_tree(old), compact_tree(new), rb, []) == diff
+
+
+def test_diff_logic_of_compacted_trees(ann_connectors):
+    rb = rulebook.get_rulebook(HardwareView("B4com B4T-CS2148P", None))
+
+    def config(nested_key_line):
+        key = odict([("0201050201 03", odict([(nested_key_line, odict())]))])
+        return odict([("rsa key k1", key)])
+
+    # the modulus differs only in the nested row, so the keys must not be taken for equal
+    old, new = config("0203 010001"), config("0203 010003")
+    diff = patching.make_diff(old, new, rb, [])
+    assert diff
+    assert patching.make_diff(compact_tree(old), compact_tree(new), rb, []) == diff
+
+
+def mutating_diff_logic(old, new, diff_pre, _pops=(Op.AFFECTED,)):
+    """Breaks the contract: drops the children of the old rows in place"""
+    for children in old.values():
+        children.clear()
+    return default_diff(old, new, diff_pre, _pops)
+
+
+def test_diff_logic_must_not_modify_trees():
+    rb_text = dedent("""
+        interface ~   %diff_logic=tests.annet.test_configtree.mutating_diff_logic
+            ~
+    """).strip()
+    rb = {"patching": compile_patching_text(rb_text, "huawei")}
+    old = odict([("interface 10GE1/0/1", odict([("undo shutdown", odict())]))])
+    new = odict([("interface 10GE1/0/1", odict([("shutdown", odict())]))])
+
+    # the diff logics get the subtrees of the config as is, not copies of them
+    with pytest.raises(TypeError, match="ConfigTree is read-only"):
+        patching.make_diff(compact_tree(old), compact_tree(new), rb, [])
+    patching.make_diff(old, new, rb, [])
+    assert old == odict([("interface 10GE1/0/1", odict())])
@@ -0,0 +1,57 @@
+import tracemalloc
+
+import pytest
+
+from annet.annlib.configtree import compact_tree
+from annet.vendors import registry_connector, tabparser
+
+from .. import make_hw_stub
+
+
+INTERFACES_COUNT = 2000
+
+
+def _huawei_config():
+    lines = ["sysname sw1", "#", "vlan batch 1 to 4094", "#"]
+    for i in range(INTERFACES_COUNT):
+        lines += [
+            "interface 10GE1/0/%d" % i,
+            " description to-host-%d" % i,
+            " port link-type trunk",
+            " undo port trunk allow-pass vlan 1",
+            " port trunk allow-pass vlan 100 to 200",
+            " stp edge-port enable",
+            " lldp tlv-enable system-description",
+            "#",
+        ]
+    lines += ["bgp 65000", " router-id 10.0.0.1"]
+    for i in range(INTERFACES_COUNT // 4):
+        lines += [" peer 10.1.%d.%d as-number 65001" % divmod(i, 256), " peer 10.1.%d.%d group SPINE" % divmod(i, 256)]
+    lines += ["#", "return"]
+    return "\n".join(lines)
+
+
+def _traced_size(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+@pytest.fixture
+def huawei_text():
+    return _huawei_config()
+
+
+def test_compact_tree_memory(benchmark, huawei_text):
+    fmtr = registry_connector.get().match(make_hw_stub("huawei")).make_formatter()
+    tree, odict_size = _traced_size(lambda: tabparser.parse_to_tree(huawei_text, fmtr.split))
+    compact, compact_size = _traced_size(lambda: compact_tree(tabparser.parse_to_tree(huawei_text, fmtr.split)))
+    assert compact == tree
+    benchmark.extra_info.update({"odict_bytes": odict_size, "compact_bytes": compact_size})
+    assert compact_size * 2 < odict_size
+
+    benchmark(compact_tree, tree)
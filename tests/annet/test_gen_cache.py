@@ -0,0 +1,145 @@
+import importlib
+import os
+import sys
+from collections import OrderedDict as odict
+
+import pytest
+
+from annet import gen_cache
+from annet.gen_cache import CachedGeneration, GenCache, device_fingerprint, generator_modules, generators_fingerprint
+from annet.types import GeneratorPartialResult, GeneratorPerf
+
+from .. import make_hw_stub
+
+
+class FakeStorage:
+    pass
+
+
+class OtherStorage:
+    pass
+
+
+class FakeDevice:
+    def __init__(self, hostname, description, id=1, fqdn=None, storage_cls=FakeStorage):
+        self.id = id
+        self.fqdn = fqdn or hostname + ".example.com"
+        self.hostname = hostname
+        self.description = description
+        self.storage = storage_cls()
+        self.hw = make_hw_stub("huawei")
+
+    def dump(self, prefix):
+        return [
+            f"{prefix}.hostname = {self.hostname!r}",
+            f"{prefix}.description = {self.description!r}",
+            f"{prefix}.storage = {self.storage!r}",
+        ]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return GenCache(str(tmp_path))
+
+
+def _partial_result(name):
+    return GeneratorPartialResult(
+        name=name,
+        tags=[],
+        acl="sysname",
+        acl_rules={},
+        acl_safe="",
+        acl_safe_rules={},
+        output="sysname test\n",
+        config=odict([("sysname test", odict())]),
+        safe_config=odict(),
+        perf=GeneratorPerf(total=0.1, rt=None),
+    )
+
+
+def test_fingerprint_ignores_object_addresses():
+    assert device_fingerprint(FakeDevice("sw1", "x")) == device_fingerprint(FakeDevice("sw1", "x"))
+    assert device_fingerprint(FakeDevice("sw1", "x")) != device_fingerprint(FakeDevice("sw1", "y"))
+
+
+def test_key_depends_on_device_and_options(cache):
+    key = cache.make_key(FakeDevice("sw1", "x"), [], (False, False, None, False))
+    assert key == cache.make_key(FakeDevice("sw1", "x"), [], (False, False, None, False))
+    assert key != cache.make_key(FakeDevice("sw1", "y"), [], (False, False, None, False))
+    assert key != cache.make_key(FakeDevice("sw1", "x"), [], (True, False, None, False))
+
+
+def test_key_depends_on_device_identity(cache):
+    options = (False, False, None, False)
+    key = cache.make_key(FakeDevice("sw1", "x"), [], options)
+    assert key != cache.make_key(FakeDevice("sw1", "x", id=2), [], options)
+    assert key != cache.make_key(FakeDevice("sw1", "x", fqdn="sw1.example.net"), [], options)
+    assert key != cache.make_key(FakeDevice("sw1", "x", storage_cls=OtherStorage), [], options)
+
+
+def test_store_load(cache):
+    key = cache.make_key(FakeDevice("sw1", "x"), [], ())
+    assert cache.load(key) is None
+
+    cache.store(
+        key,
+        CachedGeneration(
+            partial_results={"Sysname": _partial_result("Sysname")}, entire_results={}, json_fragment_results={}
+        ),
+    )
+    entry = cache.load(key)
+    assert entry is not None
+    res = entry.to_result()
+    assert list(res.partial_results) == ["Sysname"]
+    assert res.config_tree() == odict([("sysname test", odict())])
+
+
+def test_broken_entry_is_a_miss(cache):
+    key = cache.make_key(FakeDevice("sw1", "x"), [], ())
+    cache.store(key, CachedGeneration(partial_results={}, entire_results={}, json_fragment_results={}))
+    with open(cache._entry_path(key), "wb") as f:
+        f.write(b"garbage")
+    assert cache.load(key) is None
+
+
+def test_fingerprint_depends_on_imported_modules(tmp_path, monkeypatch):
+    package = tmp_path / "fp_gens"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "helpers.py").write_text("def hostname(device):\n    return device.hostname\n")
+    (package / "lazy.py").write_text("")
+    (package / "gens.py").write_text(
+        "from annet.generators import PartialGenerator\n"
+        "from fp_gens.helpers import hostname\n"
+        "\n"
+        "class Hostname(PartialGenerator):\n"
+        "    def run_huawei(self, device):\n"
+        "        yield 'sysname', hostname(device)\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name in ("fp_gens", "fp_gens.helpers", "fp_gens.lazy", "fp_gens.gens"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    gens = importlib.import_module("fp_gens.gens")
+
+    # fp_gens.lazy is not imported yet, as if it was imported by a function at runtime
+    modules = generator_modules(["fp_gens.gens"])
+    assert {"fp_gens", "fp_gens.gens", "fp_gens.helpers", "fp_gens.lazy", "annet.generators"} <= set(modules)
+    assert not [name for name in modules if name.partition(".")[0] in ("os", "re", "collections")]
+
+    gen = gens.Hostname(FakeStorage())
+    fingerprint = generators_fingerprint([gen])
+    importlib.import_module("fp_gens.lazy")
+    assert generators_fingerprint([gen]) == fingerprint
+    helpers = package / "helpers.py"
+    helpers.write_text("def hostname(device):\n    return device.hostname.upper()\n")
+    os.utime(helpers, ns=(0, os.stat(helpers).st_mtime_ns + 10**9))
+    assert generators_fingerprint([gen]) != fingerprint
+
+
+def test_key_computes_generators_fingerprint_once(cache, monkeypatch):
+    calls = []
+    monkeypatch.setattr(gen_cache, "_classes_fingerprint", lambda classes: calls.append(classes) or "fingerprint")
+    gens = [FakeStorage(), FakeStorage()]
+    key = cache.make_key(FakeDevice("sw1", "x"), gens, ())
+    assert cache.make_key(FakeDevice("sw2", "x"), gens[::-1], ()) != key
+    assert calls == [frozenset([FakeStorage])]
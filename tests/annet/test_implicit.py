@@ -95,3 +95,50 @@ def test_ros_implicit_no_override_when_disabled(ros_config_enabled_no):
     result = implicit.config(ros_config_enabled_no, rules)
     ping = result.get("tool", {}).get("mac-server", {}).get("ping", {})
     assert "set enabled=yes" not in ping
+
+
+def test_compiled_rules_are_shared():
+    rules = implicit.compile_rules(mock.Mock(hw=make_hw_stub(VENDOR_ROS)))
+    assert implicit.compile_rules(mock.Mock(hw=make_hw_stub(VENDOR_ROS))) is rules
+
+
+def test_first_token():
+    rules = implicit.compile_tree(
+        implicit.parse_text("""
+        stp mode mstp
+        interface X?GigabitEthernet*
+            port link-type .*
+        X?GigabitEthernet*
+        ip-prefix ~
+        ~ %regexp=(?i)undo\\s+.*
+    """)
+    )
+    assert [rule["first_token"] for rule in rules.values()] == ["stp", "interface", None, "ip-prefix", None]
+    assert rules["interface X?GigabitEthernet*"]["children"]["port link-type .*"]["first_token"] == "port"
+
+
+def test_first_token_index_matches_full_scan():
+    rules = implicit.compile_tree(
+        implicit.parse_text("""
+        interface *
+            shutdown
+        stp mode mstp
+        X?GigabitEthernet.*
+    """)
+    )
+    config = odict(
+        [
+            ("stp\tmode mstp", odict()),
+            ("interface 10GE1/0/1", odict()),
+            ("GigabitEthernet0/0/1", odict()),
+            ("interface 10GE1/0/2", odict([("shutdown", odict())])),
+        ]
+    )
+    unindexed = {row: dict(rule, first_token=None) for row, rule in rules.items()}
+    assert implicit.config(config, rules) == implicit.config(config, unindexed)
+    assert list(implicit.config(config, rules)) == [
+        "interface 10GE1/0/1",
+        "interface 10GE1/0/2",
+        "stp\tmode mstp",
+        "GigabitEthernet0/0/1",
+    ]
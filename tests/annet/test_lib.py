@@ -1,8 +1,10 @@
 import ipaddress
+import os
 
 import pytest
 
-from annet.annlib.lib import LMSegment, LMSegmentList, LMSMatcher
+from annet.annlib import lib
+from annet.annlib.lib import LMSegment, LMSegmentList, LMSMatcher, mako_render
 
 
 def test_segment_cmp():
@@ -107,3 +109,26 @@ def test_search_v4_2():
     assert lm.find("10.255.255.176/32") == "10.255.255.176/29"
     assert lm.find("10.255.255.191/32") == "10.255.255.0/24"
     assert lm.find("10.255.255.192/32") == "10.255.255.192/29"
+
+
+def test_mako_render_compiles_template_once(monkeypatch):
+    monkeypatch.delenv(lib.MAKO_MODULE_DIRECTORY_ENV, raising=False)
+    template = "  % for i in range(n):\n  ${i}\n  % endfor\n"
+    assert mako_render(template, dedent=True, n=3) == "0\n1\n2"
+    compiled = lib._compile_mako(template, True, None)
+    assert mako_render(template, dedent=True, n=2) == "0\n1"
+    assert lib._compile_mako(template, True, None) is compiled
+
+
+def test_mako_render_module_directory(monkeypatch, tmp_path):
+    monkeypatch.setenv(lib.MAKO_MODULE_DIRECTORY_ENV, str(tmp_path))
+    template = "hostname ${name}\n"
+    assert mako_render(template, name="sw1") == "hostname sw1\n"
+    (module,) = tmp_path.glob("*.py")
+    mtime = module.stat().st_mtime_ns
+
+    # another process reuses the compiled module
+    lib._compile_mako.cache_clear()
+    assert mako_render(template, name="sw2") == "hostname sw2\n"
+    assert sorted(os.path.splitext(name)[1] for name in os.listdir(tmp_path)) == [".mako", ".py"]
+    assert module.stat().st_mtime_ns == mtime
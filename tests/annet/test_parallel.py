@@ -0,0 +1,418 @@
+import asyncio
+import multiprocessing as mp
+import os
+import pickle
+import signal
+import struct
+import time
+
+import pytest
+
+import annet
+from annet.parallel import (
+    DurationHistory,
+    Parallel,
+    PickleSafeException,
+    TaskResult,
+    _BatchDispatcher,
+    _MemoryWatcher,
+    _ResultChannel,
+    _SpilledResult,
+    add_task_extra,
+    get_rss,
+)
+
+
+def _square(device_id):
+    return device_id * device_id
+
+
+def _pid(device_id):
+    return os.getpid()
+
+
+def _fail_on_odd(device_id):
+    if device_id % 2:
+        raise ValueError("odd device %d" % device_id)
+    return device_id
+
+
+class FakeQueue:
+    def __init__(self):
+        self.items = []
+
+    def put(self, item):
+        self.items.append(item)
+
+
+class _Preload:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, pool):
+        self.calls += 1
+
+
+@pytest.mark.parametrize("backend", ["process", "thread", "inline", "asyncio"])
+@pytest.mark.parametrize("parallel", [1, 3])
+def test_run(parallel, backend):
+    pool = Parallel(_square).tune(parallel=parallel, parallel_backend=backend)
+    success, fail = pool.run(list(range(10)))
+    assert success == {i: i * i for i in range(10)}
+    assert fail == {}
+
+
+@pytest.mark.parametrize("backend", ["process", "thread", "inline", "asyncio"])
+@pytest.mark.parametrize("parallel", [1, 3])
+def test_run_tolerate_fails(parallel, backend):
+    pool = Parallel(_fail_on_odd).tune(parallel=parallel, parallel_backend=backend)
+    success, fail = pool.run(list(range(6)))
+    assert success == {0: 0, 2: 2, 4: 4}
+    assert sorted(fail) == [1, 3, 5]
+
+
+@pytest.mark.skipif(mp.get_start_method() != "fork", reason="workers inherit preloads only when forked")
+def test_preload_runs_before_tasks():
+    preload = _Preload()
+    pool = Parallel(_square).tune(parallel=2).add_preload(preload)
+    pool.run([1, 2, 3])
+    # forked workers inherit the parent's warmed up state
+    assert preload.calls == 1
+
+
+def test_get_rss():
+    if not os.path.exists("/proc/self/statm"):
+        pytest.skip("procfs is not available")
+    assert get_rss() > 0
+    assert get_rss(2**22 + 1) is None
+
+
+def test_max_worker_rss_recycles_workers():
+    if not os.path.exists("/proc/self/statm"):
+        pytest.skip("procfs is not available")
+    pool = Parallel(_pid).tune(parallel=2, max_worker_rss=1)
+    success, fail = pool.run(list(range(6)))
+    assert not fail
+    # every worker retires after its first task
+    assert len(set(success.values())) == 6
+
+
+def test_batch_dispatcher_adapts_batch_size():
+    dispatcher = _BatchDispatcher(range(1000), workers=2, max_batch_size=32, batch_time=0.5)
+    assert dispatcher.batch_size() == 1
+    dispatcher.observe(0.001)
+    assert dispatcher.batch_size() == 32
+    dispatcher.observe(10)
+    assert dispatcher.batch_size() == 1
+
+
+def test_batch_dispatcher_keeps_tail_balanced():
+    queues = {"Worker-%d" % i: FakeQueue() for i in range(4)}
+    dispatcher = _BatchDispatcher(range(40), workers=4, max_batch_size=32, batch_time=0.5)
+    dispatcher.observe(0.001)
+    dispatcher.feed(queues)
+    assert [len(task.payload) for task in queues["Worker-0"].items] == [5, 3]
+    assert [len(task.payload) for queue in queues.values() for task in queue.items] == [5, 3, 4, 2, 3, 2, 3, 2]
+    while not dispatcher.exhausted:
+        for name in queues:
+            dispatcher.batch_done(name)
+        dispatcher.feed(queues)
+    assert [len(queue.items[-1].payload) for queue in queues.values()] == [1, 1, 1, 1]
+    assert sorted(i for queue in queues.values() for task in queue.items for i in task.payload) == list(range(40))
+
+
+def test_batch_dispatcher_returns_batches_of_lost_worker():
+    queues = {"Worker-0": FakeQueue(), "Worker-1": FakeQueue()}
+    dispatcher = _BatchDispatcher(range(4), workers=2, max_batch_size=1, batch_time=0.5)
+    dispatcher.feed(queues)
+    assert dispatcher.current_batch("Worker-1") == [1]
+    assert dispatcher.worker_lost("Worker-1") == [[1], [3]]
+    assert dispatcher.outstanding == 2
+    dispatcher.retry([1, 3])
+    dispatcher.feed({"Worker-1": FakeQueue()})
+    assert dispatcher.worker_lost("Worker-1") == [[1], [3]]
+
+
+def test_batched_run_keeps_callbacks():
+    seen = []
+
+    def progress(pool, task_result):
+        seen.append((pool.tasks_done, task_result.device_id))
+        return task_result
+
+    pool = Parallel(_fail_on_odd).tune(parallel=2, batch_time=10).add_callback(progress)
+    success, fail = pool.run(list(range(100)))
+    assert success == {i: i for i in range(0, 100, 2)}
+    assert sorted(fail) == list(range(1, 100, 2))
+    assert sorted(device_id for _, device_id in seen) == list(range(100))
+    assert [done for done, _ in seen] == list(range(1, 101))
+
+
+def test_duration_history_schedules_longest_first(tmp_path):
+    path = str(tmp_path / "durations.json")
+    history = DurationHistory(path, "gen")
+    assert history.schedule([1, 2, 3]) == [1, 2, 3]
+    assert history.predict_makespan([1, 2, 3], 2) is None
+
+    history.update({1: 1.0, 2: 5.0, 3: 3.0})
+    history.save()
+    history = DurationHistory(path, "gen")
+    # unknown devices are expected to take the mean time
+    assert history.schedule([1, 2, 3, 4]) == [2, 3, 4, 1]
+    assert history.predict_makespan([2, 3, 4, 1], 2) == 6.0
+    assert DurationHistory(path, "diff").schedule([1, 2, 3]) == [1, 2, 3]
+
+    history.update({2: 1.0})
+    assert history.expected(2) == 3.0
+
+
+def test_run_with_duration_history(tmp_path):
+    path = str(tmp_path / "durations.json")
+    pool = Parallel(_square).tune(parallel=2, duration_history=path)
+    success, fail = pool.run(list(range(6)))
+    assert success == {i: i * i for i in range(6)}
+    assert pool.makespan_report is not None
+    assert pool.makespan_report.predicted is None
+    assert pool.makespan_report.devices == 6
+
+    pool.run(list(range(6)))
+    assert pool.makespan_report.predicted is not None
+    history = DurationHistory(path, "%s._square" % __name__)
+    assert all(history.expected(i) is not None for i in range(6))
+
+
+def _exit_on_twenty(device_id):
+    if device_id == 20:
+        os._exit(1)
+    return device_id
+
+
+@pytest.mark.parametrize("max_batch_size", [1, 8])
+def test_run_survives_crashed_worker(max_batch_size):
+    pool = Parallel(_exit_on_twenty).tune(parallel=2, max_batch_size=max_batch_size)
+    success, fail = pool.run(list(range(40)))
+    # the crashed worker's device is failed, the rest of its batch is run by the others
+    assert success == {i: i for i in range(40) if i != 20}
+    assert list(fail) == [20]
+    assert fail[20].orig_exc_cls is annet.ExecError
+
+
+def test_run_retries_batch_taken_by_crashed_worker(monkeypatch, tmp_path):
+    if mp.get_start_method() != "fork":
+        pytest.skip("the patched channel reaches only forked workers")
+    put = _ResultChannel.put
+    marker = tmp_path / "crashed"
+
+    def crash_on_taking(channel, message):
+        # crash between taking the batch with the device and telling the parent about it, once
+        if len(message) == 2 and 7 in message[1] and not marker.exists():
+            marker.touch()
+            os._exit(1)
+        put(channel, message)
+
+    monkeypatch.setattr(_ResultChannel, "put", crash_on_taking)
+    pool = Parallel(_square).tune(parallel=2, task_timeout=20)
+    success, fail = pool.run(list(range(20)))
+    assert success == {i: i * i for i in range(20)}
+    assert fail == {}
+
+
+def test_run_survives_killed_idle_workers():
+    killed = []
+
+    def kill_idle_workers(pool, task_result):
+        if not killed:
+            # the workers run out of the batches sent to them while the parent is busy here
+            time.sleep(1)
+            killed.extend(mp.active_children())
+            for worker in killed:
+                os.kill(worker.pid, signal.SIGKILL)
+        return task_result
+
+    pool = Parallel(_square).tune(parallel=2, max_batch_size=1, task_timeout=20).add_callback(kill_idle_workers)
+    success, fail = pool.run(list(range(20)))
+    assert len(killed) == 2
+    assert success == {i: i * i for i in range(20)}
+    assert fail == {}
+
+
+def test_crashed_worker_stops_run():
+    pool = Parallel(_exit_on_twenty).tune(parallel=2)
+    with pytest.raises(annet.ExecError):
+        pool.run(list(range(40)), tolerate_fails=False)
+
+
+def test_thread_backend_shares_process():
+    pool = Parallel(_pid).tune(parallel=3, parallel_backend="thread")
+    success, _ = pool.run(list(range(6)))
+    assert set(success.values()) == {os.getpid()}
+
+
+def test_thread_backend_stops_on_fail():
+    pool = Parallel(_fail_on_odd).tune(parallel=2, parallel_backend="thread")
+    with pytest.raises(PickleSafeException):
+        list(pool.irun(list(range(6)), tolerate_fails=False))
+
+
+async def _async_square(device_id):
+    await asyncio.sleep(0.01 * (3 - device_id % 3))
+    return device_id * device_id
+
+
+def test_asyncio_backend_runs_coroutines():
+    pool = Parallel(_async_square).tune(parallel=3, parallel_backend="asyncio")
+    success, fail = pool.run(list(range(10)))
+    assert success == {i: i * i for i in range(10)}
+    assert fail == {}
+
+
+def test_asyncio_backend_stops_on_fail():
+    pool = Parallel(_fail_on_odd).tune(parallel=2, parallel_backend="asyncio")
+    with pytest.raises(PickleSafeException):
+        list(pool.irun(list(range(6)), tolerate_fails=False))
+
+
+def _print_pid(device_id):
+    print("device %d" % device_id)
+    return os.getpid()
+
+
+def test_thread_backend_falls_back_to_processes_to_capture_output():
+    outputs = {}
+    pool = Parallel(_print_pid).tune(parallel=2, parallel_backend="thread", capture_output=True)
+    pool.add_callback(
+        lambda pool, task_result: outputs.update({task_result.device_id: task_result.extra["cap_stdout"]})
+    )
+    success, _ = pool.run(list(range(4)))
+    assert os.getpid() not in success.values()
+    assert outputs == {i: "device %d\n" % i for i in range(4)}
+
+
+def _big_result(device_id):
+    return {"device": device_id, "config": "x" * 4096}
+
+
+def test_large_results_are_spilled(monkeypatch, tmp_path):
+    monkeypatch.setattr("annet.parallel._spill_root", lambda: str(tmp_path))
+    pool = Parallel(_big_result).tune(parallel=2, spill_threshold=1024)
+    success, fail = pool.run(list(range(4)))
+    assert not fail
+    assert success == {i: _big_result(i) for i in range(4)}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spilled_result_is_loaded_lazily(tmp_path):
+    task_result = TaskResult("Worker-0", 1, _SpilledResult.spill(pickle.dumps(_big_result(1)), str(tmp_path)))
+    received = pickle.loads(pickle.dumps(task_result))
+    # the receiver owns the data now
+    assert list(tmp_path.iterdir()) == []
+    assert isinstance(received._result, _SpilledResult)
+    assert received.result == _big_result(1)
+    assert received.result == _big_result(1)
+
+
+def _result_type(pool, task_result):
+    task_result.result = type(task_result.result).__name__
+    return task_result
+
+
+def test_in_thread_callbacks_get_raw_results(monkeypatch, tmp_path):
+    monkeypatch.setattr("annet.parallel._spill_root", lambda: str(tmp_path))
+    pool = Parallel(_big_result).tune(parallel=2, spill_threshold=1024)
+    pool.add_callback(_result_type, in_thread=True)
+    success, fail = pool.run(list(range(4)))
+    assert not fail
+    assert success == {i: "dict" for i in range(4)}
+
+
+def test_spill_dir_is_removed_on_error(monkeypatch, tmp_path):
+    monkeypatch.setattr("annet.parallel._spill_root", lambda: str(tmp_path))
+    pool = Parallel(_fail_on_odd).tune(parallel=2)
+    with pytest.raises(PickleSafeException):
+        pool.run(list(range(4)), tolerate_fails=False)
+    assert list(tmp_path.iterdir()) == []
+
+
+def _hang_on_three(device_id):
+    if device_id == 3:
+        time.sleep(60)
+    return device_id
+
+
+@pytest.mark.parametrize("retries", [0, 1])
+def test_device_timeout_replaces_stuck_worker(retries):
+    pool = Parallel(_hang_on_three).tune(parallel=2, device_timeout=0.5, device_timeout_retries=retries, batch_time=10)
+    start = time.monotonic()
+    success, fail = pool.run(list(range(8)))
+    assert time.monotonic() - start < 30
+    assert success == {i: i for i in range(8) if i != 3}
+    assert list(fail) == [3]
+    assert fail[3].orig_exc_cls is TimeoutError
+
+
+def test_memory_budget_recycles_workers():
+    if not os.path.exists("/proc/self/statm"):
+        pytest.skip("procfs is not available")
+    # the budget is always exceeded, so the run goes a batch at a time recycling the workers
+    pool = Parallel(_pid).tune(parallel=2, memory_budget=1, memory_check_interval=0.01, max_batch_size=1)
+    success, fail = pool.run(list(range(6)))
+    assert not fail
+    assert sorted(success) == list(range(6))
+    assert pool.peak_rss
+    assert all(rss > 0 for rss in pool.peak_rss.values())
+
+
+def test_result_channel_stops_at_truncated_message():
+    channel = _ResultChannel()
+    channel.put(("Worker-0", [1, 2]))
+    # a worker killed amid sending a message: a header of a 100 bytes message with 10 bytes of it
+    os.write(channel._writer.fileno(), struct.pack("!i", 100) + b"x" * 10)
+    channel.detach_writer()
+    assert channel.get_all() == [("Worker-0", [1, 2])]
+    channel.close()
+
+
+class _FakeWorker:
+    pid = os.getpid()
+    exitcode = None
+
+
+def test_memory_watcher_signals_only_ready_workers(monkeypatch):
+    if not os.path.exists("/proc/self/statm"):
+        pytest.skip("procfs is not available")
+    killed = []
+    monkeypatch.setattr("annet.parallel.os.kill", lambda pid, signum: killed.append(pid))
+    watcher = _MemoryWatcher(budget=1)
+    pool = {"Worker-0": _FakeWorker()}
+    # the worker may have not installed the SIGUSR2 handler yet
+    assert not watcher.check(pool)
+    assert killed == []
+
+    watcher.ready("Worker-0")
+    assert not watcher.check(pool)
+    assert killed == [os.getpid()]
+    # it's asked once
+    assert not watcher.check(pool)
+    assert killed == [os.getpid()]
+
+    watcher.retired("Worker-0")
+    assert not watcher.check(pool)
+    assert killed == [os.getpid()]
+
+
+def _with_extra(device_id):
+    add_task_extra("seen", device_id)
+    return device_id
+
+
+@pytest.mark.parametrize("backend", ["process", "thread", "inline", "asyncio"])
+def test_task_extra_reaches_callbacks_and_finalizers(backend):
+    seen = {}
+    finished = []
+    pool = Parallel(_with_extra).tune(parallel=2, parallel_backend=backend)
+    pool.add_callback(lambda pool, task_result: seen.update({task_result.device_id: task_result.extra["seen"]}))
+    pool.add_finalizer(lambda pool: finished.append(dict(seen)))
+    pool.run(list(range(4)))
+    assert seen == {i: [i] for i in range(4)}
+    assert finished == [seen]
+    add_task_extra("seen", "outside of a task")
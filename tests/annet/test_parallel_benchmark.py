@@ -0,0 +1,60 @@
+import pytest
+
+from annet import api, cli, cli_args
+from annet.lib import get_context
+from annet.parallel import ParallelBackend
+
+
+DEVICES_COUNT = 16
+
+CONTEXT = """
+generators:
+  default:
+    - annet_generators.example
+storage:
+  default:
+    adapter: file
+    params:
+      path: {devices}
+context:
+  default:
+    generators: default
+    storage: default
+selected_context: default
+"""
+
+
+@pytest.fixture
+def gen_context(tmp_path, monkeypatch):
+    devices = tmp_path / "devices.yml"
+    devices.write_text(
+        "devices:\n"
+        + "".join(
+            "  - fqdn: sw%d.example.com\n    vendor: %s\n" % (i, ("huawei", "juniper", "arista")[i % 3])
+            for i in range(DEVICES_COUNT)
+        )
+    )
+    context = tmp_path / "context.yml"
+    context.write_text(CONTEXT.format(devices=devices))
+    monkeypatch.setenv("ANN_CONTEXT_CONFIG_PATH", str(context))
+    get_context.cache_clear()
+    yield
+    get_context.cache_clear()
+
+
+@pytest.mark.parametrize("backend", [backend.value for backend in ParallelBackend])
+def test_gen_backends(benchmark, gen_context, backend):
+    args = cli_args.ShowGenOptions(
+        query=["sw%d.example.com" % i for i in range(DEVICES_COUNT)],
+        parallel=4,
+        parallel_backend=backend,
+        indent="  ",
+    )
+
+    def run_gen():
+        with cli.get_loader(args, args) as loader:
+            return api.gen(args, loader)
+
+    success, fail = benchmark(run_gen)
+    assert len(success) == DEVICES_COUNT
+    assert not fail
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from annet import generators
+from annet.generators import PartialGenerator, RefGenerator
+
+from .. import make_hw_stub
+
+
+class FakeStorage:
+    def flush_perf(self):
+        return None
+
+
+class FakeDevice:
+    id = 1
+    hostname = "sw1"
+
+    def __init__(self):
+        self.hw = make_hw_stub("huawei")
+
+
+class Slow(PartialGenerator):
+    def run_huawei(self, device):
+        time.sleep(0.1)
+        yield "sysname", device.hostname
+
+
+class Policy(PartialGenerator):
+    def run_huawei(self, device):
+        with self.block("route-policy RP permit node 10"):
+            yield "if-match ip-prefix PL"
+
+
+class Unsupported(PartialGenerator):
+    pass
+
+
+class PrefixList(RefGenerator):
+    def ref_huawei(self, device):
+        return """
+        route-policy
+            if-match ip-prefix <name>
+        """
+
+    done = threading.Event()
+
+    def run_huawei(self, device):
+        self.done.set()
+        yield "ip ip-prefix PL index 10 permit 10.0.0.0 8"
+
+
+class Threads(PartialGenerator):
+    seen = set()
+
+    def run_huawei(self, device):
+        self.seen.add(threading.current_thread().name)
+        yield "threads"
+
+
+def _run(gen_threads, *gen_classes):
+    run_args = generators.GeneratorPartialRunArgs(FakeDevice(), gen_threads=gen_threads)
+    gens = [cls(FakeStorage()) for cls in gen_classes]
+    return generators.run_partial_generators(gens, [PrefixList(FakeStorage())], run_args)
+
+
+@pytest.mark.parametrize("gen_threads", [None, 1, 4])  # None when GenOptions are built without argparse
+def test_results_order_does_not_depend_on_threads(gen_threads):
+    res = _run(gen_threads, Slow, Policy, Unsupported, Threads)
+    assert list(res.partial_results) == ["Slow", "Policy", "Threads", "PrefixList"]
+    assert list(res.config_tree()) == [
+        "sysname sw1",
+        "route-policy RP permit node 10",
+        "threads",
+        "ip ip-prefix PL index 10 permit 10.0.0.0 8",
+    ]
+    assert res.ref_track.cfgs[PrefixList] == res.partial_results["PrefixList"].config
+
+
+class WaitingForRef(PartialGenerator):
+    def run_huawei(self, device):
+        # the ref generator of the next generator doesn't wait for this one
+        assert PrefixList.done.wait(5)
+        yield "waited"
+
+
+def test_independent_generators_run_concurrently():
+    Threads.seen = set()
+    PrefixList.done.clear()
+    res = _run(4, WaitingForRef, Policy, Threads)
+    assert list(res.partial_results) == ["WaitingForRef", "Policy", "Threads", "PrefixList"]
+    assert threading.current_thread().name not in Threads.seen
+
+
+class Broken(PartialGenerator):
+    def run_huawei(self, device):
+        raise ValueError("broken")
+        yield
+
+
+def test_first_error_is_raised():
+    with pytest.raises(generators.GeneratorError):
+        _run(4, Slow, Broken)
+
+
+class RtStorage:
+    def flush_perf(self):
+        return {"get": [{"time": 0.1}]}
+
+
+@pytest.mark.parametrize("gen_threads, rt", [(1, {"get": [{"time": 0.1}]}), (4, None)])
+def test_storage_rt_is_not_collected_by_threads(gen_threads, rt):
+    run_args = generators.GeneratorPartialRunArgs(FakeDevice(), gen_threads=gen_threads)
+    res = generators.run_partial_generators([Slow(RtStorage()), Policy(RtStorage())], [], run_args)
+    assert [result.perf.rt for result in res.partial_results.values()] == [rt, rt]
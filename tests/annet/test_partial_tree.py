@@ -0,0 +1,105 @@
+import pickle
+from collections import OrderedDict as odict
+
+import pytest
+
+from annet.generators import PartialGenerator
+from annet.types import GeneratorPartialResult, GeneratorPerf
+from annet.vendors import registry_connector, tabparser
+
+from .. import make_hw_stub
+
+
+class FakeDevice:
+    def __init__(self, vendor):
+        self.hw = make_hw_stub(vendor)
+
+
+class Interfaces(PartialGenerator):
+    def run(self, device):
+        yield "sysname", "sw1"
+        for name in ("10GE1/0/1", "10GE1/0/2", "10GE1/0/1"):
+            with self.block("interface", name):
+                yield "description  uplink"
+                yield ""
+                yield "# comment"
+                with self.block("ipv6 address auto"):
+                    yield "enable"
+        with self.multiblock("route-policy A permit node 10", "if-match"):
+            yield "end-list"
+        yield "undo telnet server enable"
+
+
+class OwnIndents(PartialGenerator):
+    def run(self, device):
+        yield """
+            interface Vlan1
+              ip address 10.0.0.1/24
+        """
+
+
+class FlatBlock(PartialGenerator):
+    def run(self, device):
+        with self.block("ip prefix-list A", indent=""):
+            yield "seq 10 permit 10.0.0.0/8"
+
+
+class EmptyHeader(PartialGenerator):
+    def run(self, device):
+        with self.block(""):
+            yield "sysname sw1"
+
+
+def _trees(gen_cls, vendor):
+    device = FakeDevice(vendor)
+    fmtr = registry_connector.get().match(device.hw).make_formatter()
+    gen = gen_cls(storage=None)
+    split_row = tabparser.row_splitter(fmtr)
+    assert split_row is not None
+    direct = gen._generate(device, split_row)
+    parsed = tabparser.parse_to_tree(text=gen(device), splitter=fmtr.split)
+    return direct, parsed
+
+
+@pytest.mark.parametrize("vendor", ["huawei", "arista", "aruba", "pc"])
+def test_direct_tree_matches_parsed_text(vendor):
+    direct, parsed = _trees(Interfaces, vendor)
+    assert direct == parsed
+    assert list(direct) == list(parsed)
+
+
+@pytest.mark.parametrize("gen_cls", [OwnIndents, FlatBlock, EmptyHeader])
+def test_direct_tree_falls_back_to_text(gen_cls):
+    direct, parsed = _trees(gen_cls, "huawei")
+    assert direct is None
+    assert parsed
+
+
+@pytest.mark.parametrize("vendor", ["juniper", "cisco", "nexus", "routeros"])
+def test_row_splitter_needs_matching_split(vendor):
+    fmtr = registry_connector.get().match(make_hw_stub(vendor)).make_formatter()
+    assert tabparser.row_splitter(fmtr) is None
+
+
+def test_deferred_output_is_pickled_unrendered():
+    device = FakeDevice("huawei")
+    gen = Interfaces(storage=None)
+    text = gen(device)
+    result = GeneratorPartialResult(
+        name="Interfaces",
+        tags=[],
+        acl="",
+        acl_rules={},
+        acl_safe="",
+        acl_safe_rules={},
+        output=gen._deferred_render(),
+        config=odict(),
+        safe_config=odict(),
+        perf=GeneratorPerf(total=0, rt=None),
+    )
+    # the next run of the generator doesn't change the output of the previous one
+    gen(device)
+    received = pickle.loads(pickle.dumps(result))
+    assert not isinstance(result._output, str)
+    assert not isinstance(received._output, str)
+    assert received.output == text
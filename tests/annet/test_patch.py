@@ -1,9 +1,11 @@
+import copy
 import os
 from unittest import mock
 
 import pytest
 
 from annet import deploy, implicit, lib, patching, rulebook
+from annet.annlib import patching as patching_impl
 from annet.vendors import registry_connector
 
 from .. import make_hw_stub
@@ -27,7 +29,10 @@ def test_patch(name, sample, ann_connectors):
     old = lib.merge_dicts(old, implicit.config(old, implicit_rules))
     new = lib.merge_dicts(new, implicit.config(new, implicit_rules))
 
+    old_copy, new_copy = copy.deepcopy(old), copy.deepcopy(new)
     diff = patching.make_diff(old, new, rb, [])
+    # the configs are not copied, the diff logics must leave them intact
+    assert (old, new) == (old_copy, new_copy)
     pre = patching.make_pre(diff)
 
     fake_environ = os.environ.copy()
@@ -44,3 +49,65 @@ def test_patch(name, sample, ann_connectors):
         generated.append("%s%s\n" % ("  " * cmd.level, str(cmd)))
 
     assert "".join(generated) == expected_patch, "Wrong patch in %s" % name
+
+
+def _all_rules_matches(row, rules):
+    matches = []
+    for (raw_rule, rule), is_global in patching_impl._rules_local_global(rules):
+        if match := rule["attrs"]["regexp"].match(row):
+            if rule["type"] == "ignore":
+                return []
+            similarity = patching_impl.string_similarity(row, rule["attrs"]["regexp"].pattern)
+            matches.append((similarity, (raw_rule, match.groups(), not is_global)))
+    matches.sort(key=lambda item: item[0], reverse=True)
+    return [item for _, item in matches]
+
+
+@pytest.mark.parametrize("name, sample", patch_data.get_samples(dirname="annet/test_patch"))
+def test_indexed_rules_matching(name, sample, ann_connectors):
+    hw = make_hw_stub(sample.get("vendor", "huawei").lower())
+    old, new, _ = patch_data.get_configs(hw, sample)
+
+    def check(tree, rules):
+        for row, children in tree.items():
+            matches = patching_impl._find_rules_matches(row, rules)
+            expected = _all_rules_matches(row, rules)
+            assert [(m["raw_rule"], m["key"], cr) for (_, cr), m in matches] == expected, row
+            if matches:
+                _, children_rules = patching_impl._select_match(matches, rules)
+                check(children, children_rules)
+
+    rules = rulebook.get_rulebook(hw)["patching"]
+    check(old, rules)
+    check(new, rules)
+
+
+def _iter_paths(tree, path=()):
+    for row, children in tree.items():
+        yield path + (row,)
+        yield from _iter_paths(children, path + (row,))
+
+
+def _full_scan(rules):
+    for rule in rules:
+        rule.tokens = None
+        _full_scan(rule.children)
+
+
+@pytest.mark.parametrize("name, sample", patch_data.get_samples(dirname="annet/test_patch"))
+def test_precompiled_ordering(name, sample, ann_connectors):
+    hw = make_hw_stub(sample.get("vendor", "huawei").lower())
+    old, new, _ = patch_data.get_configs(hw, sample)
+    orderer = patching.Orderer.from_hw(hw)
+
+    ordered = orderer.order_config(new)
+    assert list(_iter_paths(orderer.order_config(new))) == list(_iter_paths(ordered))
+
+    # skipping the rules by the first word of the rows does not change the orders
+    unindexed = patching_impl._CompiledOrdering(orderer.rb, orderer.vendor)
+    _full_scan(unindexed.rules)
+    for path in [*_iter_paths(old), *_iter_paths(new)]:
+        for cmd_direct in (True, False):
+            for scope in (None, "patch"):
+                expected = patching_impl._get_order(unindexed, path, cmd_direct, (), scope)
+                assert orderer.get_order(path, cmd_direct, scope=scope) == expected, path
@@ -5,7 +5,7 @@ from textwrap import dedent
 import pytest
 
 from annet.annlib.rbparser import syntax
-from annet.patching import PatchTree, make_diff, make_patch, make_pre
+from annet.patching import PatchTree, make_diff, make_patch, make_pre, prune_diff_rb
 from annet.rulebook.common import default, default_diff, ordered_diff
 from annet.rulebook.patching import _make_reverse, compile_patching_text
 from annet.types import Op
@@ -240,3 +240,43 @@ def test_make_reverse(row, expected):
     # the number of {} must match the number of capturing groups produced for the
     # row, since reverse.format(*match.groups()) relies on that invariant
     assert reverse.count("{}") == syntax.compile_row_regexp(row).groups
+
+
+def test_prune_diff_rb_shares_untouched_subtrees():
+    rb = {"patching": compile_patching_text("interface ~\n    description ~\nsysname ~", "huawei")}
+    old = odict(
+        [
+            ("interface 10GE1/0/1", odict([("description old", odict())])),
+            ("interface 10GE1/0/2", odict([("description x", odict()), ("shutdown", odict())])),
+            ("sysname sw1", odict()),
+        ]
+    )
+    new = odict([("interface 10GE1/0/1", odict([("description new", odict())])), ("unknown", odict())])
+
+    diff_pre, pruned_old, pruned_new = prune_diff_rb(old, new, rb)
+    assert list(diff_pre) == ["interface 10GE1/0/1", "interface 10GE1/0/2", "sysname sw1"]
+    assert list(pruned_old["interface 10GE1/0/2"]) == ["description x"]
+    assert pruned_old["interface 10GE1/0/1"] is old["interface 10GE1/0/1"]
+    assert "shutdown" in old["interface 10GE1/0/2"]
+    assert pruned_new == odict([("interface 10GE1/0/1", odict([("description new", odict())]))])
+    assert pruned_new["interface 10GE1/0/1"] is new["interface 10GE1/0/1"]
+    assert "unknown" in new
+    assert prune_diff_rb(pruned_old, pruned_new, rb)[1:] == (pruned_old, pruned_new)
+    assert prune_diff_rb(pruned_old, pruned_new, rb)[1] is pruned_old
+
+
+def test_diff_keeps_moved_rows_when_sibling_is_pruned():
+    rb = {"patching": compile_patching_text("acl ~\n    rule ~ %ordered", "huawei")}
+    old = odict([("acl A", odict([("rule 1", odict()), ("rule 2", odict())]))])
+    new = odict([("acl A", odict([("rule 2", odict()), ("rule 1", odict()), ("description x", odict())]))])
+
+    _, pruned_old, pruned_new = prune_diff_rb(old, new, rb)
+    assert list(pruned_old["acl A"]) == ["rule 1", "rule 2"]
+    assert list(pruned_new["acl A"]) == ["rule 2", "rule 1"]
+
+    [(op, row, children, _match)] = make_diff(old, new, rb, [])
+    assert (op, row) == (Op.AFFECTED, "acl A")
+    assert [(child_op, child_row) for child_op, child_row, _, _ in children] == [
+        (Op.MOVED, "rule 2"),
+        (Op.MOVED, "rule 1"),
+    ]
@@ -0,0 +1,48 @@
+import pytest
+
+from annet import rulebook
+from annet.annlib import patching
+
+from .. import make_hw_stub
+
+
+ROWS = {
+    "huawei": [
+        "interface 10GE1/0/1",
+        "sysname sw1",
+        "bgp 65000",
+        "ip ip-prefix PL index 10 permit 10.0.0.0 8",
+        "route-policy RP permit node 10",
+        "stelnet server enable",
+        "undo telnet server enable",
+        "vlan batch 1 to 4094",
+        "unknown command",
+    ],
+    "juniper": ["interfaces", "protocols", "policy-options", "system", "routing-options", "unknown"],
+}
+
+
+@pytest.mark.parametrize("vendor", list(ROWS))
+def test_match_rows_to_rules(benchmark, ann_connectors, vendor):
+    rules = rulebook.get_rulebook(make_hw_stub(vendor))["patching"]
+    rows = ROWS[vendor] * 100
+
+    def match_rows():
+        return [patching._match_row_to_rules(row, rules) for row in rows]
+
+    matched = benchmark(match_rows)
+    assert any(match for match, _ in matched)
+
+
+@pytest.mark.parametrize("vendor", list(ROWS))
+def test_get_order(benchmark, ann_connectors, vendor):
+    orderer = patching.Orderer(rulebook.get_rulebook(make_hw_stub(vendor))["ordering"], vendor)
+    ordering = patching._compiled_ordering(orderer.rb, orderer.vendor)
+    rows = [(row,) for row in ROWS[vendor]] * 100
+
+    def order_rows():
+        # not memoized, so that the lookups themselves are measured
+        return [patching._get_order(ordering, row, True, (), None) for row in rows]
+
+    orders = benchmark(order_rows)
+    assert orders[0] == orderer.get_order(rows[0], cmd_direct=True)
@@ -0,0 +1,89 @@
+import csv
+import json
+
+from annet.parallel import TaskResult
+from annet.perf_report import (
+    ALL_GENS,
+    PERF_EXTRA_KEY,
+    STAGES_EXTRA_KEY,
+    GeneratorPerfReport,
+    stages_path,
+    timed_stage,
+)
+
+
+def _perf(total, rt_times=()):
+    return {"total": total, "rt": {"get_device": [{"time": t, "op": "call"} for t in rt_times]}, "meta": {}}
+
+
+def _report():
+    report = GeneratorPerfReport()
+    for i in range(1, 101):
+        task_result = TaskResult("Worker-0", i)
+        task_result.extra[PERF_EXTRA_KEY] = [
+            {ALL_GENS: {"total": i / 100 + 0.001}, "Interfaces": _perf(i / 100, [0.01]), "Hostname": _perf(0.001)}
+        ]
+        task_result.extra[STAGES_EXTRA_KEY] = [{"get_config": 0.5, "make_diff": i / 1000}]
+        assert report(None, task_result) is task_result
+    return report
+
+
+def test_rows():
+    hostname, interfaces = sorted(_report().rows(), key=lambda row: row["generator"])
+    assert interfaces["count"] == 100
+    assert round(interfaces["total"], 6) == 50.5
+    assert round(interfaces["p50"], 6) == 0.505
+    assert round(interfaces["p99"], 6) == 0.9901
+    assert interfaces["max"] == 1.0
+    assert round(interfaces["rt_total"], 6) == 1.0
+    assert interfaces["rt_calls"] == 100
+    assert hostname["rt_calls"] == 0
+    assert [row["generator"] for row in _report().rows()] == ["Interfaces", "Hostname"]
+
+
+def test_write(tmp_path):
+    report = _report()
+    report.write(str(tmp_path / "perf.json"))
+    with open(tmp_path / "perf.json") as f:
+        assert json.load(f) == report.rows()
+
+    report.write(str(tmp_path / "perf.csv"))
+    with open(tmp_path / "perf.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["generator"] for row in rows] == ["Interfaces", "Hostname"]
+    assert rows[0]["count"] == "100"
+
+
+def test_stage_rows():
+    report = _report()
+    assert [row["generator"] for row in report.rows()] == ["Interfaces", "Hostname"]
+    get_config, make_diff = report.stage_rows()
+    assert (get_config["stage"], get_config["count"], get_config["total"]) == ("get_config", 100, 50.0)
+    assert make_diff["stage"] == "make_diff"
+    assert make_diff["max"] == 0.1
+
+
+def test_write_stages(tmp_path):
+    report = _report()
+    report.write(str(tmp_path / "perf.csv"))
+    assert stages_path(str(tmp_path / "perf.csv")) == str(tmp_path / "perf.stages.csv")
+    with open(tmp_path / "perf.stages.csv") as f:
+        assert [row["stage"] for row in csv.DictReader(f)] == ["get_config", "make_diff"]
+
+
+def test_timed_stage():
+    perf = {"Hostname": _perf(0.1)}
+    stages = {}
+    for _ in range(2):
+        with timed_stage(stages, "make_diff"):
+            pass
+    with timed_stage(None, "make_pre"):
+        pass
+    assert list(stages) == ["make_diff"]
+    assert stages["make_diff"] >= 0
+
+    report = GeneratorPerfReport()
+    report.add(perf)
+    report.add_stages(stages)
+    assert [row["generator"] for row in report.rows()] == ["Hostname"]
+    assert [row["stage"] for row in report.stage_rows()] == ["make_diff"]
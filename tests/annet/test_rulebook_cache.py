@@ -0,0 +1,75 @@
+from unittest import mock
+
+import pytest
+
+from annet.rulebook import DefaultRulebookProvider
+from annet.rulebook.cache import RULEBOOK_CACHE_PATH_ENV
+
+from .. import make_hw_stub
+
+
+@pytest.fixture
+def cache_path(ann_connectors, monkeypatch, tmp_path):
+    monkeypatch.setenv(RULEBOOK_CACHE_PATH_ENV, str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.parametrize("vendor", ["huawei", "cisco", "juniper", "routeros"])
+def test_rulebook_is_cached(cache_path, monkeypatch, vendor):
+    hw = make_hw_stub(vendor)
+    compiled = DefaultRulebookProvider().get_rulebook(hw)
+    assert list(cache_path.glob("*/*.pickle"))
+
+    with mock.patch.object(DefaultRulebookProvider, "_compile_rulebook", side_effect=AssertionError):
+        cached = DefaultRulebookProvider().get_rulebook(hw)
+    assert cached is not compiled
+    assert cached["texts"] == compiled["texts"]
+    assert cached["patching"] == compiled["patching"]
+
+    monkeypatch.delenv(RULEBOOK_CACHE_PATH_ENV)
+    assert DefaultRulebookProvider().compiled_cache is None
+    assert DefaultRulebookProvider().get_rulebook(hw)["texts"] == compiled["texts"]
+
+
+def test_precompile(cache_path, monkeypatch):
+    provider = DefaultRulebookProvider()
+    hw = make_hw_stub("huawei")
+    assert provider.precompile(hw)
+    assert not provider.precompile(hw)
+    hw.soft = "VRP V200R005C20SPC200"
+    assert provider.precompile(hw)
+    assert len(list(cache_path.glob("*/*.pickle"))) == 2
+
+    monkeypatch.delenv(RULEBOOK_CACHE_PATH_ENV)
+    with pytest.raises(ValueError):
+        DefaultRulebookProvider().precompile(hw)
+
+
+def test_key_depends_on_inherited_rulebooks(cache_path):
+    provider = DefaultRulebookProvider()
+    texts = {
+        "annet.rulebook.texts.huawei.rul": "%inherit_from=parents.huawei\ninterface *\n",
+        "parents.huawei.rul": "sysname *\n",
+    }
+
+    def get_raw_rulebook_text(rulebook_path, extension):
+        try:
+            return texts[f"{rulebook_path}.{extension}"]
+        except KeyError:
+            raise FileNotFoundError(rulebook_path) from None
+
+    hw = make_hw_stub("huawei")
+    with mock.patch.object(provider, "_get_raw_rulebook_text", side_effect=get_raw_rulebook_text):
+        assert provider._get_rulebook_sources(hw) == [
+            "annet.rulebook.texts.huawei.rul",
+            texts["annet.rulebook.texts.huawei.rul"],
+            "annet.rulebook.texts.huawei.order",
+            "",
+            "annet.rulebook.texts.huawei.deploy",
+            "",
+            "parents.huawei.rul",
+            texts["parents.huawei.rul"],
+        ]
+        key = provider._compiled_cache_key(hw)
+        texts["parents.huawei.rul"] = "sysname *\ninfo-center *\n"
+        assert provider._compiled_cache_key(hw) != key
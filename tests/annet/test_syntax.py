@@ -2,7 +2,7 @@ from collections import OrderedDict
 
 import pytest
 
-from annet.annlib.rbparser.syntax import compile_row_regexp, parse_text
+from annet.annlib.rbparser.syntax import compile_row_regexp, first_literal_token, parse_text
 
 
 @pytest.mark.parametrize(
@@ -237,3 +237,23 @@ def test_compile_row_regexp_capturing_groups() -> None:
     assert compile_row_regexp("~/(a|b)/ permit ~").groups == 2
     # the * that previously de-capturing-ized inner groups no longer affects ~/.../
     assert compile_row_regexp("*/x/ ~/(a|b)/ *").groups == 3
+
+
+@pytest.mark.parametrize(
+    "row, expected",
+    [
+        ("interface *", "interface"),
+        ("foo (bar|baz)", "foo"),
+        ("foo [a|b]", "foo"),
+        (r"foo \|", "foo"),
+        ("foo bar|baz", None),
+        ("foo (bar)|baz", None),
+        ("*/foo|bar/ baz", None),
+        ("~ ok", None),
+    ],
+)
+def test_first_literal_token(row, expected) -> None:
+    regexp = compile_row_regexp(row)
+    assert first_literal_token(regexp) == expected
+    if expected is None and "|" in row:
+        assert regexp.match("baz") or regexp.match("bar baz")